@@ -1,91 +1,69 @@
-import sys
-import hashlib
-import json
 import os
-import re
+import sys
+import time
+
+_IMPORT_STARTED = time.perf_counter()  # начало импорта для --profile-startup
+
 from PyQt6 import QtWidgets, QtGui, QtCore
 from PyQt6.QtWidgets import (
     QMainWindow, QApplication, QLabel, QLineEdit, QPushButton, QMessageBox,
     QGroupBox, QVBoxLayout, QHBoxLayout, QListWidget, QInputDialog, QWidget,
-    QDialog, QCheckBox, QSpinBox
+    QDialog, QCheckBox, QSpinBox, QListWidgetItem
 )
 from PyQt6.QtCore import Qt
 
-# Константы
-USER_DATA_FILE = 'users.json'
-ADMIN_USERNAME = 'admin'
-BG_COLOR = "#f0f0f0"
-BUTTON_COLOR = "#4CAF50"
-TEXT_COLOR = "#333333"
+from auth_service import (
+    ADMIN_USERNAME, STRICT_RULES, DEFAULT_RULES, LOGIN_SETUP,
+    AuthError, InvalidPasswordError, StoreCorruptError, AuthService, check_password_rules
+)
+from auth_pool import DEFAULT_STORE, store_path
+from auth_throttle import LoginThrottle
+from auth_audit import AUDIT_LOG_FILE, AuditLog
+from auth_metrics import StartupProfile, install_from_env, timer, wake_qt_on_signals
+import auth_trace
+import auth_watchdog
+from auth_style import APP_STYLESHEET
+from auth_trace import traced
+
+# Задержка перечитывания хранилища после уведомления об изменении файла, мс
+STORE_RELOAD_DELAY_MS = 100
 
 
 class PasswordRulesDialog(QDialog):
-    def __init__(self, username, current_rules=None, parent=None):
+    def __init__(self, username='', current_rules=None, parent=None):
         super().__init__(parent)
-        self.username = username
-        self.current_rules = current_rules or {
-            'min_length': 6,
-            'require_upper': False,
-            'require_lower': False,
-            'require_digit': False,
-            'require_special': False
-        }
-        self.setWindowTitle(f"Настройка правил пароля для {username}")
         self.setModal(True)
         self.setFixedSize(350, 250)
         self.init_ui()
+        self.reset(username, current_rules)
+
+    def reset(self, username, current_rules=None):
+        """Подготовить диалог к очередному открытию (экземпляр переиспользуется)"""
+        self.username = username
+        self.current_rules = current_rules or dict(DEFAULT_RULES)
+        self.setWindowTitle(f"Настройка правил пароля для {username}")
+        self.min_length_spin.setValue(self.current_rules['min_length'])
+        self.upper_check.setChecked(self.current_rules['require_upper'])
+        self.lower_check.setChecked(self.current_rules['require_lower'])
+        self.digit_check.setChecked(self.current_rules['require_digit'])
+        self.special_check.setChecked(self.current_rules['require_special'])
 
     def init_ui(self):
         layout = QVBoxLayout()
 
-        self.setStyleSheet(f"""
-            QDialog {{
-                background-color: {BG_COLOR};
-                font-size: 14px;
-            }}
-            QLabel {{
-                color: {TEXT_COLOR};
-                margin-bottom: 5px;
-            }}
-            QSpinBox {{
-                padding: 5px;
-                border: 1px solid #ddd;
-                border-radius: 4px;
-                margin-bottom: 10px;
-            }}
-            QCheckBox {{
-                margin-bottom: 10px;
-            }}
-            QPushButton {{
-                background-color: {BUTTON_COLOR};
-                color: white;
-                border: none;
-                padding: 8px 16px;
-                border-radius: 4px;
-            }}
-            QPushButton:hover {{
-                background-color: #45a049;
-            }}
-        """)
-
         # Минимальная длина
         self.min_length_label = QLabel("Минимальная длина пароля:")
         self.min_length_spin = QSpinBox()
         self.min_length_spin.setRange(4, 20)
-        self.min_length_spin.setValue(self.current_rules['min_length'])
 
         # Чекбоксы для правил
         self.upper_check = QCheckBox("Требовать заглавные буквы (A-Z)")
-        self.upper_check.setChecked(self.current_rules['require_upper'])
 
         self.lower_check = QCheckBox("Требовать строчные буквы (a-z)")
-        self.lower_check.setChecked(self.current_rules['require_lower'])
 
         self.digit_check = QCheckBox("Требовать цифры (0-9)")
-        self.digit_check.setChecked(self.current_rules['require_digit'])
 
         self.special_check = QCheckBox("Требовать спецсимволы (!@#$% и т.д.)")
-        self.special_check.setChecked(self.current_rules['require_special'])
 
         # Кнопки
         button_layout = QHBoxLayout()
@@ -119,55 +97,28 @@ class PasswordRulesDialog(QDialog):
 
 
 class PasswordSetupDialog(QDialog):
-    def __init__(self, username, password_rules=None, parent=None):
+    def __init__(self, username='', password_rules=None, parent=None):
         super().__init__(parent)
-        self.username = username
-        self.password_rules = password_rules or {
-            'min_length': 6,
-            'require_upper': False,
-            'require_lower': False,
-            'require_digit': False,
-            'require_special': False
-        }
-        self.setWindowTitle(f"Установка пароля для {username}")
         self.setModal(True)
         self.setFixedSize(350, 250)
         self.init_ui()
+        self.reset(username, password_rules)
+
+    def reset(self, username, password_rules=None):
+        """Подготовить диалог к очередному открытию (экземпляр переиспользуется)"""
+        self.username = username
+        self.password_rules = password_rules or dict(DEFAULT_RULES)
+        self.setWindowTitle(f"Установка пароля для {username}")
+        self.password_label.setText(f"Новый пароль:{self._get_rules_text()}")
+        self.password_input.clear()
+        self.confirm_input.clear()
+        self.password_input.setFocus()
 
     def init_ui(self):
         layout = QVBoxLayout()
 
-        # Стилизация
-        self.setStyleSheet(f"""
-            QDialog {{
-                background-color: {BG_COLOR};
-                font-size: 14px;
-            }}
-            QLabel {{
-                color: {TEXT_COLOR};
-                margin-bottom: 5px;
-            }}
-            QLineEdit {{
-                padding: 8px;
-                border: 1px solid #ddd;
-                border-radius: 4px;
-                margin-bottom: 15px;
-            }}
-            QPushButton {{
-                background-color: {BUTTON_COLOR};
-                color: white;
-                border: none;
-                padding: 8px 16px;
-                border-radius: 4px;
-            }}
-            QPushButton:hover {{
-                background-color: #45a049;
-            }}
-        """)
-
         # Поля для пароля
-        rules_text = self._get_rules_text()
-        self.password_label = QLabel(f"Новый пароль:{rules_text}")
+        self.password_label = QLabel()
         self.password_input = QLineEdit()
         self.password_input.setEchoMode(QLineEdit.EchoMode.Password)
         self.password_input.setPlaceholderText("Введите пароль")
@@ -217,6 +168,7 @@ class PasswordSetupDialog(QDialog):
             return " (требуется:" + ",".join(rules) + ")"
         return ""
 
+    @traced('validate_password')
     def validate_password(self):
         password = self.password_input.text()
         confirm = self.confirm_input.text()
@@ -229,64 +181,42 @@ class PasswordSetupDialog(QDialog):
             QMessageBox.warning(self, "Ошибка", "Пароли не совпадают!")
             return
 
-        # Проверка минимальной длины
-        if len(password) < self.password_rules['min_length']:
-            QMessageBox.warning(
-                self, 
-                "Ошибка", 
-                f"Пароль должен быть не менее {self.password_rules['min_length']} символов!"
-            )
-            return
-
-        # Проверка на заглавные буквы
-        if self.password_rules['require_upper'] and not re.search(r'[A-ZА-Я]', password):
-            QMessageBox.warning(
-                self,
-                "Ошибка",
-                "Пароль должен содержать хотя бы одну заглавную букву!"
-            )
-            return
-
-        # Проверка на строчные буквы
-        if self.password_rules['require_lower'] and not re.search(r'[a-zа-я]', password):
-            QMessageBox.warning(
-                self,
-                "Ошибка",
-                "Пароль должен содержать хотя бы одну строчную букву!"
-            )
-            return
-
-        # Проверка на цифры
-        if self.password_rules['require_digit'] and not re.search(r'[0-9]', password):
-            QMessageBox.warning(
-                self,
-                "Ошибка",
-                "Пароль должен содержать хотя бы одну цифру!"
-            )
-            return
-
-        # Проверка на спецсимволы
-        if self.password_rules['require_special'] and not re.search(r'[!@#$%^&*(),.?":{}|<>]', password):
-            QMessageBox.warning(
-                self,
-                "Ошибка",
-                "Пароль должен содержать хотя бы один спецсимвол!"
-            )
+        # Проверка пароля по правилам
+        error = check_password_rules(password, self.password_rules)
+        if error:
+            QMessageBox.warning(self, "Ошибка", error)
             return
 
         self.accept()
 
 
 class UserAuthApp(QMainWindow):
-    def __init__(self):
+    def __init__(self, startup_profile=None, store=DEFAULT_STORE):
         super().__init__()
-        self.login_attempts = 0
+        # Именованное хранилище отдела (auth_pool); default - users.json
+        self.store = store
+        self.store_file = store_path(store, create=True)
         self.current_user = None
-        self.setWindowTitle('Система аутентификации пользователей')
+        self.startup_profile = startup_profile
+        self.first_shown = False
+        # Диалоги создаются один раз и переиспользуются (см. pooled_dialog)
+        self.dialogs = {}
+        # Строки списка пользователей по именам (для обновления отдельных строк)
+        self.user_items = {}
+        self.store_watcher = None
+        # Попытки входа ограничиваются и после перезапуска программы: состояние
+        # сохраняется периодически, при начале блокировки и при выходе
+        self.throttle = LoginThrottle(self.store_file + '.throttle')
+        QApplication.instance().aboutToQuit.connect(self.throttle.snapshot)
+        self.audit = AuditLog(AUDIT_LOG_FILE)
+        self.auth = AuthService(
+            self.store_file, admin_rules=STRICT_RULES, default_rules=DEFAULT_RULES,
+            throttle=self.throttle, audit=self.audit, store=store
+        )
+        title = 'Система аутентификации пользователей'
+        self.setWindowTitle(title if store == DEFAULT_STORE else f'{title} - {store}')
         self.setGeometry(100, 100, 600, 500)
-        self.setStyleSheet(f"background-color: {BG_COLOR}; color: {TEXT_COLOR};")
         self.init_ui()
-        self.check_first_run()
 
     def init_ui(self):
         # Главный виджет и компоновка
@@ -297,73 +227,26 @@ class UserAuthApp(QMainWindow):
 
         # Окно входа
         self.login_group = QGroupBox('Вход в систему')
-        self.login_group.setStyleSheet("""
-            QGroupBox {
-                font-size: 16px;
-                font-weight: bold;
-                border: 1px solid #ccc;
-                border-radius: 5px;
-                margin-top: 10px;
-                padding-top: 15px;
-            }
-        """)
         self.login_layout = QVBoxLayout()
 
         # Поля ввода
-        input_style = """
-            QLineEdit {
-                padding: 8px;
-                border: 1px solid #ddd;
-                border-radius: 4px;
-                font-size: 14px;
-                margin-bottom: 15px;
-            }
-        """
-
         self.username_label = QLabel('Имя пользователя:')
         self.username_input = QLineEdit()
-        self.username_input.setStyleSheet(input_style)
         self.username_input.setPlaceholderText("Введите имя пользователя")
 
         self.password_label = QLabel('Пароль:')
         self.password_input = QLineEdit()
         self.password_input.setEchoMode(QLineEdit.EchoMode.Password)
-        self.password_input.setStyleSheet(input_style)
         self.password_input.setPlaceholderText("Введите пароль")
 
         # Кнопки входа
         buttons_layout = QHBoxLayout()
         self.login_button = QPushButton('Войти')
-        self.login_button.setStyleSheet(f"""
-            QPushButton {{
-                background-color: {BUTTON_COLOR};
-                color: white;
-                border: none;
-                padding: 8px 16px;
-                font-size: 14px;
-                border-radius: 4px;
-                min-width: 100px;
-            }}
-            QPushButton:hover {{
-                background-color: #45a049;
-            }}
-        """)
+        self.login_button.setProperty('role', 'main')
 
         self.exit_button = QPushButton('Выход')
-        self.exit_button.setStyleSheet("""
-            QPushButton {
-                background-color: #f44336;
-                color: white;
-                border: none;
-                padding: 8px 16px;
-                font-size: 14px;
-                border-radius: 4px;
-                min-width: 100px;
-            }
-            QPushButton:hover {
-                background-color: #d32f2f;
-            }
-        """)
+        self.exit_button.setProperty('role', 'main')
+        self.exit_button.setProperty('danger', True)
 
         buttons_layout.addWidget(self.login_button)
         buttons_layout.addWidget(self.exit_button)
@@ -377,13 +260,9 @@ class UserAuthApp(QMainWindow):
         self.login_group.setLayout(self.login_layout)
         self.layout.addWidget(self.login_group)
 
-        # Панель администратора
-        self.init_admin_panel()
-        self.admin_group.hide()
-
-        # Панель пользователя
-        self.init_user_panel()
-        self.user_group.hide()
+        # Панели администратора и пользователя создаются при первом показе
+        self.admin_group = None
+        self.user_group = None
 
         # Подключение сигналов
         self.login_button.clicked.connect(self.login)
@@ -391,28 +270,10 @@ class UserAuthApp(QMainWindow):
 
     def init_admin_panel(self):
         self.admin_group = QGroupBox('Панель администратора')
-        self.admin_group.setStyleSheet("""
-            QGroupBox {
-                font-size: 16px;
-                font-weight: bold;
-                border: 1px solid #ccc;
-                border-radius: 5px;
-                margin-top: 10px;
-                padding-top: 15px;
-            }
-        """)
         self.admin_layout = QVBoxLayout()
 
         # Список пользователей
         self.user_list = QListWidget()
-        self.user_list.setStyleSheet("""
-            QListWidget {
-                border: 1px solid #ddd;
-                border-radius: 4px;
-                font-size: 14px;
-                min-height: 150px;
-            }
-        """)
 
         # Кнопки администратора
         self.change_admin_pass_button = QPushButton('Сменить пароль администратора')
@@ -431,29 +292,8 @@ class UserAuthApp(QMainWindow):
             self.password_rules_button,
             self.admin_exit_button
         ]:
-            button.setStyleSheet(f"""
-                QPushButton {{
-                    background-color: {BUTTON_COLOR};
-                    color: white;
-                    border: none;
-                    padding: 8px;
-                    font-size: 14px;
-                    border-radius: 4px;
-                    margin-bottom: 10px;
-                }}
-                QPushButton:hover {{
-                    background-color: #45a049;
-                }}
-            """)
-
-        self.admin_exit_button.setStyleSheet("""
-            QPushButton {
-                background-color: #f44336;
-            }
-            QPushButton:hover {
-                background-color: #d32f2f;
-            }
-        """)
+            button.setProperty('role', 'panel')
+        self.admin_exit_button.setProperty('danger', True)
 
         self.admin_layout.addWidget(self.user_list)
         self.admin_layout.addWidget(self.change_admin_pass_button)
@@ -476,45 +316,15 @@ class UserAuthApp(QMainWindow):
 
     def init_user_panel(self):
         self.user_group = QGroupBox('Панель пользователя')
-        self.user_group.setStyleSheet("""
-            QGroupBox {
-                font-size: 16px;
-                font-weight: bold;
-                border: 1px solid #ccc;
-                border-radius: 5px;
-                margin-top: 10px;
-                padding-top: 15px;
-            }
-        """)
         self.user_layout = QVBoxLayout()
 
         self.change_pass_button = QPushButton('Сменить пароль')
         self.user_exit_button = QPushButton('Завершить работу')
 
         # Стилизация кнопок
-        self.change_pass_button.setStyleSheet(f"""
-            QPushButton {{
-                background-color: {BUTTON_COLOR};
-                color: white;
-                border: none;
-                padding: 8px;
-                font-size: 14px;
-                border-radius: 4px;
-                margin-bottom: 10px;
-            }}
-            QPushButton:hover {{
-                background-color: #45a049;
-            }}
-        """)
-
-        self.user_exit_button.setStyleSheet("""
-            QPushButton {
-                background-color: #f44336;
-            }
-            QPushButton:hover {
-                background-color: #d32f2f;
-            }
-        """)
+        self.change_pass_button.setProperty('role', 'panel')
+        self.user_exit_button.setProperty('role', 'panel')
+        self.user_exit_button.setProperty('danger', True)
 
         self.user_layout.addWidget(self.change_pass_button)
         self.user_layout.addWidget(self.user_exit_button)
@@ -526,156 +336,188 @@ class UserAuthApp(QMainWindow):
         self.change_pass_button.clicked.connect(self.change_user_password)
         self.user_exit_button.clicked.connect(self.close)
 
+    def show_admin_panel(self):
+        if self.admin_group is None:
+            self.init_admin_panel()
+        self.update_user_list()
+        self.admin_group.show()
+
+    def show_user_panel(self):
+        if self.user_group is None:
+            self.init_user_panel()
+        self.user_group.show()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if not self.first_shown:
+            self.first_shown = True
+            # Хранилище читается после первой отрисовки окна
+            QtCore.QTimer.singleShot(0, self.after_first_show)
+
+    def after_first_show(self):
+        if self.startup_profile is not None:
+            self.startup_profile.mark('first_show')
+            self.load_users()
+            self.startup_profile.mark('store_load')
+            self.startup_profile.report()
+            QApplication.quit()
+            return
+        self.check_first_run()
+
     def check_first_run(self):
-        users = self.load_users()
-        if ADMIN_USERNAME not in users or users[ADMIN_USERNAME]['password'] == '':
+        try:
+            self.load_users()
+        except StoreCorruptError as error:
+            # Поверх испорченного файла нельзя записывать хранилище по умолчанию
+            QMessageBox.critical(self, 'Ошибка', f'{error}\nВосстановите хранилище из резервной копии.')
+            QApplication.quit()
+            return
+        self.watch_store()
+        if self.auth.needs_admin_password():
             self.set_admin_password()
 
     def set_admin_password(self):
-        dialog = PasswordSetupDialog(ADMIN_USERNAME, {
-            'min_length': 8,
-            'require_upper': True,
-            'require_lower': True,
-            'require_digit': True,
-            'require_special': True
-        })
+        dialog = self.pooled_dialog(PasswordSetupDialog, ADMIN_USERNAME, dict(self.auth.admin_setup_rules))
         if dialog.exec() == QDialog.DialogCode.Accepted:
             password = dialog.password_input.text()
-            users = self.load_users()
-            users[ADMIN_USERNAME] = {
-                'password': self.hash_password(password),
-                'admin': True,
-                'blocked': False,
-                'password_rules': {
-                    'min_length': 8,
-                    'require_upper': True,
-                    'require_lower': True,
-                    'require_digit': True,
-                    'require_special': True
-                }
-            }
-            self.save_users(users)
+            self.load_users()
+            self.auth.set_admin_password(password)
+            self.save_users()
             QMessageBox.information(self, 'Успех', 'Пароль администратора установлен!')
         else:
             QMessageBox.critical(self, 'Ошибка', 'Пароль администратора обязателен!')
-            sys.exit()
+            QApplication.quit()
+
+    def pooled_dialog(self, dialog_class, username, rules):
+        """Диалог из пула: создается при первом открытии, дальше только сбрасывается"""
+        dialog = self.dialogs.get(dialog_class)
+        if dialog is None:
+            dialog = self.dialogs[dialog_class] = dialog_class(parent=self)
+        dialog.reset(username, rules)
+        return dialog
 
     def load_users(self):
-        if not os.path.exists(USER_DATA_FILE):
-            return {
-                ADMIN_USERNAME: {
-                    'password': '',
-                    'admin': True,
-                    'blocked': False,
-                    'password_rules': {
-                        'min_length': 8,
-                        'require_upper': True,
-                        'require_lower': True,
-                        'require_digit': True,
-                        'require_special': True
-                    }
-                }
-            }
-        try:
-            with open(USER_DATA_FILE, 'r') as file:
-                users = json.load(file)
-                # Для совместимости со старой версией
-                for user_data in users.values():
-                    if isinstance(user_data.get('password_rules'), bool):
-                        user_data['password_rules'] = {
-                            'min_length': 6 if user_data['password_rules'] else 0,
-                            'require_upper': False,
-                            'require_lower': False,
-                            'require_digit': False,
-                            'require_special': False
-                        }
-                return users
-        except:
-            return {
-                ADMIN_USERNAME: {
-                    'password': '',
-                    'admin': True,
-                    'blocked': False,
-                    'password_rules': {
-                        'min_length': 8,
-                        'require_upper': True,
-                        'require_lower': True,
-                        'require_digit': True,
-                        'require_special': True
-                    }
-                }
-            }
-
-    def save_users(self, users):
-        with open(USER_DATA_FILE, 'w') as file:
-            json.dump(users, file, indent=4)
-
-    def hash_password(self, password):
-        return hashlib.sha256(password.encode()).hexdigest()
+        # Перечитываются только записи, измененные другими экземплярами программы
+        added, changed, removed = self.auth.refresh()
+        if self.admin_group is not None and (added or changed or removed):
+            self.update_user_rows(added + changed, removed)
+        return self.auth.users
+
+    def watch_store(self):
+        """Следить за файлом хранилища, которым пользуются другие рабочие места"""
+        self.store_watcher = QtCore.QFileSystemWatcher(self)
+        # Каталог тоже отслеживается: save_users заменяет файл новым,
+        # и наблюдение за прежним файлом прекращается
+        self.store_watcher.addPath(os.path.dirname(os.path.abspath(self.store_file)))
+        if os.path.exists(self.store_file):
+            self.store_watcher.addPath(self.store_file)
+        # Серия уведомлений об одной записи файла дает одно перечитывание
+        self.store_reload_timer = QtCore.QTimer(self)
+        self.store_reload_timer.setSingleShot(True)
+        self.store_reload_timer.setInterval(STORE_RELOAD_DELAY_MS)
+        self.store_reload_timer.timeout.connect(self.apply_store_changes)
+        self.store_watcher.fileChanged.connect(lambda path: self.store_reload_timer.start())
+        self.store_watcher.directoryChanged.connect(lambda path: self.store_reload_timer.start())
+
+    def apply_store_changes(self):
+        if os.path.exists(self.store_file) and self.store_file not in self.store_watcher.files():
+            self.store_watcher.addPath(self.store_file)
+        with timer('store_refresh'):
+            self.load_users()
+
+    def save_users(self):
+        conflicts = self.auth.commit()
+        if conflicts:
+            # Другой экземпляр программы изменил те же поля тех же записей
+            names = ', '.join(sorted(conflicts))
+            QMessageBox.warning(
+                self, 'Внимание',
+                f'Записи ({names}) одновременно изменены на другом рабочем месте. Сохранены ваши значения.'
+            )
+
+    def user_item_text(self, username, data):
+        status = " (заблокирован)" if data['blocked'] else ""
+        rules = " (правила пароля)" if data.get('password_rules') else ""
+        return f"{username}{status}{rules}"
 
     def update_user_list(self):
-        users = self.load_users()
-        self.user_list.clear()
-        for username, data in users.items():
-            if username != ADMIN_USERNAME:
-                status = " (заблокирован)" if data['blocked'] else ""
-                rules = " (правила пароля)" if data.get('password_rules') else ""
-                self.user_list.addItem(f"{username}{status}{rules}")
+        with timer('update_user_list'):
+            self.user_list.clear()
+            self.user_items = {}
+            for username, data in self.auth.list_users():
+                self.user_items[username] = QListWidgetItem(self.user_item_text(username, data), self.user_list)
+
+    def update_user_rows(self, updated, removed):
+        """Обновить в списке только строки изменившихся пользователей"""
+        for username in removed:
+            item = self.user_items.pop(username, None)
+            if item is not None:
+                self.user_list.takeItem(self.user_list.row(item))
+        for username in updated:
+            if username == ADMIN_USERNAME:
+                continue
+            text = self.user_item_text(username, self.auth.get_user(username))
+            item = self.user_items.get(username)
+            if item is None:
+                self.user_items[username] = QListWidgetItem(text, self.user_list)
+            else:
+                item.setText(text)
+
+    def ask_new_password(self, username):
+        """Диалог установки пароля; возвращает пароль или None при отмене"""
+        with timer('dialog_open'):
+            dialog = self.pooled_dialog(
+                PasswordSetupDialog, username, self.auth.get_user(username).get('password_rules', {})
+            )
+        if dialog.exec() == QDialog.DialogCode.Accepted:
+            return dialog.password_input.text()
+        return None
 
+    @traced('login')
     def login(self):
         username = self.username_input.text()
         password = self.password_input.text()
-        users = self.load_users()
+        # Файл перечитывается, только если его изменили другие экземпляры программы
+        self.load_users()
 
-        if not username:
-            QMessageBox.warning(self, 'Ошибка', 'Введите имя пользователя!')
-            return
-
-        if username not in users:
-            QMessageBox.warning(self, 'Ошибка', 'Пользователь не найден!')
+        try:
+            status = self.auth.login(username, password)
+        except InvalidPasswordError:
+            remaining = self.auth.remaining_attempts(username)
+            if remaining:
+                QMessageBox.warning(self, 'Ошибка', f'Неверный пароль! Осталось попыток: {remaining}')
+            else:
+                QMessageBox.warning(self, 'Ошибка', 'Неверный пароль! Следующая попытка будет доступна позже.')
             return
-
-        if users[username]['blocked']:
-            QMessageBox.warning(self, 'Ошибка', 'Ваш аккаунт заблокирован!')
+        except AuthError as error:
+            QMessageBox.warning(self, 'Ошибка', str(error))
             return
 
         # Если пароль не задан (новый пользователь)
-        if users[username]['password'] == '':
-            dialog = PasswordSetupDialog(
-                username,
-                users[username].get('password_rules', {})
-            )
-            if dialog.exec() == QDialog.DialogCode.Accepted:
-                new_password = dialog.password_input.text()
-                users[username]['password'] = self.hash_password(new_password)
-                self.save_users(users)
+        if status == LOGIN_SETUP:
+            new_password = self.ask_new_password(username)
+            if new_password is not None:
+                self.auth.set_password(username, new_password)
+                self.save_users()
                 QMessageBox.information(self, 'Успех', 'Пароль успешно установлен!')
                 self.current_user = username
+                self.auth.actor = username
                 self.login_group.hide()
-                self.user_group.show()
+                self.show_user_panel()
             return
 
-        if users[username]['password'] == self.hash_password(password):
-            self.current_user = username
-            self.login_group.hide()
-
-            if username == ADMIN_USERNAME:
-                self.update_user_list()
-                self.admin_group.show()
-            else:
-                self.user_group.show()
+        self.current_user = username
+        self.auth.actor = username
+        self.login_group.hide()
 
-            self.login_attempts = 0
+        if username == ADMIN_USERNAME:
+            self.show_admin_panel()
         else:
-            self.login_attempts += 1
-            if self.login_attempts >= 3:
-                QMessageBox.critical(self, 'Ошибка', 'Превышено количество попыток входа. Программа завершает работу.')
-                self.close()
-            else:
-                QMessageBox.warning(self, 'Ошибка', f'Неверный пароль! Осталось попыток: {3 - self.login_attempts}')
+            self.show_user_panel()
 
+    @traced('change_admin_password')
     def change_admin_password(self):
-        users = self.load_users()
+        self.load_users()
         old_password, ok = QInputDialog.getText(
             self,
             'Смена пароля администратора',
@@ -683,16 +525,16 @@ class UserAuthApp(QMainWindow):
             QLineEdit.EchoMode.Password
         )
 
-        if ok and users[ADMIN_USERNAME]['password'] == self.hash_password(old_password):
-            dialog = PasswordSetupDialog(ADMIN_USERNAME, users[ADMIN_USERNAME]['password_rules'])
-            if dialog.exec() == QDialog.DialogCode.Accepted:
-                new_password = dialog.password_input.text()
-                users[ADMIN_USERNAME]['password'] = self.hash_password(new_password)
-                self.save_users(users)
+        if ok and self.auth.verify_password(ADMIN_USERNAME, old_password):
+            new_password = self.ask_new_password(ADMIN_USERNAME)
+            if new_password is not None:
+                self.auth.set_password(ADMIN_USERNAME, new_password)
+                self.save_users()
                 QMessageBox.information(self, 'Успех', 'Пароль администратора изменен!')
         else:
             QMessageBox.warning(self, 'Ошибка', 'Неверный старый пароль!')
 
+    @traced('add_user')
     def add_user(self):
         username, ok = QInputDialog.getText(
             self,
@@ -701,78 +543,66 @@ class UserAuthApp(QMainWindow):
         )
 
         if ok and username:
-            if not username.strip():
-                QMessageBox.warning(self, 'Ошибка', 'Имя пользователя не может быть пустым!')
+            self.load_users()
+            try:
+                self.auth.add_user(username)
+            except AuthError as error:
+                QMessageBox.warning(self, 'Ошибка', str(error))
                 return
+            self.save_users()
+            self.update_user_list()
+            QMessageBox.information(self, 'Успех', f'Пользователь {username} добавлен с пустым паролем!')
 
-            users = self.load_users()
-            if username in users:
-                QMessageBox.warning(self, 'Ошибка', 'Пользователь уже существует!')
-            else:
-                users[username] = {
-                    'password': '',
-                    'admin': False,
-                    'blocked': False,
-                    'password_rules': {
-                        'min_length': 0,
-                        'require_upper': False,
-                        'require_lower': False,
-                        'require_digit': False,
-                        'require_special': False
-                    }
-                }
-                self.save_users(users)
-                self.update_user_list()
-                QMessageBox.information(self, 'Успех', f'Пользователь {username} добавлен с пустым паролем!')
-
-    def toggle_user_block(self, block):
+    def selected_username(self):
         selected_items = self.user_list.selectedItems()
         if not selected_items:
             QMessageBox.warning(self, 'Ошибка', 'Выберите пользователя!')
-            return
+            return None
+        return selected_items[0].text().split()[0]
 
-        username = selected_items[0].text().split()[0]
-        users = self.load_users()
+    @traced('toggle_user_block')
+    def toggle_user_block(self, block):
+        username = self.selected_username()
+        if username is None:
+            return
 
-        if username in users:
-            users[username]['blocked'] = block
-            self.save_users(users)
+        self.load_users()
+        if self.auth.has_user(username):
+            self.auth.set_blocked(username, block)
+            self.save_users()
             self.update_user_list()
             status = 'заблокирован' if block else 'разблокирован'
             QMessageBox.information(self, 'Успех', f'Пользователь {username} {status}!')
 
+    @traced('configure_password_rules')
     def configure_password_rules(self):
-        selected_items = self.user_list.selectedItems()
-        if not selected_items:
-            QMessageBox.warning(self, 'Ошибка', 'Выберите пользователя!')
+        username = self.selected_username()
+        if username is None:
             return
 
-        username = selected_items[0].text().split()[0]
-        users = self.load_users()
-
-        if username in users:
-            dialog = PasswordRulesDialog(username, users[username].get('password_rules', {}))
+        self.load_users()
+        if self.auth.has_user(username):
+            with timer('rules_dialog_open'):
+                dialog = self.pooled_dialog(
+                    PasswordRulesDialog, username, self.auth.get_user(username).get('password_rules', {})
+                )
             if dialog.exec() == QDialog.DialogCode.Accepted:
-                new_rules = dialog.get_rules()
-                users[username]['password_rules'] = new_rules
-                self.save_users(users)
+                self.auth.set_rules(username, dialog.get_rules())
+                self.save_users()
                 self.update_user_list()
                 QMessageBox.information(self, 'Успех', f'Правила пароля для {username} обновлены!')
 
+    @traced('change_user_password')
     def change_user_password(self):
-        users = self.load_users()
+        self.load_users()
         username = self.current_user
 
         # Для новых пользователей (без пароля)
-        if users[username]['password'] == '':
-            dialog = PasswordSetupDialog(
-                username,
-                users[username].get('password_rules', {})
-            )
-            if dialog.exec() == QDialog.DialogCode.Accepted:
-                new_password = dialog.password_input.text()
-                users[username]['password'] = self.hash_password(new_password)
-                self.save_users(users)
+        if self.auth.get_user(username)['password'] == '':
+            new_password = self.ask_new_password(username)
+            if new_password is not None:
+                self.auth.set_password(username, new_password)
+                self.save_users()
                 QMessageBox.information(self, 'Успех', 'Пароль успешно установлен!')
             return
 
@@ -786,24 +616,49 @@ class UserAuthApp(QMainWindow):
         if not ok:
             return
 
-        if users[username]['password'] != self.hash_password(old_password):
+        if not self.auth.verify_password(username, old_password):
             QMessageBox.warning(self, 'Ошибка', 'Неверный старый пароль!')
             return
 
-        dialog = PasswordSetupDialog(
-            username,
-            users[username].get('password_rules', {})
-        )
-        if dialog.exec() == QDialog.DialogCode.Accepted:
-            new_password = dialog.password_input.text()
-            users[username]['password'] = self.hash_password(new_password)
-            self.save_users(users)
+        new_password = self.ask_new_password(username)
+        if new_password is not None:
+            self.auth.set_password(username, new_password)
+            self.save_users()
             QMessageBox.information(self, 'Успех', 'Пароль успешно изменен!')
 
 
 if __name__ == '__main__':
+    startup_profile = None
+    if '--profile-startup' in sys.argv:
+        # Отчет о времени импорта, создания и первого показа окна
+        sys.argv.remove('--profile-startup')
+        startup_profile = StartupProfile(_IMPORT_STARTED)
+        startup_profile.mark('imports')
+    store = DEFAULT_STORE
+    if '--store' in sys.argv[:-1]:
+        # Хранилище отдела: python a.py --store sales
+        position = sys.argv.index('--store')
+        store = sys.argv[position + 1]
+        del sys.argv[position:position + 2]
+        try:
+            store_path(store)
+        except ValueError as error:
+            print(error, file=sys.stderr)
+            sys.exit(2)
+    metrics_prefix = install_from_env()
+    auth_trace.install_from_env()
     app = QApplication(sys.argv)
+    if metrics_prefix:
+        # Иначе SIGUSR1 обработается только после следующего события Qt
+        wake_qt_on_signals(app)
     app.setStyle("Fusion")
-    window = UserAuthApp()
+    # Таблица стилей разбирается один раз для всего приложения
+    app.setStyleSheet(APP_STYLESHEET)
+    auth_watchdog.install_from_env(app)
+    if startup_profile is not None:
+        startup_profile.mark('qapplication')
+    window = UserAuthApp(startup_profile, store)
+    if startup_profile is not None:
+        startup_profile.mark('construction')
     window.show()
     sys.exit(app.exec())
@@ -0,0 +1,149 @@
+"""
+Анализ журнала аудита (auth_audit): неудачные входы по пользователям и часам,
+самые атакуемые учетные записи, частота блокировок ограничителем
+
+События читаются потоком через цепочку генераторов, в памяти остаются
+только счетчики (их размер зависит от числа пользователей и часов,
+а не от числа событий). Независимые сегменты журнала, включая сжатые,
+обрабатываются параллельно в пуле процессов.
+"""
+
+import gzip
+import json
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from auth_audit import segment_paths
+
+HOUR = 3600
+
+
+def read_lines(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8', errors='replace') as file:
+        yield from file
+
+
+def parse_events(lines):
+    """Строки -> события; испорченные строки (например, оборванная последняя) пропускаются"""
+    for line in lines:
+        try:
+            event = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(event, dict) and 'event' in event and 'ts' in event:
+            yield event
+
+
+def in_window(events, since=None, until=None):
+    for event in events:
+        if since is not None and event['ts'] < since:
+            continue
+        if until is not None and event['ts'] >= until:
+            continue
+        yield event
+
+
+def empty_stats():
+    return {
+        'failures_by_hour': Counter(),   # (пользователь, начало часа) -> неудачные попытки
+        'failures': Counter(),           # пользователь -> неудачные попытки
+        'lockouts': Counter(),           # пользователь -> блокировки ограничителем
+        'reasons': Counter(),            # причина отказа -> количество
+        'totals': Counter()              # событие -> количество
+    }
+
+
+def analyze_segment(path, since=None, until=None):
+    """Счетчики по одному сегменту журнала (выполняется в отдельном процессе)"""
+    stats = empty_stats()
+    failures_by_hour = stats['failures_by_hour']
+    failures = stats['failures']
+    lockouts = stats['lockouts']
+    reasons = stats['reasons']
+    totals = stats['totals']
+    for event in in_window(parse_events(read_lines(path)), since, until):
+        kind = event['event']
+        totals[kind] += 1
+        user = event.get('user') or ''
+        if event.get('store'):
+            # Одинаковые имена в разных хранилищах - разные учетные записи
+            user = f"{event['store']}/{user}"
+        if kind == 'login_failed':
+            failures[user] += 1
+            failures_by_hour[user, int(event['ts']) // HOUR * HOUR] += 1
+            reasons[event.get('reason', 'unknown')] += 1
+        elif kind == 'lockout':
+            lockouts[user] += 1
+    return stats
+
+
+def merge(results):
+    merged = None
+    for result in results:
+        if merged is None:
+            merged = result
+            continue
+        for key, counter in result.items():
+            merged[key].update(counter)
+    return merged if merged is not None else empty_stats()
+
+
+def analyze(log_path, since=None, until=None, workers=None):
+    """Сводка по всем сегментам журнала"""
+    segments = segment_paths(log_path)
+    if workers == 1 or len(segments) <= 1:
+        results = (analyze_segment(path, since, until) for path in segments)
+        return merge(results), segments
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(
+            analyze_segment, segments, [since] * len(segments), [until] * len(segments)
+        )
+        return merge(results), segments
+
+
+def build_report(stats, top=10):
+    totals = stats['totals']
+    attempts = totals['login_ok'] + totals['login_failed'] + totals['lockout']
+    failed = totals['login_failed'] + totals['lockout']
+    return {
+        'attempts': attempts,
+        'successful': totals['login_ok'],
+        'failed': totals['login_failed'],
+        'lockouts': totals['lockout'],
+        'failure_rate': round(failed / attempts, 4) if attempts else 0.0,
+        # Доля неудачных попыток, которые закончились блокировкой
+        'lockout_rate': round(totals['lockout'] / failed, 4) if failed else 0.0,
+        'reasons': dict(stats['reasons']),
+        'top_targeted': stats['failures'].most_common(top),
+        'top_locked_out': stats['lockouts'].most_common(top),
+        'top_failures_per_hour': [
+            (user, hour, count) for (user, hour), count in stats['failures_by_hour'].most_common(top)
+        ],
+        'events': dict(totals)
+    }
+
+
+def format_report(report):
+    lines = [
+        f"Попыток входа: {report['attempts']} (успешных {report['successful']}, "
+        f"неудачных {report['failed']}, блокировок {report['lockouts']})",
+        f"Доля неудачных: {report['failure_rate']:.2%}, доля блокировок среди неудачных: {report['lockout_rate']:.2%}",
+        'Причины отказов: ' + (', '.join(f'{k}={v}' for k, v in sorted(report['reasons'].items())) or 'нет'),
+        '',
+        'Самые атакуемые учетные записи:'
+    ]
+    lines += [f'    {user or "<пусто>"}: {count}' for user, count in report['top_targeted']]
+    lines += ['', 'Больше всего блокировок:']
+    lines += [f'    {user or "<пусто>"}: {count}' for user, count in report['top_locked_out']]
+    lines += ['', 'Пики неудачных попыток (пользователь, час):']
+    lines += [
+        f"    {user or '<пусто>'} {time.strftime('%Y-%m-%d %H:00', time.localtime(hour))}: {count}"
+        for user, hour, count in report['top_failures_per_hour']
+    ]
+    return '\n'.join(lines)
+
+
+def report_json(report):
+    return json.dumps(report, ensure_ascii=False, indent=4)
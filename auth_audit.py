@@ -0,0 +1,204 @@
+"""
+Журнал аудита событий аутентификации (JSON Lines)
+Вызывающий код только кладет событие в ограниченную очередь;
+сериализацию, запись пачками с fsync, ротацию и сжатие старых
+сегментов выполняет фоновый поток.
+
+В один файл могут писать несколько процессов (экземпляры программы, сервер,
+auth_cli): запись пачки и ротация выполняются под блокировкой ФАЙЛ.lock, а
+процесс, у которого файл сменили ротацией, перед записью открывает новый.
+Где блокировки файлов нет (Windows), у файла журнала должен быть один писатель.
+
+Формат строки: {"ts": 1760000000.123, "event": "login_failed", "user": "ivan", ...}
+События: login_ok, login_failed (reason), lockout, password_set,
+admin_password_set, user_added, user_blocked, user_unblocked,
+admin_granted, admin_revoked, rules_changed, audit_dropped (count),
+store_corrupt (records).
+Если хранилище именованное (auth_pool), у события есть поле store.
+События изменения записей (password_set ... rules_changed) AuthService передает
+в журнал только после сохранения хранилища (commit), время события - время сохранения.
+"""
+
+import atexit
+import contextlib
+import gzip
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+AUDIT_LOG_FILE = 'auth_audit.jsonl'
+MAX_SEGMENT_BYTES = 16 * 1024 * 1024   # ротация по размеру
+MAX_SEGMENT_AGE = 24 * 60 * 60         # ротация по времени, секунды
+QUEUE_SIZE = 10000
+BATCH_SIZE = 512
+FLUSH_INTERVAL = 0.5                   # максимальная задержка записи, секунды
+
+_STOP = object()
+
+
+def _segment_order(name):
+    # имя.ГГГГММДД-ЧЧММСС[-N][.gz] -> ('ГГГГММДД-ЧЧММСС', N)
+    stamp = name.rsplit('.', 2)[-2] if name.endswith('.gz') else name.rsplit('.', 1)[-1]
+    date, _, rest = stamp.partition('-')
+    clock, _, suffix = rest.partition('-')
+    return date + clock, int(suffix) if suffix.isdigit() else 0
+
+
+def segment_paths(path):
+    """Файлы журнала: сегменты в порядке ротации (сжатые и нет), затем текущий"""
+    directory = os.path.dirname(path) or '.'
+    prefix = os.path.basename(path) + '.'
+    rotated = sorted(
+        (
+            os.path.join(directory, name) for name in os.listdir(directory)
+            if name.startswith(prefix) and not name.endswith('.lock')
+        ),
+        key=_segment_order
+    )
+    if os.path.exists(path):
+        rotated.append(path)
+    return rotated
+
+
+class AuditLog:
+    def __init__(self, path=AUDIT_LOG_FILE, max_bytes=MAX_SEGMENT_BYTES, max_age=MAX_SEGMENT_AGE,
+                 queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL, compress=True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.compress = compress
+        self.queue = queue.Queue(queue_size)
+        self.dropped = 0
+        self.file = None
+        self.lock_file = None
+        self.opened_at = 0.0
+        self.thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def log(self, event, **fields):
+        """Поставить событие в очередь; при переполнении событие отбрасывается и учитывается"""
+        try:
+            self.queue.put_nowait((time.time(), event, fields))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(_STOP)
+            self.thread.join()
+
+    # Фоновый поток
+
+    def _open(self):
+        self.file = open(self.path, 'ab')
+        self.opened_at = time.time()
+        if self.file.tell():
+            # Возраст продолжаемого сегмента считается от его первой записи
+            with open(self.path, 'rb') as existing:
+                try:
+                    self.opened_at = float(json.loads(existing.readline())['ts'])
+                except (ValueError, KeyError, TypeError):
+                    pass
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Блокировка журнала между процессами на время записи пачки и ротации"""
+        if fcntl is None:
+            yield
+            return
+        if self.lock_file is None:
+            self.lock_file = open(self.path + '.lock', 'a')
+        fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+
+    def _reopen_if_rotated(self):
+        """Другой процесс переименовал файл при ротации - дописывать нужно в новый"""
+        try:
+            current = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            current = None
+        if current != os.fstat(self.file.fileno()).st_ino:
+            self.file.close()
+            self._open()
+
+    def _run(self):
+        with self._locked():
+            self._open()
+        stopping = False
+        while not stopping:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = []
+            # Забираем все, что накопилось, но не больше пачки
+            while item is not None:
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    item = None
+            self._write(batch)
+        self.file.close()
+        if self.lock_file is not None:
+            self.lock_file.close()
+
+    def _write(self, batch):
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            batch.append((time.time(), 'audit_dropped', {'count': dropped}))
+        if not batch:
+            return
+        lines = []
+        for timestamp, event, fields in batch:
+            record = {'ts': round(timestamp, 3), 'event': event}
+            record.update(fields)
+            lines.append(json.dumps(record, ensure_ascii=False))
+        data = ('\n'.join(lines) + '\n').encode()
+        rotated = None
+        with self._locked():
+            self._reopen_if_rotated()
+            self.file.write(data)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            # Размер файла, а не позиция: в него дописывают и другие процессы
+            size = os.fstat(self.file.fileno()).st_size
+            if size >= self.max_bytes or time.time() - self.opened_at >= self.max_age:
+                rotated = self._rotate()
+        if rotated is not None and self.compress:
+            # Переименованный сегмент больше никто не дописывает - сжатие без блокировки
+            with open(rotated, 'rb') as source, gzip.open(rotated + '.gz', 'wb') as target:
+                shutil.copyfileobj(source, target)
+            os.remove(rotated)
+
+    def _rotate(self):
+        """Переименовать текущий файл в сегмент и начать новый; возвращает имя сегмента"""
+        self.file.close()
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        rotated = f'{self.path}.{stamp}'
+        suffix = 0
+        while os.path.exists(rotated) or os.path.exists(rotated + '.gz'):
+            suffix += 1
+            rotated = f'{self.path}.{stamp}-{suffix}'
+        os.replace(self.path, rotated)
+        self._open()
+        return rotated
@@ -0,0 +1,178 @@
+"""
+Резервные копии хранилища: базовый снимок и разностные копии по записям
+
+Каталог копий (по умолчанию ФАЙЛ.backups):
+    manifest.jsonl              по строке на копию: номер, время, вид, файлы, число изменений
+    000001-base.jsonl.gz        все записи
+    000001-base.hashes.gz       хеши содержимого этих записей
+    000002-delta.jsonl.gz       только измененные и удаленные записи
+    000002-delta.hashes.gz      хеши только этих записей
+
+Строки файлов копий: ["put", имя, запись] или ["del", имя]; строки файлов
+хешей: [имя, хеш] или [имя, null] для удаленной записи. Изменение записи
+определяется по хешу ее содержимого; хеши на момент последней копии
+собираются из файлов хешей базового снимка и разностных копий после него.
+Поэтому копия записывает объем, пропорциональный числу изменившихся записей,
+а не размеру хранилища. Когда
+с последнего базового снимка изменилось больше REBASE_RATIO записей,
+следующая копия снова делается базовым снимком.
+
+Восстановление на момент времени: последний базовый снимок не позже этого
+момента и все разностные копии после него по порядку.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import time
+
+import auth_storage
+
+MANIFEST = 'manifest.jsonl'
+REBASE_RATIO = 0.5
+
+
+def content_hash(user_data):
+    return hashlib.blake2b(json.dumps(user_data, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+
+def default_directory(path):
+    return path + '.backups'
+
+
+class BackupSet:
+    def __init__(self, directory, rebase_ratio=REBASE_RATIO):
+        self.directory = directory
+        self.rebase_ratio = rebase_ratio
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def entries(self):
+        """Записи журнала копий по порядку"""
+        try:
+            with open(self._path(MANIFEST), 'r', encoding='utf-8') as file:
+                return [json.loads(line) for line in file if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    @staticmethod
+    def _since_base(entries):
+        """Последний базовый снимок и копии после него"""
+        for position in range(len(entries) - 1, -1, -1):
+            if entries[position]['kind'] == 'base':
+                return entries[position:]
+        return []
+
+    def _hashes(self, entry):
+        """Пары (имя, хеш или None) копии entry"""
+        if 'hashes' in entry:
+            with gzip.open(self._path(entry['hashes']), 'rt', encoding='utf-8') as file:
+                for line in file:
+                    yield tuple(json.loads(line))
+            return
+        # Копия без файла хешей - хеши считаются по самим записям
+        with gzip.open(self._path(entry['file']), 'rt', encoding='utf-8') as file:
+            for line in file:
+                operation = json.loads(line)
+                yield operation[1], content_hash(operation[2]) if operation[0] == 'put' else None
+
+    def _load_state(self, entries):
+        """Хеши записей на момент последней копии; пустое состояние - нужен базовый снимок"""
+        hashes = {}
+        try:
+            for entry in self._since_base(entries):
+                for username, digest in self._hashes(entry):
+                    if digest is None:
+                        hashes.pop(username, None)
+                    else:
+                        hashes[username] = digest
+        except (OSError, ValueError, EOFError):
+            return {}
+        return hashes
+
+    def backup(self, users, full=False):
+        """Сделать копию хранилища {имя: запись}; возвращает запись журнала"""
+        os.makedirs(self.directory, exist_ok=True)
+        entries = self.entries()
+        old_hashes = {} if full else self._load_state(entries)
+        since_base = 0
+        for entry in reversed(entries):
+            if entry['kind'] == 'base':
+                break
+            since_base += entry['put'] + entry['deleted']
+        kind = 'delta'
+        if not old_hashes or since_base > self.rebase_ratio * max(1, len(old_hashes)):
+            kind = 'base'
+            old_hashes = {}
+
+        backup_id = entries[-1]['id'] + 1 if entries else 1
+        name = f'{backup_id:06d}-{kind}.jsonl.gz'
+        hashes_name = f'{backup_id:06d}-{kind}.hashes.gz'
+        records = 0
+        put = 0
+        with gzip.open(self._path(name), 'wt', encoding='utf-8') as file, \
+                gzip.open(self._path(hashes_name), 'wt', encoding='utf-8') as hashes_file:
+            for username, user_data in users.items():
+                records += 1
+                digest = content_hash(user_data)
+                if old_hashes.pop(username, None) != digest:
+                    file.write(json.dumps(['put', username, user_data], ensure_ascii=False) + '\n')
+                    hashes_file.write(json.dumps([username, digest], ensure_ascii=False) + '\n')
+                    put += 1
+            # Оставшиеся в old_hashes записи из хранилища удалены
+            for username in old_hashes:
+                file.write(json.dumps(['del', username], ensure_ascii=False) + '\n')
+                hashes_file.write(json.dumps([username, None], ensure_ascii=False) + '\n')
+
+        entry = {
+            'id': backup_id,
+            'ts': round(time.time(), 3),
+            'kind': kind,
+            'file': name,
+            'hashes': hashes_name,
+            'records': records,
+            'put': put,
+            'deleted': len(old_hashes)
+        }
+        # Строка журнала - момент, с которого копия считается сделанной
+        with open(self._path(MANIFEST), 'a', encoding='utf-8') as file:
+            file.write(json.dumps(entry) + '\n')
+        return entry
+
+    def chain(self, at=None, backup_id=None):
+        """Копии, из которых собирается состояние на момент at (или на копию backup_id)"""
+        return self._since_base([
+            entry for entry in self.entries()
+            if (at is None or entry['ts'] <= at) and (backup_id is None or entry['id'] <= backup_id)
+        ])
+
+    def restore(self, at=None, backup_id=None):
+        """Хранилище {имя: запись} на момент at; None, если подходящих копий нет"""
+        chain = self.chain(at, backup_id)
+        if not chain:
+            return None
+        users = {}
+        for entry in chain:
+            with gzip.open(self._path(entry['file']), 'rt', encoding='utf-8') as file:
+                for line in file:
+                    operation = json.loads(line)
+                    if operation[0] == 'put':
+                        users[operation[1]] = operation[2]
+                    else:
+                        users.pop(operation[1], None)
+        return users
+
+
+def backup_store(path, directory=None, full=False):
+    return BackupSet(directory or default_directory(path)).backup(auth_storage.read(path), full)
+
+
+def restore_store(path, target, at=None, backup_id=None, directory=None):
+    """Восстановить хранилище в файл target; возвращает число записей или None"""
+    users = BackupSet(directory or default_directory(path)).restore(at, backup_id)
+    if users is None:
+        return None
+    auth_storage.write(users, target)
+    return len(users)
@@ -0,0 +1,283 @@
+"""
+Замеры производительности хранилища и входа
+
+Тесты: load (чтение хранилища), save (изменение одной записи и commit),
+login (проверка пароля), update_user_list (заполнение списка панели
+администратора, только при установленном PyQt6) и mixed (смешанная
+нагрузка администратора). Каждый тест выполняется для каждого размера
+хранилища и каждого формата (auth_storage.EXTENSIONS).
+
+Хранилища создаются auth_generate в рабочем каталоге и переиспользуются.
+Каждый тест для каждого сочетания размера и формата выполняется в отдельном
+процессе, чтобы пиковый объем памяти (peak RSS) не смешивался между ними.
+
+Примеры:
+    python auth_bench.py --sizes 1000 100000 --output bench.json
+    python auth_bench.py --baseline bench_baseline.json --tolerance 0.25
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import auth_generate
+import auth_storage
+from auth_service import AuthService, AuthError
+
+BENCHMARKS = ('load', 'save', 'login', 'update_user_list', 'mixed')
+DEFAULT_SIZES = (1000, 100000, 1000000)
+DEFAULT_WORKDIR = 'bench_data'
+MAX_OPS = {'load': 20, 'save': 20, 'login': 5000, 'update_user_list': 20, 'mixed': 500}
+TIME_BUDGET = 10.0   # секунд на один тест; выполняется не меньше MIN_OPS операций
+MIN_OPS = 3
+TOLERANCE = 0.2      # допустимое ухудшение относительно базового замера
+
+
+class Skipped(Exception):
+    """Тест невозможен в этом окружении"""
+
+
+def peak_rss_mb():
+    # ru_maxrss: килобайты в Linux, байты в macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def measure(operation, max_ops, budget=TIME_BUDGET):
+    """Выполнять operation(номер), пока не кончатся операции или время; задержки в секундах"""
+    latencies = []
+    started = time.perf_counter()
+    while len(latencies) < max_ops:
+        begin = time.perf_counter()
+        operation(len(latencies))
+        latencies.append(time.perf_counter() - begin)
+        if len(latencies) >= MIN_OPS and time.perf_counter() - started >= budget:
+            break
+    return latencies
+
+
+def store_path(workdir, size, extension, seed):
+    return os.path.join(workdir, f'users-{size}-s{seed}{extension}')
+
+
+def prepare_store(workdir, size, extension, seed):
+    path = store_path(workdir, size, extension, seed)
+    if not os.path.exists(path):
+        auth_generate.write_store(path, size, seed)
+    return path
+
+
+# Тесты; каждый возвращает операцию operation(номер)
+
+def bench_load(service, names, rng):
+    return lambda number: service.load()
+
+
+def bench_save(service, names, rng):
+    service.load()
+
+    def operation(number):
+        username = rng.choice(names)
+        service.set_blocked(username, not service.get_user(username)['blocked'])
+        service.commit()
+    return operation
+
+
+def bench_login(service, names, rng):
+    service.load()
+
+    def operation(number):
+        username = rng.choice(names)
+        try:
+            service.login(username, auth_generate.password_for(username))
+        except AuthError:
+            pass  # заблокированные пользователи
+    return operation
+
+
+def bench_update_user_list(service, names, rng):
+    try:
+        from PyQt6.QtWidgets import QApplication
+    except ImportError:
+        raise Skipped('PyQt6 не установлен')
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    # Окно создает файлы ограничителя и журнала аудита в текущем каталоге
+    os.chdir(os.path.dirname(service.path))
+    import a
+    app = QApplication.instance() or QApplication([])
+    window = a.UserAuthApp()
+    window.auth = service
+    service.load()
+    window.init_admin_panel()
+    # Ссылки держим в замыкании, иначе окно и приложение удалит сборщик мусора
+    return lambda number, window=window, app=app: window.update_user_list()
+
+
+def bench_mixed(service, names, rng):
+    """Смесь действий администратора: вход, блокировка, правила, выборки по индексу"""
+    service.load()
+
+    def operation(number):
+        username = rng.choice(names)
+        choice = rng.random()
+        try:
+            if choice < 0.6:
+                service.login(username, auth_generate.password_for(username))
+            elif choice < 0.75:
+                service.set_blocked(username, not service.get_user(username)['blocked'])
+                service.commit()
+            elif choice < 0.85:
+                service.set_rules(username, {'min_length': rng.choice((0, 6, 8))})
+                service.commit()
+            elif choice < 0.95:
+                service.find_users('blocked')
+            else:
+                service.refresh()
+        except AuthError:
+            pass
+    return operation
+
+
+SETUP = {
+    'load': bench_load,
+    'save': bench_save,
+    'login': bench_login,
+    'update_user_list': bench_update_user_list,
+    'mixed': bench_mixed
+}
+
+
+def run_benchmark(path, size, extension, name, budget, seed):
+    """Один тест для одного хранилища (выполняется в отдельном процессе)"""
+    # Тесты с записью работают с копией, чтобы общее хранилище оставалось неизменным
+    work_path = path + '.work' + extension
+    rng = random.Random(seed)
+    names = [auth_generate.username_for(number) for number in range(min(size, 100000))]
+    shutil.copyfile(path, work_path)
+    service = AuthService(work_path)
+    result = {'size': size, 'format': extension, 'benchmark': name}
+    try:
+        latencies = measure(SETUP[name](service, names, rng), MAX_OPS[name], budget)
+    except Skipped as reason:
+        result['skipped'] = str(reason)
+        return result
+    finally:
+        for leftover in (work_path, work_path + '.lock', work_path + '.idx'):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    total = sum(latencies)
+    latencies.sort()
+    result.update(
+        ops=len(latencies),
+        ops_per_sec=round(len(latencies) / total, 2) if total else 0.0,
+        p50_ms=round(percentile(latencies, 0.5) * 1000, 3),
+        p99_ms=round(percentile(latencies, 0.99) * 1000, 3),
+        peak_rss_mb=peak_rss_mb()
+    )
+    return result
+
+
+def run(sizes, extensions, benchmarks, workdir, budget, seed):
+    os.makedirs(workdir, exist_ok=True)
+    # spawn: процесс теста не наследует память родителя, peak RSS - только его собственный
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for size in sizes:
+        for extension in extensions:
+            path = os.path.abspath(prepare_store(workdir, size, extension, seed))
+            for name in benchmarks:
+                # Свой процесс у каждого теста: peak RSS - максимум за все время
+                # процесса, в общем процессе он достался бы и следующим тестам
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    result = pool.submit(run_benchmark, path, size, extension, name, budget, seed).result()
+                print(format_result(result), file=sys.stderr)
+                results.append(result)
+    return {
+        'meta': {
+            'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'seed': seed
+        },
+        'results': results
+    }
+
+
+def format_result(result):
+    label = f"{result['benchmark']:>16} {result['size']:>9} {result['format']:<8}"
+    if 'skipped' in result:
+        return f"{label} пропущен: {result['skipped']}"
+    return (f"{label} {result['ops_per_sec']:>10.1f} оп/с  p50 {result['p50_ms']:>9.3f} мс  "
+            f"p99 {result['p99_ms']:>9.3f} мс  RSS {result['peak_rss_mb']:>7.1f} МБ")
+
+
+def compare(report, baseline, tolerance=TOLERANCE):
+    """Ухудшения относительно базового замера: строки с описанием"""
+    def key(result):
+        return result['benchmark'], result['size'], result['format']
+
+    known = {key(result): result for result in baseline['results'] if 'skipped' not in result}
+    regressions = []
+    for result in report['results']:
+        old = known.get(key(result))
+        if old is None or 'skipped' in result:
+            continue
+        label = '{} {} {}'.format(*key(result))
+        if result['ops_per_sec'] < old['ops_per_sec'] / (1 + tolerance):
+            regressions.append(f"{label}: {old['ops_per_sec']} -> {result['ops_per_sec']} оп/с")
+        if result['p99_ms'] > old['p99_ms'] * (1 + tolerance):
+            regressions.append(f"{label}: p99 {old['p99_ms']} -> {result['p99_ms']} мс")
+        if result['peak_rss_mb'] > old['peak_rss_mb'] * (1 + tolerance):
+            regressions.append(f"{label}: RSS {old['peak_rss_mb']} -> {result['peak_rss_mb']} МБ")
+    return regressions
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Замеры производительности хранилища и входа')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help='размеры хранилищ (по умолчанию 1000 100000 1000000)')
+    parser.add_argument('--formats', nargs='+', default=list(auth_storage.EXTENSIONS),
+                        choices=auth_storage.EXTENSIONS, help='форматы хранилища (по умолчанию все)')
+    parser.add_argument('--benchmarks', nargs='+', default=list(BENCHMARKS), choices=BENCHMARKS)
+    parser.add_argument('--workdir', default=DEFAULT_WORKDIR, help='каталог сгенерированных хранилищ')
+    parser.add_argument('--budget', type=float, default=TIME_BUDGET, help='секунд на один тест')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='записать результаты в JSON')
+    parser.add_argument('--baseline', help='сравнить с результатами из этого файла')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help='допустимое ухудшение, доля (по умолчанию 0.2)')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    report = run(args.sizes, args.formats, args.benchmarks, args.workdir, args.budget, args.seed)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=4)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            regressions = compare(report, json.load(file), args.tolerance)
+        for line in regressions:
+            print(f'Ухудшение: {line}', file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
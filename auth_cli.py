@@ -0,0 +1,431 @@
+"""
+Консольная утилита администрирования учетных записей без графического интерфейса
+Все операции выполняются в одном процессе: хранилище читается один раз
+и записывается один раз в конце пакета
+
+Примеры:
+    python auth_cli.py run "add ivan" "rules ivan min_length=8 require_digit=1" "block petr"
+    python auth_cli.py batch operations.txt
+    python auth_cli.py analyze --log auth_audit.jsonl --top 20
+    python auth_cli.py --file users.rec check --repair
+    python auth_cli.py convert users.rec
+    python auth_cli.py memory --json
+    python auth_cli.py --serializer compact run "block petr"
+    python auth_cli.py --compress-level 9 convert users.json.xz
+    python auth_cli.py backup
+    python auth_cli.py restore users.restored.json --at "2026-10-19 14:00"
+    python auth_cli.py diff users.restored.json users.json --summary
+    python auth_cli.py --store sales run "add ivan"
+"""
+
+import argparse
+import getpass
+import json
+import os
+import shlex
+import sys
+from datetime import datetime
+
+import auth_backup
+import auth_pool
+import auth_serializer
+import auth_storage
+from auth_service import USER_DATA_FILE, AuthError, AuthService, StoreCorruptError, StoreLock
+from auth_index import ATTRIBUTES
+from auth_throttle import LoginThrottle
+from auth_audit import AUDIT_LOG_FILE, AuditLog
+import auth_metrics
+import auth_trace
+
+TRUE_VALUES = ('1', 'true', 'yes', 'on', 'да')
+
+USAGE_OPERATIONS = """Операции (по одной на строку в пакетном файле):
+    add ИМЯ                       добавить пользователя с пустым паролем
+    set-password ИМЯ ПАРОЛЬ       установить пароль (с проверкой правил)
+    block ИМЯ / unblock ИМЯ       заблокировать / разблокировать
+    admin ИМЯ                     назначить администратором
+    rules ИМЯ ключ=значение ...   изменить правила пароля
+    login ИМЯ ПАРОЛЬ [ИСТОЧНИК]   проверить вход (источник учитывается ограничителем)
+    list [ОТБОР]                  вывести список пользователей; отбор по индексу:
+                                  admin, blocked, no-password, policy=ИДЕНТИФИКАТОР
+    policies                      политики пароля (например, 8:ULDS) и число пользователей
+"""
+
+
+def parse_rules(items):
+    """Разбор аргументов вида min_length=8 require_upper=1"""
+    rules = {}
+    for item in items:
+        key, sep, value = item.partition('=')
+        if not sep:
+            raise AuthError(f'Ожидалось ключ=значение: {item}')
+        if key == 'min_length':
+            if not value.isdigit():
+                raise AuthError('min_length должен быть целым неотрицательным числом')
+            rules[key] = int(value)
+        else:
+            rules[key] = value.lower() in TRUE_VALUES
+    return rules
+
+
+def format_user(username, data):
+    status = " (заблокирован)" if data['blocked'] else ""
+    admin = " (администратор)" if data.get('admin') else ""
+    password = " (без пароля)" if data['password'] == '' else ""
+    return f"{username}{admin}{status}{password}"
+
+
+def apply_operation(service, args):
+    """Выполнение одной операции; возвращает строку результата"""
+    if not args:
+        return None
+    command, params = args[0], args[1:]
+
+    def expect(count):
+        if len(params) < count:
+            raise AuthError(f'Недостаточно аргументов для {command}')
+
+    if command == 'add':
+        expect(1)
+        service.add_user(params[0])
+        return f'Пользователь {params[0]} добавлен с пустым паролем'
+    if command == 'set-password':
+        expect(2)
+        service.set_password(params[0], params[1])
+        return f'Пароль для {params[0]} установлен'
+    if command in ('block', 'unblock'):
+        expect(1)
+        service.set_blocked(params[0], command == 'block')
+        status = 'заблокирован' if command == 'block' else 'разблокирован'
+        return f'Пользователь {params[0]} {status}'
+    if command == 'admin':
+        expect(1)
+        service.set_admin(params[0])
+        return f'Пользователь {params[0]} теперь администратор'
+    if command == 'rules':
+        expect(1)
+        service.set_rules(params[0], parse_rules(params[1:]))
+        return f'Правила пароля для {params[0]} обновлены'
+    if command == 'login':
+        expect(2)
+        source = params[2] if len(params) > 2 else None
+        return f'{params[0]}: {service.login(params[0], params[1], source)}'
+    if command == 'list':
+        if not params:
+            return '\n'.join(format_user(name, data) for name, data in service.get_users().items())
+        if params[0].startswith('policy='):
+            names = service.users_with_policy(params[0].partition('=')[2])
+        elif params[0].replace('-', '_') in ATTRIBUTES:
+            names = service.find_users(params[0].replace('-', '_'))
+        else:
+            raise AuthError(f'Неизвестный отбор: {params[0]}')
+        return '\n'.join(format_user(name, service.get_user(name)) for name in names)
+    if command == 'policies':
+        return '\n'.join(f'{policy}: {count}' for policy, count in service.policies().items())
+    raise AuthError(f'Неизвестная операция: {command}')
+
+
+def run_operations(service, lines, keep_going=False, quiet=False):
+    """Выполнение пакета операций; возвращает количество ошибок"""
+    errors = 0
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        try:
+            args = shlex.split(line)
+            with auth_trace.span(args[0] if args else 'empty', 'cli'):
+                result = apply_operation(service, args)
+        except (AuthError, ValueError) as error:
+            errors += 1
+            print(f'Ошибка в операции {number} ({line}): {error}', file=sys.stderr)
+            if not keep_going:
+                break
+            continue
+        if result and not quiet:
+            print(result)
+    return errors
+
+
+def read_batch(path):
+    if path == '-':
+        return sys.stdin.read().splitlines()
+    with open(path, 'r', encoding='utf-8') as file:
+        return file.read().splitlines()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description='Администрирование пользователей без графического интерфейса',
+        epilog=USAGE_OPERATIONS,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    store = parser.add_mutually_exclusive_group()
+    store.add_argument('--file', default=USER_DATA_FILE, help='файл хранилища (по умолчанию users.json)')
+    store.add_argument('--store', help='именованное хранилище (каталог AUTH_STORES_DIR или stores) вместо --file')
+    parser.add_argument('--keep-going', action='store_true',
+                        help='продолжать после ошибок и сохранить успешные операции')
+    parser.add_argument('--dry-run', action='store_true', help='не сохранять изменения')
+    parser.add_argument('--throttle-file', help='включить ограничение попыток входа с состоянием в этом файле')
+    parser.add_argument('--audit-log', help='писать события в журнал аудита (JSONL)')
+    parser.add_argument('--metrics', metavar='ПРЕФИКС',
+                        help='замерять время операций и записать ПРЕФИКС.prom и ПРЕФИКС.json')
+    parser.add_argument('--trace', metavar='ФАЙЛ', help='записать трассировку в формате Chrome trace_event')
+    parser.add_argument('--serializer', choices=auth_serializer.SERIALIZERS,
+                        help='сериализатор файла .json (по умолчанию AUTH_SERIALIZER или pretty)')
+    parser.add_argument('--compress-level', type=int, choices=range(10), metavar='0-9',
+                        help='уровень сжатия .json.gz и .json.xz (по умолчанию AUTH_COMPRESS_LEVEL или 6)')
+    parser.add_argument('-q', '--quiet', action='store_true', help='не выводить результаты операций')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='выполнить операции из аргументов')
+    run_parser.add_argument('operations', nargs='+', help='операции, например "block ivan"')
+
+    batch_parser = commands.add_parser('batch', help='выполнить операции из файла')
+    batch_parser.add_argument('path', help="файл с операциями ('-' - стандартный ввод)")
+
+    analyze_parser = commands.add_parser('analyze', help='сводка по журналу аудита')
+    analyze_parser.add_argument('--log', default=AUDIT_LOG_FILE, help='журнал аудита (с ротированными сегментами)')
+    analyze_parser.add_argument('--since', type=parse_time, help='начало периода, ГГГГ-ММ-ДД[ЧЧ:ММ]')
+    analyze_parser.add_argument('--until', type=parse_time, help='конец периода, ГГГГ-ММ-ДД[ЧЧ:ММ]')
+    analyze_parser.add_argument('--top', type=int, default=10, help='размер списков (по умолчанию 10)')
+    analyze_parser.add_argument('--workers', type=int, help='число процессов (по умолчанию - по числу ядер)')
+    analyze_parser.add_argument('--json', action='store_true', help='вывести сводку в JSON')
+
+    check_parser = commands.add_parser('check', help='проверить контрольные суммы записей (формат .rec)')
+    check_parser.add_argument('--workers', type=int, help='число процессов (по умолчанию - по числу ядер)')
+    check_parser.add_argument('--repair', action='store_true',
+                              help='убрать испорченные записи в ФАЙЛ.quarantine и переписать хранилище')
+
+    convert_parser = commands.add_parser('convert', help='переписать хранилище в другом формате')
+    convert_parser.add_argument('target', help='новый файл; формат по расширению (.json, .rec, .json.gz, .json.xz)')
+
+    memory_parser = commands.add_parser('memory', help='профиль памяти хранилища (tracemalloc)')
+    memory_parser.add_argument('--json', action='store_true', help='вывести профиль в JSON')
+
+    commands.add_parser('stores', help='список именованных хранилищ')
+
+    backup_parser = commands.add_parser('backup', help='резервная копия: только изменения с прошлой копии')
+    backup_parser.add_argument('--dir', help='каталог копий (по умолчанию ФАЙЛ.backups)')
+    backup_parser.add_argument('--full', action='store_true', help='сделать новый базовый снимок')
+
+    backups_parser = commands.add_parser('backups', help='список резервных копий')
+    backups_parser.add_argument('--dir', help='каталог копий (по умолчанию ФАЙЛ.backups)')
+
+    restore_parser = commands.add_parser('restore', help='восстановить хранилище из копий в новый файл')
+    restore_parser.add_argument('target', help='файл восстановленного хранилища; формат по расширению')
+    restore_parser.add_argument('--at', type=parse_time,
+                                help='момент времени, ГГГГ-ММ-ДД[ЧЧ:ММ] (по умолчанию последняя копия)')
+    restore_parser.add_argument('--id', type=int, help='номер копии')
+    restore_parser.add_argument('--dir', help='каталог копий (по умолчанию ФАЙЛ.backups)')
+
+    diff_parser = commands.add_parser('diff', help='изменения между двумя хранилищами')
+    diff_parser.add_argument('old', help='прежнее хранилище (любой формат)')
+    diff_parser.add_argument('new', help='новое хранилище (любой формат)')
+    diff_parser.add_argument('--summary', action='store_true', help='только число изменений по видам')
+    diff_parser.add_argument('--json', action='store_true', help='изменения в JSON, по строке на изменение')
+    diff_parser.add_argument('--tmpdir', help='каталог временных файлов сортировки')
+    return parser
+
+
+def parse_time(value):
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'неверная дата: {value}')
+
+
+def run_batch(args):
+    lines = args.operations if args.command == 'run' else read_batch(args.path)
+    throttle = LoginThrottle(args.throttle_file) if args.throttle_file else None
+    audit = AuditLog(args.audit_log) if args.audit_log else None
+    service = AuthService(args.file, throttle=throttle, audit=audit, store=auth_pool.store_name(args.file))
+    service.actor = f'cli:{getpass.getuser()}'
+    try:
+        service.load()
+    except StoreCorruptError as error:
+        print(error, file=sys.stderr)
+        if audit is not None:
+            audit.close()
+        return 2
+    errors = run_operations(service, lines, args.keep_going, args.quiet)
+    if throttle is not None:
+        throttle.snapshot()
+    # При ошибке без --keep-going пакет не сохраняется целиком
+    if not args.dry_run and (not errors or args.keep_going):
+        conflicts = service.commit()
+        for username, fields in sorted(conflicts.items()):
+            print(f'{username}: одновременно изменено другим процессом ({", ".join(fields)}), '
+                  'сохранены значения пакета', file=sys.stderr)
+    # События изменений попадают в журнал при commit, поэтому журнал закрывается после него
+    if audit is not None:
+        audit.close()
+    return 1 if errors else 0
+
+
+def run_analyze(args):
+    from auth_analytics import analyze, build_report, format_report, report_json
+
+    stats, segments = analyze(args.log, args.since, args.until, args.workers)
+    if not segments:
+        print(f'Журнал {args.log} не найден', file=sys.stderr)
+        return 1
+    report = build_report(stats, args.top)
+    print(report_json(report) if args.json else format_report(report))
+    return 0
+
+
+def run_check(args):
+    if not os.path.exists(args.file):
+        print(f'Хранилище {args.file} не найдено', file=sys.stderr)
+        return 1
+    if not auth_storage.is_record_format(args.file):
+        print(f'{args.file}: проверка доступна только для формата {auth_storage.RECORD_EXTENSION}',
+              file=sys.stderr)
+        return 2
+    result = auth_storage.verify(args.file, args.workers)
+    for offset, reason in result['corrupt']:
+        print(f'смещение {offset}: {reason}')
+    index_note = '' if result['indexed'] else ' (индекс в конце файла испорчен или отсутствует)'
+    print(f"Проверено записей: {result['records']}, испорчено: {len(result['corrupt'])}{index_note}")
+    if args.repair and (result['corrupt'] or not result['indexed']):
+        with StoreLock(args.file):
+            removed = auth_storage.repair(args.file)
+        print(f'Убрано записей: {removed} (см. {args.file}.quarantine)')
+        return 0
+    return 1 if result['corrupt'] else 0
+
+
+def run_convert(args):
+    if not os.path.exists(args.file):
+        print(f'Хранилище {args.file} не найдено', file=sys.stderr)
+        return 1
+    with StoreLock(args.file):
+        auth_storage.convert(args.file, args.target)
+    return 0
+
+
+def run_memory(args):
+    from auth_memory import format_report, profile, report_json
+
+    if not os.path.exists(args.file):
+        print(f'Хранилище {args.file} не найдено', file=sys.stderr)
+        return 1
+    report = profile(args.file)
+    print(report_json(report) if args.json else format_report(report))
+    return 0
+
+
+def run_backup(args):
+    if not os.path.exists(args.file):
+        print(f'Хранилище {args.file} не найдено', file=sys.stderr)
+        return 1
+    with StoreLock(args.file):
+        entry = auth_backup.backup_store(args.file, args.dir, args.full)
+    kind = 'базовый снимок' if entry['kind'] == 'base' else 'разностная копия'
+    print(f"Копия {entry['id']} ({kind}): записей {entry['records']}, "
+          f"сохранено {entry['put']}, удалено {entry['deleted']}")
+    return 0
+
+
+def run_backups(args):
+    entries = auth_backup.BackupSet(args.dir or auth_backup.default_directory(args.file)).entries()
+    if not entries:
+        print('Резервных копий нет', file=sys.stderr)
+        return 1
+    for entry in entries:
+        stamp = datetime.fromtimestamp(entry['ts']).strftime('%Y-%m-%d %H:%M:%S')
+        print(f"{entry['id']:>6} {stamp} {entry['kind']:<5} записей {entry['records']}, "
+              f"сохранено {entry['put']}, удалено {entry['deleted']}")
+    return 0
+
+
+def run_restore(args):
+    count = auth_backup.restore_store(args.file, args.target, args.at, args.id, args.dir)
+    if count is None:
+        print('Нет резервной копии на этот момент', file=sys.stderr)
+        return 1
+    print(f'Восстановлено записей: {count} в {args.target}')
+    return 0
+
+
+def run_diff(args):
+    from auth_diff import CHANGES, diff, format_change
+
+    for path in (args.old, args.new):
+        if not os.path.exists(path):
+            print(f'Хранилище {path} не найдено', file=sys.stderr)
+            return 1
+    counts = dict.fromkeys(CHANGES, 0)
+    for change in diff(args.old, args.new, args.tmpdir):
+        counts[change['change']] += 1
+        if args.json:
+            print(json.dumps(change, ensure_ascii=False))
+        elif not args.summary:
+            print(format_change(change))
+    if args.summary or not args.json:
+        print(', '.join(f'{kind}: {count}' for kind, count in counts.items()), file=sys.stderr)
+    return 1 if any(counts.values()) else 0
+
+
+def run_stores(args):
+    names = auth_pool.store_names()
+    if not names:
+        print('Хранилищ нет', file=sys.stderr)
+        return 1
+    for name in names:
+        print(f'{name:<20} {auth_pool.store_path(name)}')
+    return 0
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.store:
+        try:
+            # Пакет операций может создать новое хранилище
+            args.file = auth_pool.store_path(args.store, create=args.command in ('run', 'batch'))
+        except ValueError as error:
+            print(error, file=sys.stderr)
+            return 2
+    if args.serializer:
+        auth_serializer.set_default(args.serializer)
+    if args.compress_level is not None:
+        auth_storage.set_compress_level(args.compress_level)
+    if args.trace:
+        auth_trace.start(args.trace)
+    if args.metrics:
+        auth_metrics.enable()
+        try:
+            return dispatch(args)
+        finally:
+            auth_metrics.export(args.metrics)
+    return dispatch(args)
+
+
+def dispatch(args):
+
+    if args.command in ('run', 'batch'):
+        return run_batch(args)
+    if args.command == 'analyze':
+        return run_analyze(args)
+    if args.command == 'check':
+        return run_check(args)
+    if args.command == 'convert':
+        return run_convert(args)
+    if args.command == 'memory':
+        return run_memory(args)
+    if args.command == 'backup':
+        return run_backup(args)
+    if args.command == 'backups':
+        return run_backups(args)
+    if args.command == 'restore':
+        return run_restore(args)
+    if args.command == 'diff':
+        return run_diff(args)
+    if args.command == 'stores':
+        return run_stores(args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+Замер сжатого хранилища: размер файла, время записи и чтения (полное
+и процессорное) для .json, .json.gz и .json.xz на разных уровнях сжатия
+
+В сетевом домашнем каталоге сжатие меняет передачу данных на работу
+процессора. Поэтому для каждой пропускной способности сети B выводится оценка
+времени чтения и записи: процессорное время + размер файла / B. Если --workdir
+указывает на сетевой каталог, столбцы полного времени показывают реальные
+задержки этого каталога. Сериализатор - как у хранилища (AUTH_SERIALIZER).
+
+Пример:
+    python auth_compress_bench.py --users 1000000 --levels 1 6 9 --bandwidth 10 100 1000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import auth_bench
+import auth_storage
+
+DEFAULT_LEVELS = (1, 6, 9)
+DEFAULT_BANDWIDTH = (10, 100, 1000)   # Мбит/с
+DEFAULT_REPEAT = 3
+
+
+def timed_best(operation, repeat):
+    """Лучшие из repeat замеров: (полное время, процессорное время), секунды"""
+    best = None
+    for _ in range(repeat):
+        wall, cpu = time.perf_counter(), time.process_time()
+        operation()
+        result = (time.perf_counter() - wall, time.process_time() - cpu)
+        if best is None or result[0] < best[0]:
+            best = result
+    return best
+
+
+def measure(users, path, level, repeat):
+    if level is not None:
+        auth_storage.set_compress_level(level)
+    save_wall, save_cpu = timed_best(lambda: auth_storage.write(users, path), repeat)
+    size = os.path.getsize(path)
+    load_wall, load_cpu = timed_best(lambda: auth_storage.read(path), repeat)
+    os.remove(path)
+    return {
+        'format': os.path.basename(path).split('.', 1)[1],
+        'level': level,
+        'bytes': size,
+        'save_seconds': round(save_wall, 4),
+        'save_cpu_seconds': round(save_cpu, 4),
+        'load_seconds': round(load_wall, 4),
+        'load_cpu_seconds': round(load_cpu, 4)
+    }
+
+
+def add_estimates(result, bandwidths):
+    """Оценка времени при передаче файла по сети: процессор + размер / пропускная способность"""
+    result['estimates'] = {}
+    for bandwidth in bandwidths:
+        transfer = result['bytes'] * 8 / (bandwidth * 1_000_000)
+        result['estimates'][bandwidth] = {
+            'load_seconds': round(result['load_cpu_seconds'] + transfer, 4),
+            'save_seconds': round(result['save_cpu_seconds'] + transfer, 4)
+        }
+    return result
+
+
+def run(size, levels, bandwidths, workdir, repeat, seed):
+    source = auth_bench.prepare_store(workdir, size, '.json', seed)
+    users = auth_storage.read(source)
+    results = []
+    cases = [('.json', None)] + [
+        (extension, level) for extension in auth_storage.COMPRESSED_EXTENSIONS for level in levels
+    ]
+    for extension, level in cases:
+        path = os.path.join(workdir, f'compress-{size}{extension}')
+        result = add_estimates(measure(users, path, level, repeat), bandwidths)
+        print(format_result(result), file=sys.stderr)
+        results.append(result)
+    return results
+
+
+def format_result(result):
+    level = '-' if result['level'] is None else result['level']
+    line = (f"{result['format']:<8} ур. {level:<2} {result['bytes'] / (1024 * 1024):>8.1f} МБ  "
+            f"запись {result['save_seconds']:.3f} с (ЦП {result['save_cpu_seconds']:.3f})  "
+            f"чтение {result['load_seconds']:.3f} с (ЦП {result['load_cpu_seconds']:.3f})")
+    estimates = ', '.join(
+        f"{bandwidth:g} Мбит/с: {values['load_seconds']:.2f}/{values['save_seconds']:.2f} с"
+        for bandwidth, values in result['estimates'].items()
+    )
+    return f'{line}\n    по сети (чтение/запись) {estimates}'
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Замер сжатия хранилища пользователей')
+    parser.add_argument('--users', type=int, default=100000, help='размер хранилища (по умолчанию 100000)')
+    parser.add_argument('--levels', type=int, nargs='+', default=list(DEFAULT_LEVELS),
+                        choices=range(10), metavar='0-9', help='уровни сжатия (по умолчанию 1 6 9)')
+    parser.add_argument('--bandwidth', type=float, nargs='+', default=list(DEFAULT_BANDWIDTH),
+                        help='пропускная способность сети для оценки, Мбит/с (по умолчанию 10 100 1000)')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='повторов каждого замера')
+    parser.add_argument('--workdir', default=auth_bench.DEFAULT_WORKDIR,
+                        help='каталог хранилищ (например, сетевой домашний каталог)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='записать результаты в JSON')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    os.makedirs(args.workdir, exist_ok=True)
+    results = run(args.users, args.levels, args.bandwidth, args.workdir, args.repeat, args.seed)
+    if args.output:
+        report = {'meta': {'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'users': args.users}, 'results': results}
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=4)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""
+Сравнение двух хранилищ пользователей (любые форматы auth_storage)
+
+Изменения: добавленные и удаленные пользователи, блокировка, сброс и смена
+пароля, смена политики пароля, права администратора и прочие поля записи
+UserAuthApp. Записи старого формата приводятся к текущему (normalize_record),
+поле version не сравнивается.
+
+Оба хранилища читаются потоком и сортируются по имени внешней сортировкой:
+части по RUN_RECORDS записей сортируются в памяти и сбрасываются во временные
+файлы, затем сливаются. Отсортированные потоки сравниваются слиянием, поэтому
+память ограничена размером части и не зависит от размера хранилищ.
+"""
+
+import heapq
+import json
+import os
+import tempfile
+from operator import itemgetter
+
+import auth_storage
+from auth_index import policy_id
+from auth_service import normalize_record
+
+RUN_RECORDS = 100000
+CHANGES = ('added', 'removed', 'blocked', 'password', 'policy', 'admin', 'other')
+_COMPARED = ('password', 'blocked', 'admin', 'password_rules', 'version')
+
+
+def _spill(batch, workdir):
+    batch.sort(key=itemgetter(0))
+    file = tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=workdir, suffix='.run', delete=False)
+    with file:
+        for record in batch:
+            file.write(json.dumps(record, ensure_ascii=False) + '\n')
+    return file.name
+
+
+def _read_run(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            yield tuple(json.loads(line))
+
+
+def sorted_records(path, workdir, run_records=RUN_RECORDS):
+    """Пары (имя, запись) хранилища по возрастанию имени"""
+    runs = []
+    batch = []
+    for username, user_data in auth_storage.iter_users(path):
+        batch.append((username, normalize_record(user_data)))
+        if len(batch) >= run_records:
+            runs.append(_spill(batch, workdir))
+            batch = []
+    if not runs:
+        # Хранилище уместилось в одну часть - без временных файлов
+        batch.sort(key=itemgetter(0))
+        yield from batch
+        return
+    if batch:
+        runs.append(_spill(batch, workdir))
+    try:
+        yield from heapq.merge(*(_read_run(run) for run in runs), key=itemgetter(0))
+    finally:
+        for run in runs:
+            os.remove(run)
+
+
+def _password_state(password):
+    return 'empty' if password == '' else 'set'
+
+
+def record_changes(username, old, new):
+    """Изменения одной записи: словари {user, change, old, new}"""
+    changes = []
+
+    def change(kind, old_value, new_value):
+        changes.append({'user': username, 'change': kind, 'old': old_value, 'new': new_value})
+
+    if old.get('blocked') != new.get('blocked'):
+        change('blocked', old.get('blocked'), new.get('blocked'))
+    if old.get('password') != new.get('password'):
+        old_state, new_state = _password_state(old.get('password')), _password_state(new.get('password'))
+        change('password', old_state, 'changed' if old_state == new_state == 'set' else new_state)
+    old_policy, new_policy = policy_id(old.get('password_rules')), policy_id(new.get('password_rules'))
+    if old_policy != new_policy:
+        change('policy', old_policy, new_policy)
+    if old.get('admin') != new.get('admin'):
+        change('admin', old.get('admin'), new.get('admin'))
+    fields = sorted(
+        key for key in old.keys() | new.keys()
+        if key not in _COMPARED and old.get(key) != new.get(key)
+    )
+    if fields:
+        change('other', None, fields)
+    return changes
+
+
+def diff_sorted(old_records, new_records):
+    """Изменения между двумя потоками (имя, запись), отсортированными по имени"""
+    missing = object()
+    old_records, new_records = iter(old_records), iter(new_records)
+    old = next(old_records, missing)
+    new = next(new_records, missing)
+    while old is not missing or new is not missing:
+        if new is missing or (old is not missing and old[0] < new[0]):
+            yield {'user': old[0], 'change': 'removed', 'old': None, 'new': None}
+            old = next(old_records, missing)
+        elif old is missing or new[0] < old[0]:
+            yield {'user': new[0], 'change': 'added', 'old': None, 'new': None}
+            new = next(new_records, missing)
+        else:
+            yield from record_changes(new[0], old[1], new[1])
+            old = next(old_records, missing)
+            new = next(new_records, missing)
+
+
+def diff(old_path, new_path, workdir=None, run_records=RUN_RECORDS):
+    """Изменения от хранилища old_path к new_path по возрастанию имени"""
+    with tempfile.TemporaryDirectory(prefix='auth_diff-', dir=workdir) as temp_dir:
+        yield from diff_sorted(
+            sorted_records(old_path, temp_dir, run_records),
+            sorted_records(new_path, temp_dir, run_records)
+        )
+
+
+_PASSWORD_TEXT = {'empty': 'сброшен', 'set': 'установлен', 'changed': 'изменен'}
+
+
+def format_change(change):
+    user, kind = change['user'], change['change']
+    if kind == 'added':
+        return f'+ {user}'
+    if kind == 'removed':
+        return f'- {user}'
+    if kind == 'blocked':
+        return f"~ {user}: {'заблокирован' if change['new'] else 'разблокирован'}"
+    if kind == 'password':
+        return f"~ {user}: пароль {_PASSWORD_TEXT[change['new']]}"
+    if kind == 'policy':
+        return f"~ {user}: политика {change['old']} -> {change['new']}"
+    if kind == 'admin':
+        return f"~ {user}: {'назначен администратором' if change['new'] else 'снят с администраторов'}"
+    return f"~ {user}: изменены поля {', '.join(change['new'])}"
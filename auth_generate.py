@@ -0,0 +1,107 @@
+"""
+Генератор синтетических хранилищ пользователей для проверки на больших объемах
+
+Записи в точности в схеме users.json (a.py, abm.py), в том числе записи старого
+формата из 3/1.py (password_rules: bool, без версии). Записи создаются и пишутся
+потоком, поэтому память не зависит от числа пользователей (до 10 млн и больше).
+При одинаковом --seed получается один и тот же файл.
+
+Пароль пользователя с установленным паролем - password_for(имя),
+это позволяет нагрузочным тестам входить под сгенерированными пользователями.
+
+Пример:
+    python auth_generate.py --users 1000000 --seed 1 --blocked 0.05 --legacy 0.1 users.json
+"""
+
+import argparse
+import random
+import sys
+
+import auth_storage
+from auth_service import ADMIN_USERNAME, EMPTY_RULES, STRICT_RULES, hash_password, new_user_record
+
+DEFAULT_FRACTIONS = {
+    'blocked': 0.05,        # заблокированные
+    'admins': 0.01,         # администраторы (кроме admin)
+    'empty_password': 0.2,  # пароль не установлен
+    'rules': 0.3,           # собственные правила пароля
+    'legacy': 0.0           # записи старого формата с password_rules: bool
+}
+
+
+def password_for(username):
+    return f'{username}-Pw1!'
+
+
+def username_for(number):
+    return f'user{number:08d}'
+
+
+def random_rules(rng):
+    return dict(
+        EMPTY_RULES,
+        min_length=rng.choice((0, 4, 6, 8, 12)),
+        require_upper=rng.random() < 0.5,
+        require_lower=rng.random() < 0.5,
+        require_digit=rng.random() < 0.5,
+        require_special=rng.random() < 0.3
+    )
+
+
+def generate_users(count, seed=0, fractions=None):
+    """Пары (имя, запись): admin и count обычных пользователей"""
+    fractions = dict(DEFAULT_FRACTIONS, **(fractions or {}))
+    rng = random.Random(seed)
+    yield ADMIN_USERNAME, new_user_record(
+        admin=True, rules=STRICT_RULES, password=hash_password(password_for(ADMIN_USERNAME))
+    )
+    for number in range(count):
+        username = username_for(number)
+        has_password = rng.random() >= fractions['empty_password']
+        password = hash_password(password_for(username)) if has_password else ''
+        if rng.random() < fractions['legacy']:
+            # Формат 3/1.py: флаг вместо словаря правил и нет поля версии
+            yield username, {
+                'password': password,
+                'admin': False,
+                'blocked': rng.random() < fractions['blocked'],
+                'password_rules': rng.random() < fractions['rules']
+            }
+            continue
+        record = new_user_record(
+            admin=rng.random() < fractions['admins'],
+            rules=random_rules(rng) if rng.random() < fractions['rules'] else None,
+            password=password
+        )
+        record['blocked'] = rng.random() < fractions['blocked']
+        yield username, record
+
+
+def write_store(path, count, seed=0, fractions=None):
+    auth_storage.write_stream(generate_users(count, seed, fractions), path)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Синтетическое хранилище пользователей')
+    parser.add_argument('path', help='файл хранилища; формат по расширению (.json, .rec, .json.gz, .json.xz)')
+    parser.add_argument('--users', type=int, default=1000, help='число пользователей (по умолчанию 1000)')
+    parser.add_argument('--seed', type=int, default=0, help='зерно генератора (по умолчанию 0)')
+    for name, value in DEFAULT_FRACTIONS.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=float, default=value, dest=name,
+                            metavar='ДОЛЯ', help=f'доля записей (по умолчанию {value})')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    fractions = {name: getattr(args, name) for name in DEFAULT_FRACTIONS}
+    for name, value in fractions.items():
+        if not 0 <= value <= 1:
+            print(f'Доля {name} должна быть от 0 до 1', file=sys.stderr)
+            return 2
+    write_store(args.path, args.users, args.seed, fractions)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+Вторичные индексы хранилища пользователей: администраторы, заблокированные,
+пользователи без пароля и пользователи по политике пароля
+Запросы "все пользователи, у которых ..." выполняются за время, пропорциональное
+размеру ответа. Индекс сохраняется рядом с хранилищем (ФАЙЛ.idx) и используется
+при чтении, только если построен по той же версии файла.
+"""
+
+import json
+import os
+
+import auth_storage
+
+# Индексируемые признаки: имя -> условие на запись
+ATTRIBUTES = {
+    'admin': lambda user_data: bool(user_data.get('admin')),
+    'blocked': lambda user_data: bool(user_data.get('blocked')),
+    'no_password': lambda user_data: user_data.get('password') == ''
+}
+
+_RULE_FLAGS = (
+    ('require_upper', 'U'),
+    ('require_lower', 'L'),
+    ('require_digit', 'D'),
+    ('require_special', 'S')
+)
+
+
+def policy_id(rules):
+    """Идентификатор политики пароля: '8:ULDS' (длина и требования), '0:-' без ограничений"""
+    rules = rules or {}
+    flags = ''.join(letter for key, letter in _RULE_FLAGS if rules.get(key))
+    return f"{rules.get('min_length', 0)}:{flags or '-'}"
+
+
+def file_key(path):
+    """
+    Версия файла хранилища: по ней построен индекс, по ней же commit и refresh
+    узнают о записи другим процессом. Время изменения может совпасть при записи
+    в пределах разрешения часов файловой системы, а os.replace всегда дает новый inode.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_ino, stat.st_size, stat.st_mtime_ns]
+
+
+class UserIndex:
+    def __init__(self):
+        self.attributes = {name: set() for name in ATTRIBUTES}
+        self.policies = {}     # идентификатор политики -> имена
+        self.policy_of = {}    # имя -> идентификатор политики (для удаления из индекса)
+
+    @classmethod
+    def build(cls, users):
+        index = cls()
+        for username, user_data in users.items():
+            index.add(username, user_data)
+        return index
+
+    def add(self, username, user_data):
+        for name, matches in ATTRIBUTES.items():
+            if matches(user_data):
+                self.attributes[name].add(username)
+        policy = policy_id(user_data.get('password_rules'))
+        self.policies.setdefault(policy, set()).add(username)
+        self.policy_of[username] = policy
+
+    def remove(self, username):
+        for names in self.attributes.values():
+            names.discard(username)
+        policy = self.policy_of.pop(username, None)
+        if policy is not None:
+            names = self.policies[policy]
+            names.discard(username)
+            if not names:
+                del self.policies[policy]
+
+    def update(self, username, user_data):
+        """Переиндексировать запись после изменения (None - запись удалена)"""
+        self.remove(username)
+        if user_data is not None:
+            self.add(username, user_data)
+
+    def find(self, attribute):
+        if attribute not in self.attributes:
+            raise KeyError(attribute)
+        return self.attributes[attribute]
+
+    def with_policy(self, policy):
+        return self.policies.get(policy, set())
+
+    # Хранение рядом с хранилищем
+
+    def save(self, path, key):
+        data = {
+            'store': key,
+            'attributes': {name: sorted(names) for name, names in self.attributes.items()},
+            'policies': {policy: sorted(names) for policy, names in self.policies.items()}
+        }
+        # Индекс может сохранять любой читающий процесс - временный файл у каждого свой
+        temp_path = auth_storage.temp_path_for(path)
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(data, file)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path, key):
+        """Индекс из файла или None, если его нет или он построен по другой версии хранилища"""
+        if key is None:
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if data.get('store') != key or set(data.get('attributes', ())) != set(ATTRIBUTES):
+            return None
+        index = cls()
+        for name, names in data['attributes'].items():
+            index.attributes[name] = set(names)
+        for policy, names in data['policies'].items():
+            index.policies[policy] = set(names)
+            for username in names:
+                index.policy_of[username] = policy
+        return index
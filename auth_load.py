@@ -0,0 +1,236 @@
+"""
+Нагрузочный тест: много процессов входа и одновременные записи администраторов
+
+Процессы входа вызывают AuthService.login (тот же hash_password и та же
+работа с хранилищем, что и в UserAuthApp) и время от времени подхватывают
+изменения файла (refresh). Процессы-писатели меняют учетные записи и сохраняют
+их через commit со сравнением версий.
+
+Каждый писатель отвечает за свое поле (blocked, admin, password_rules) на своей
+части пользователей; части пересекаются между полями, поэтому писатели
+конкурируют за одни и те же записи. По окончании итоговый файл сверяется
+с последним значением, которое записал каждый писатель: расхождение -
+потерянное обновление. Ключ --naive-writers включает прежнюю схему
+(чтение - изменение - запись всего файла) для сравнения.
+
+Пример:
+    python auth_load.py --users 100000 --readers 8 --writers 3 --duration 20
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import auth_bench
+import auth_generate
+import auth_metrics
+import auth_storage
+from auth_service import AuthError, AuthService, read_users
+
+WRITER_FIELDS = ('blocked', 'admin', 'password_rules')
+REFRESH_INTERVAL = 1.0    # как часто процесс входа проверяет изменения файла, секунды
+WRITE_PAUSE = 0.01        # пауза писателя между сохранениями, секунды
+
+
+def reader(path, users, start_at, duration, seed):
+    """Процесс входа; возвращает (задержки входов, число отказов)"""
+    rng = random.Random(seed)
+    service = AuthService(path)
+    service.load()
+    latencies = []
+    denied = 0
+    while time.time() < start_at:
+        time.sleep(0.001)
+    deadline = time.monotonic() + duration
+    next_refresh = time.monotonic() + REFRESH_INTERVAL
+    while time.monotonic() < deadline:
+        username = auth_generate.username_for(rng.randrange(users))
+        begin = time.perf_counter()
+        try:
+            service.login(username, auth_generate.password_for(username))
+        except AuthError:
+            denied += 1  # заблокирован писателем
+        latencies.append(time.perf_counter() - begin)
+        if time.monotonic() >= next_refresh:
+            service.refresh()
+            next_refresh = time.monotonic() + REFRESH_INTERVAL
+    return latencies, denied
+
+
+def field_value(field, rng):
+    if field == 'password_rules':
+        return rng.choice((4, 6, 8, 10, 12))
+    return rng.random() < 0.5
+
+
+def writer(path, number, writers, users, start_at, duration, seed, naive):
+    """
+    Процесс-писатель; возвращает (задержки сохранений, конфликтов полей,
+    {имя: последнее записанное значение}, поле, снимок ожидания блокировки)
+    """
+    auth_metrics.enable()
+    rng = random.Random(seed)
+    field = WRITER_FIELDS[number % len(WRITER_FIELDS)]
+    # Писатели одного поля делят пользователей, писатели разных полей пересекаются
+    same_field = [index for index in range(writers) if index % len(WRITER_FIELDS) == number % len(WRITER_FIELDS)]
+    share = same_field.index(number)
+    targets = [auth_generate.username_for(index) for index in range(share, min(users, 1000), len(same_field))]
+    service = AuthService(path)
+    latencies = []
+    conflicts = 0
+    written = {}
+    while time.time() < start_at:
+        time.sleep(0.001)
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline and targets:
+        username = rng.choice(targets)
+        value = field_value(field, rng)
+        begin = time.perf_counter()
+        if naive:
+            # Прежняя схема: весь файл читается, меняется и записывается целиком
+            users_data = read_users(path)
+            apply_value(users_data[username], field, value)
+            auth_storage.write(users_data, path)
+        else:
+            service.refresh()
+            if field == 'blocked':
+                service.set_blocked(username, value)
+            elif field == 'admin':
+                service.set_admin(username, value)
+            else:
+                service.set_rules(username, {'min_length': value})
+            conflicts += sum(len(fields) for fields in service.commit().values())
+        latencies.append(time.perf_counter() - begin)
+        written[username] = value
+        time.sleep(WRITE_PAUSE)
+    return latencies, conflicts, written, field, auth_metrics.histogram('store_lock_wait').snapshot()
+
+
+def apply_value(user_data, field, value):
+    if field == 'password_rules':
+        user_data['password_rules'] = dict(user_data.get('password_rules') or {}, min_length=value)
+    else:
+        user_data[field] = value
+
+
+def stored_value(user_data, field):
+    if field == 'password_rules':
+        return (user_data.get('password_rules') or {}).get('min_length')
+    return user_data.get(field)
+
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+    return {
+        'count': len(latencies),
+        'p50_ms': round(auth_bench.percentile(latencies, 0.5) * 1000, 3),
+        'p90_ms': round(auth_bench.percentile(latencies, 0.9) * 1000, 3),
+        'p99_ms': round(auth_bench.percentile(latencies, 0.99) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3) if latencies else 0.0
+    }
+
+
+def merge_lock_waits(snapshots):
+    """Общая гистограмма ожидания блокировки по снимкам писателей"""
+    merged = auth_metrics.Histogram()
+    for snapshot in snapshots:
+        previous = 0
+        for index, (_, cumulative) in enumerate(snapshot['buckets']):
+            merged.counts[index] += cumulative - previous
+            previous = cumulative
+        merged.count += snapshot['count']
+        merged.total += snapshot['sum']
+    return merged
+
+
+def run(path, users, readers, writers, duration, seed, naive):
+    start_at = time.time() + 1.0   # общий старт после запуска всех процессов
+    with ProcessPoolExecutor(max_workers=readers + writers) as pool:
+        reader_jobs = [
+            pool.submit(reader, path, users, start_at, duration, seed + number)
+            for number in range(readers)
+        ]
+        writer_jobs = [
+            pool.submit(writer, path, number, writers, users, start_at, duration, seed + 1000 + number, naive)
+            for number in range(writers)
+        ]
+        reader_results = [job.result() for job in reader_jobs]
+        writer_results = [job.result() for job in writer_jobs]
+
+    login_latencies = [value for latencies, _ in reader_results for value in latencies]
+    commit_latencies = [value for result in writer_results for value in result[0]]
+    final = read_users(path)
+    lost = 0
+    for _, _, written, field, _ in writer_results:
+        lost += sum(1 for username, value in written.items() if stored_value(final[username], field) != value)
+    lock_waits = merge_lock_waits(result[4] for result in writer_results)
+    return {
+        'logins': summarize(login_latencies),
+        'logins_per_sec': round(len(login_latencies) / duration, 1),
+        'denied': sum(denied for _, denied in reader_results),
+        'commits': summarize(commit_latencies),
+        'commits_per_sec': round(len(commit_latencies) / duration, 1),
+        'field_conflicts': sum(result[1] for result in writer_results),
+        'lock_waits': {
+            'count': lock_waits.count,
+            'total_ms': round(lock_waits.total * 1000, 3),
+            'p50_ms': round(lock_waits.quantile(0.5) * 1000, 3),
+            'p99_ms': round(lock_waits.quantile(0.99) * 1000, 3)
+        },
+        'lost_updates': lost,
+        'updated_records': sum(len(result[2]) for result in writer_results)
+    }
+
+
+def format_report(report):
+    logins, commits, waits = report['logins'], report['commits'], report['lock_waits']
+    return '\n'.join([
+        f"Входы: {logins['count']} ({report['logins_per_sec']} в секунду), отказов {report['denied']}",
+        f"    p50 {logins['p50_ms']} мс, p90 {logins['p90_ms']} мс, p99 {logins['p99_ms']} мс, "
+        f"макс. {logins['max_ms']} мс",
+        f"Сохранения: {commits['count']} ({report['commits_per_sec']} в секунду), "
+        f"p50 {commits['p50_ms']} мс, p99 {commits['p99_ms']} мс",
+        f"Ожидание блокировки: {waits['count']} раз, всего {waits['total_ms']} мс, "
+        f"p50 до {waits['p50_ms']} мс, p99 до {waits['p99_ms']} мс",
+        f"Конфликтов полей: {report['field_conflicts']}",
+        f"Потерянных обновлений: {report['lost_updates']} из {report['updated_records']} измененных записей"
+    ])
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест входа с одновременной записью')
+    parser.add_argument('--users', type=int, default=100000, help='размер хранилища (по умолчанию 100000)')
+    parser.add_argument('--format', default='.json', choices=auth_storage.EXTENSIONS, help='формат хранилища')
+    parser.add_argument('--readers', type=int, default=os.cpu_count() or 4, help='процессов входа')
+    parser.add_argument('--writers', type=int, default=3, help='процессов-писателей')
+    parser.add_argument('--duration', type=float, default=10.0, help='длительность, секунды')
+    parser.add_argument('--naive-writers', action='store_true',
+                        help='писать без сравнения версий (чтение - изменение - запись файла)')
+    parser.add_argument('--workdir', default=auth_bench.DEFAULT_WORKDIR, help='каталог хранилищ')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help='вывести отчет в JSON')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    os.makedirs(args.workdir, exist_ok=True)
+    source = auth_bench.prepare_store(args.workdir, args.users, args.format, args.seed)
+    # Тест меняет хранилище - работаем с копией
+    path = os.path.join(args.workdir, f'load-{args.users}{args.format}')
+    shutil.copyfile(source, path)
+    report = run(path, args.users, args.readers, args.writers, args.duration, args.seed, args.naive_writers)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=4))
+    else:
+        print(format_report(report))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""
+Профиль памяти хранилища пользователей
+
+Хранилище читается через load_users, как в UserAuthApp. Общий прирост
+удерживаемой памяти замеряется снимками tracemalloc до и после чтения;
+разбивка по структурам - обходом объектов с sys.getsizeof: словари записей,
+словари password_rules, строки хешей, строки имен и ключи полей. Каждый объект
+учитывается один раз (ключи полей у разных записей - общие строки).
+
+Отдельно оценивается компактное представление: запись - кортеж вместо
+словаря, хеш - 32 байта вместо 64 шестнадцатеричных символов, одинаковые
+правила - один общий объект.
+
+Пример:
+    python auth_cli.py --file users.json memory
+"""
+
+import gc
+import json
+import sys
+import tracemalloc
+
+from auth_service import load_users
+
+CATEGORIES = (
+    ('user_dicts', 'словари записей'),
+    ('rules_dicts', 'словари password_rules'),
+    ('hash_strings', 'строки хешей'),
+    ('username_strings', 'строки имен'),
+    ('key_strings', 'ключи полей'),
+    ('other_values', 'прочие значения')
+)
+
+
+class SizeWalker:
+    """Сумма sys.getsizeof по категориям без повторного учета общих объектов"""
+
+    def __init__(self):
+        self.sizes = {name: 0 for name, _ in CATEGORIES}
+        self.seen = set()
+
+    def add(self, category, obj):
+        if id(obj) in self.seen:
+            return
+        self.seen.add(id(obj))
+        self.sizes[category] += sys.getsizeof(obj)
+
+    def walk(self, users):
+        self.add('user_dicts', users)
+        for username, user_data in users.items():
+            self.add('username_strings', username)
+            self.add('user_dicts', user_data)
+            for key, value in user_data.items():
+                self.add('key_strings', key)
+                if key == 'password' and isinstance(value, str):
+                    self.add('hash_strings', value)
+                elif key == 'password_rules' and isinstance(value, dict):
+                    self.add('rules_dicts', value)
+                    for rule_key, rule_value in value.items():
+                        self.add('key_strings', rule_key)
+                        self.add('other_values', rule_value)
+                else:
+                    self.add('other_values', value)
+        return self.sizes
+
+
+def compact_estimate(users):
+    """Оценка размера компактного представления тех же данных, байт"""
+    total = sys.getsizeof(users)
+    hash_bytes = sys.getsizeof(bytes(32))
+    distinct_rules = {}
+    for username, user_data in users.items():
+        total += sys.getsizeof(username) + sys.getsizeof(tuple(user_data))
+        password = user_data.get('password')
+        if isinstance(password, str) and password:
+            total += hash_bytes
+        rules = user_data.get('password_rules')
+        if isinstance(rules, dict):
+            distinct_rules.setdefault(json.dumps(rules, sort_keys=True), sys.getsizeof(rules))
+    return total + sum(distinct_rules.values())
+
+
+def profile(path):
+    """Профиль памяти хранилища: общий прирост, разбивка и стоимость одного пользователя"""
+    gc.collect()
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    users = load_users(path)
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    if not tracing:
+        tracemalloc.stop()
+
+    retained = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    sizes = SizeWalker().walk(users)
+    count = len(users) or 1
+    compact = compact_estimate(users)
+    return {
+        'path': path,
+        'users': len(users),
+        'retained_bytes': retained,
+        'peak_bytes': peak,
+        'per_user_bytes': round(retained / count, 1),
+        'structures': {
+            name: {'bytes': size, 'per_user': round(size / count, 1)}
+            for name, size in sizes.items()
+        },
+        'counted_bytes': sum(sizes.values()),
+        'compact_bytes': compact,
+        'compact_per_user_bytes': round(compact / count, 1)
+    }
+
+
+def mib(size):
+    return f'{size / (1024 * 1024):.1f} МБ'
+
+
+def format_report(report):
+    lines = [
+        f"Хранилище: {report['path']}, пользователей: {report['users']}",
+        f"Удерживается после чтения (tracemalloc): {mib(report['retained_bytes'])}, "
+        f"пик при чтении: {mib(report['peak_bytes'])}",
+        f"На одного пользователя: {report['per_user_bytes']} байт",
+        '',
+        'По структурам (sys.getsizeof):'
+    ]
+    for name, title in CATEGORIES:
+        size = report['structures'][name]
+        lines.append(f"    {title:<24} {mib(size['bytes']):>10}  {size['per_user']:>8} байт на пользователя")
+    saving = report['counted_bytes'] - report['compact_bytes']
+    lines += [
+        f"    {'всего':<24} {mib(report['counted_bytes']):>10}",
+        '',
+        f"Компактное представление (оценка): {mib(report['compact_bytes'])}, "
+        f"{report['compact_per_user_bytes']} байт на пользователя, экономия {mib(max(0, saving))}"
+    ]
+    return '\n'.join(lines)
+
+
+def report_json(report):
+    return json.dumps(report, ensure_ascii=False, indent=4)
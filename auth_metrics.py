@@ -0,0 +1,259 @@
+"""
+Замеры времени операций: гистограммы задержек с фиксированными границами
+и выгрузка в текстовом формате Prometheus и в JSON
+
+По умолчанию замеры выключены: декоратор timed и контекст timer тогда
+сводятся к одной проверке флага. Включение - enable() или переменная
+окружения AUTH_METRICS=префикс_файлов (см. install_from_env; графическим
+приложениям для выгрузки по SIGUSR1 нужен еще wake_qt_on_signals).
+Те же точки замера отдают интервалы в трассировку (auth_trace), если она включена.
+"""
+
+import atexit
+import bisect
+import contextlib
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from functools import wraps
+
+import auth_storage
+
+# Границы корзин, секунды
+BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+METRIC_NAME = 'auth_operation_seconds'
+
+_enabled = False              # включены замеры или трассировка
+_histograms_enabled = False
+_tracer = None                # объект с методами begin(name) и end(name)
+_histograms = {}
+_registry_lock = threading.Lock()
+_NULL_TIMER = contextlib.nullcontext()
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # последняя корзина - +Inf
+        self.total = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            self.counts[index] += 1
+            self.total += seconds
+            self.count += 1
+
+    def quantile(self, q):
+        """Оценка квантиля по верхней границе корзины"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[index] if index < len(self.buckets) else float('inf')
+        return float('inf')
+
+    def snapshot(self):
+        with self.lock:
+            counts = list(self.counts)
+            total, count = self.total, self.count
+        cumulative = []
+        running = 0
+        for bound, value in zip(list(self.buckets) + ['+Inf'], counts):
+            running += value
+            cumulative.append((bound, running))
+        return {'count': count, 'sum': total, 'buckets': cumulative}
+
+
+def _update_enabled():
+    global _enabled
+    _enabled = _histograms_enabled or _tracer is not None
+
+
+def enable():
+    global _histograms_enabled
+    _histograms_enabled = True
+    _update_enabled()
+
+
+def disable():
+    global _histograms_enabled
+    _histograms_enabled = False
+    _update_enabled()
+
+
+def is_enabled():
+    return _histograms_enabled
+
+
+def set_tracer(tracer):
+    """Подключить (или отключить, None) трассировку к точкам замера"""
+    global _tracer
+    _tracer = tracer
+    _update_enabled()
+
+
+def histogram(name):
+    found = _histograms.get(name)
+    if found is None:
+        with _registry_lock:
+            found = _histograms.setdefault(name, Histogram())
+    return found
+
+
+def reset():
+    with _registry_lock:
+        _histograms.clear()
+
+
+class _Timer:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        if _tracer is not None:
+            _tracer.begin(self.name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        if _histograms_enabled:
+            histogram(self.name).observe(elapsed)
+        if _tracer is not None:
+            _tracer.end(self.name)
+        return False
+
+
+def timer(name):
+    """Контекст замера: with timer('login'): ..."""
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(name)
+
+
+def timed(name):
+    """Декоратор замера функции"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Выгрузка
+
+def snapshot():
+    """Состояние всех гистограмм в виде словаря (для JSON)"""
+    result = {}
+    for name, found in sorted(_histograms.items()):
+        data = found.snapshot()
+        data['p50'] = found.quantile(0.5)
+        data['p99'] = found.quantile(0.99)
+        data['buckets'] = {str(bound): count for bound, count in data['buckets']}
+        result[name] = data
+    return result
+
+
+def prometheus_text():
+    lines = [
+        f'# HELP {METRIC_NAME} Время операций системы аутентификации',
+        f'# TYPE {METRIC_NAME} histogram'
+    ]
+    for name, found in sorted(_histograms.items()):
+        data = found.snapshot()
+        for bound, count in data['buckets']:
+            lines.append(f'{METRIC_NAME}_bucket{{op="{name}",le="{bound}"}} {count}')
+        lines.append(f'{METRIC_NAME}_sum{{op="{name}"}} {data["sum"]:.9f}')
+        lines.append(f'{METRIC_NAME}_count{{op="{name}"}} {data["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def _write_atomic(path, text):
+    temp_path = auth_storage.temp_path_for(path)
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        file.write(text)
+    os.replace(temp_path, path)
+
+
+def export(prefix):
+    """Записать ПРЕФИКС.prom и ПРЕФИКС.json"""
+    _write_atomic(prefix + '.prom', prometheus_text())
+    _write_atomic(prefix + '.json', json.dumps(snapshot(), indent=4))
+
+
+def install_from_env(variable='AUTH_METRICS'):
+    """
+    Включить замеры, если задана переменная окружения (значение - префикс файлов).
+    Выгрузка - при завершении процесса и по сигналу SIGUSR1.
+    """
+    prefix = os.environ.get(variable)
+    if not prefix:
+        return None
+    enable()
+    atexit.register(export, prefix)
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: export(prefix))
+    return prefix
+
+
+_qt_wakeup = None  # (читающий сокет, пишущий сокет, QSocketNotifier)
+
+
+def wake_qt_on_signals(app):
+    """
+    Обработчик сигнала Python выполняется, только когда работает интерпретатор,
+    а пока цикл событий Qt простаивает, этого не происходит. Сигнал пишет байт
+    в сокет (signal.set_wakeup_fd), QSocketNotifier будит цикл событий, и
+    обработчик (например, выгрузка по SIGUSR1) выполняется сразу.
+    """
+    global _qt_wakeup
+    from PyQt6.QtCore import QSocketNotifier
+
+    reader, writer = socket.socketpair()
+    reader.setblocking(False)
+    writer.setblocking(False)
+    signal.set_wakeup_fd(writer.fileno())
+    notifier = QSocketNotifier(reader.fileno(), QSocketNotifier.Type.Read, app)
+    # Достаточно вычитать байты: обработчик сигнала выполнится при возврате в Python
+    notifier.activated.connect(lambda *args: reader.recv(64))
+    _qt_wakeup = (reader, writer, notifier)
+    return notifier
+
+
+class StartupProfile:
+    """Длительность этапов запуска (режим --profile-startup графических приложений)"""
+
+    def __init__(self, started=None):
+        self.started = time.perf_counter() if started is None else started
+        self.last = self.started
+        self.marks = []
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.marks.append((name, now - self.last))
+        self.last = now
+
+    def report(self, file=None):
+        file = file or sys.stderr
+        for name, seconds in self.marks:
+            print(f'{name:>16}: {seconds * 1000:8.1f} мс', file=file)
+        print(f"{'итого':>16}: {(self.last - self.started) * 1000:8.1f} мс", file=file)
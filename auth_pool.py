@@ -0,0 +1,139 @@
+"""
+Несколько именованных хранилищ на одном узле (например, по отделам)
+
+Хранилище NAME - файл КАТАЛОГ/NAME.<формат> (каталог - переменная окружения
+AUTH_STORES_DIR, по умолчанию stores; формат - любой из auth_storage, новое
+хранилище создается в .json). Имя default - прежний users.json текущего каталога.
+
+StorePool открывает хранилища по требованию. У каждого свой AuthService:
+свои записи, индексы, ограничитель попыток входа (ФАЙЛ.throttle)
+и свои несохраненные изменения (pending, записываются commit). В памяти
+держится не больше limit хранилищ; при открытии следующего самое давно
+использованное выгружается, а его изменения и состояние ограничителя
+перед этим сохраняются.
+"""
+
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import auth_storage
+from auth_service import USER_DATA_FILE, AuthService
+
+DEFAULT_STORE = 'default'
+STORES_DIR = 'stores'
+DEFAULT_LIMIT = 8
+_NAME = re.compile(r'\w[\w.-]*')
+
+
+def stores_directory(directory=None):
+    return directory or os.environ.get('AUTH_STORES_DIR') or STORES_DIR
+
+
+def store_path(name, directory=None, create=False):
+    """
+    Файл хранилища по имени; ValueError для имени, которое не может быть именем файла.
+    create - создать каталог хранилищ, чтобы в нем можно было записать новое хранилище.
+    """
+    if name is None or name == DEFAULT_STORE:
+        return USER_DATA_FILE
+    if not _NAME.fullmatch(name):
+        raise ValueError(f'Недопустимое имя хранилища: {name!r}')
+    directory = stores_directory(directory)
+    if create:
+        os.makedirs(directory, exist_ok=True)
+    for extension in auth_storage.EXTENSIONS:
+        path = os.path.join(directory, name + extension)
+        if os.path.exists(path):
+            return path
+    return os.path.join(directory, name + '.json')
+
+
+def store_name(path, directory=None):
+    """Имя хранилища по пути файла; None - файл не из каталога хранилищ"""
+    if path == USER_DATA_FILE:
+        return DEFAULT_STORE
+    if os.path.dirname(path) != stores_directory(directory):
+        return None
+    file_name = os.path.basename(path)
+    for extension in auth_storage.EXTENSIONS:
+        if file_name.endswith(extension) and _NAME.fullmatch(file_name[:-len(extension)]):
+            return file_name[:-len(extension)]
+    return None
+
+
+def store_names(directory=None):
+    """Имена существующих хранилищ"""
+    names = {DEFAULT_STORE} if os.path.exists(USER_DATA_FILE) else set()
+    try:
+        files = os.listdir(stores_directory(directory))
+    except FileNotFoundError:
+        files = []
+    for file_name in files:
+        for extension in auth_storage.EXTENSIONS:
+            if file_name.endswith(extension) and _NAME.fullmatch(file_name[:-len(extension)]):
+                names.add(file_name[:-len(extension)])
+    return sorted(names)
+
+
+class StorePool:
+    def __init__(self, limit=DEFAULT_LIMIT, directory=None, factory=None):
+        if limit < 1:
+            raise ValueError('В пуле должно помещаться хотя бы одно хранилище')
+        self.limit = limit
+        self.directory = directory
+        # factory(имя, путь) -> AuthService; по умолчанию - с параметрами по умолчанию
+        self.factory = factory or (lambda name, path: AuthService(path, store=name))
+        # Открытые хранилища от давно использованного к недавнему
+        self.stores = OrderedDict()
+        self.lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, name=DEFAULT_STORE, create=False):
+        """
+        AuthService хранилища; чтение файла (load) - на стороне вызывающего.
+        Открываются только существующие хранилища (иначе ValueError);
+        create - разрешить новое.
+        """
+        name = name or DEFAULT_STORE
+        with self.lock:
+            service = self.stores.get(name)
+            if service is not None:
+                self.stores.move_to_end(name)
+                return service
+            path = store_path(name, self.directory, create=create)
+            if not create and not os.path.exists(path):
+                raise ValueError(f'Хранилище не найдено: {name}')
+            service = self.factory(name, path)
+            self.stores[name] = service
+            while len(self.stores) > self.limit:
+                _, evicted = self.stores.popitem(last=False)
+                self.evictions += 1
+                self._release(evicted)
+            return service
+
+    def __contains__(self, name):
+        return name in self.stores
+
+    def resident(self):
+        """Имена хранилищ, которые сейчас в памяти"""
+        with self.lock:
+            return list(self.stores)
+
+    def services(self):
+        with self.lock:
+            return list(self.stores.values())
+
+    def _release(self, service):
+        if service.dirty:
+            service.commit()
+        if service.throttle is not None:
+            service.throttle.snapshot()
+
+    def close(self):
+        """Сохранить изменения всех открытых хранилищ и выгрузить их"""
+        with self.lock:
+            while self.stores:
+                _, service = self.stores.popitem(last=False)
+                self._release(service)
@@ -0,0 +1,318 @@
+"""
+Локальный сервер аутентификации на asyncio
+Другие процессы на этой машине проверяют вход по той же базе users.json
+
+Протокол: по одному JSON-объекту на строку в обе стороны.
+    запрос:  {"id": 1, "op": "login", "username": "ivan", "password": "..."}
+    ответ:   {"id": 1, "ok": true, "status": "ok"}
+    ошибка:  {"id": 1, "ok": false, "error": "Неверное имя пользователя или пароль!", "code": "denied"}
+    коды ошибок: denied, throttled (с полем retry_after), bad_request, internal
+Неизвестное имя, неверный пароль, заблокированная учетная запись и запись
+без пароля (его задают в программе) дают один и тот же ответ denied (причина записывается только в журнал аудита).
+Операции: login (синоним verify), ping, metrics (гистограммы задержек, если включены).
+Необязательное поле "store" выбирает именованное хранилище (auth_pool); без него -
+хранилище сервера (--file или --store). Открываются только существующие
+именованные хранилища (неизвестное имя - bad_request), по требованию;
+в памяти держится не больше --max-stores.
+Запросы можно отправлять пачкой, не дожидаясь ответов (конвейер);
+ответы приходят по мере готовности, сопоставляются по id.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from auth_service import (
+    USER_DATA_FILE, AuthError, BlockedUserError, InvalidPasswordError, SetupRequiredError,
+    StoreCorruptError, UnknownUserError, AuthService, hash_password
+)
+from auth_index import file_key
+from auth_pool import DEFAULT_LIMIT, StorePool, store_name, store_path
+from auth_throttle import LoginThrottle, ThrottledError
+from auth_audit import AuditLog
+import auth_metrics
+
+# Ограничение одновременно обрабатываемых запросов одного соединения
+MAX_IN_FLIGHT = 256
+# Единый ответ на отказ во входе: по нему не узнать, существует ли пользователь
+LOGIN_DENIED = 'Неверное имя пользователя или пароль!'
+# Как часто проверять, не изменился ли файл хранилища (секунды)
+RELOAD_CHECK_INTERVAL = 1.0
+
+
+class AuthServer:
+    """Держит хранилище в памяти и отвечает на запросы проверки входа"""
+
+    def __init__(self, service, executor=None, pool=None):
+        self.service = service
+        self.executor = executor
+        # Именованные хранилища (поле "store" запроса), необязательно
+        self.pool = pool
+        # Путь хранилища -> версия файла при чтении (auth_index.file_key) и время последней проверки
+        self.store_versions = {}
+        self.reload_checks = {}
+        # Путь хранилища -> выполняющееся в потоке чтение файла
+        self.reloads = {}
+        self.requests = 0
+        self.reload(service)
+
+    def reload(self, service):
+        self.store_versions[service.path] = file_key(service.path)
+        service.load()
+
+    async def reload_in_thread(self, service):
+        """
+        Чтение хранилища вне цикла событий. Пока оно идет, остальные запросы
+        обслуживаются по прежним данным; новое состояние применяется в цикле
+        событий целиком, между запросами. Одновременные вызовы ждут одно чтение.
+        """
+        reload = self.reloads.get(service.path)
+        if reload is None:
+            reload = asyncio.ensure_future(self._reload(service))
+            self.reloads[service.path] = reload
+            reload.add_done_callback(lambda _: self.reloads.pop(service.path, None))
+        await asyncio.shield(reload)
+
+    async def _reload(self, service):
+        self.store_versions[service.path] = file_key(service.path)
+        # Не в executor: он может быть пулом процессов
+        state = await asyncio.get_running_loop().run_in_executor(None, service.read_state)
+        service.apply_state(state)
+
+    async def reload_if_changed(self, service):
+        """Перечитать хранилище, если файл изменили другие процессы"""
+        now = time.monotonic()
+        if now - self.reload_checks.get(service.path, 0.0) < RELOAD_CHECK_INTERVAL:
+            return
+        self.reload_checks[service.path] = now
+        if file_key(service.path) != self.store_versions.get(service.path):
+            try:
+                await self.reload_in_thread(service)
+            except StoreCorruptError as error:
+                # Испорченный файл не заменяет прочитанное раньше
+                print(f'{error}; используются прежние данные', file=sys.stderr)
+
+    async def service_for(self, store):
+        """Хранилище запроса: свое хранилище сервера или именованное из пула"""
+        if store is None:
+            return self.service
+        if self.pool is None:
+            raise ValueError('Сервер запущен без именованных хранилищ')
+        if not isinstance(store, str):
+            raise ValueError('Имя хранилища должно быть строкой')
+        if store_path(store) == self.service.path:
+            return self.service
+        # Только существующие хранилища: запрос не может создать новое
+        service = self.pool.get(store)
+        if service.users is None:
+            # Открыто впервые или заново после выгрузки из пула
+            await self.reload_in_thread(service)
+        return service
+
+    async def login(self, username, password, source, service=None):
+        service = service or self.service
+        await self.reload_if_changed(service)
+        loop = asyncio.get_running_loop()
+        # Отказы ограничителя отсекаются до хеширования
+        try:
+            user = service.begin_login(username, source)
+        except (UnknownUserError, BlockedUserError):
+            # Любой отказ после ограничителя хешируется так же, как проверка пароля:
+            # время ответа одинаково
+            await loop.run_in_executor(self.executor, hash_password, password)
+            raise
+        # Хеширование выполняется вне цикла событий, в том числе для записи без пароля
+        password_hash = await loop.run_in_executor(self.executor, hash_password, password)
+        # Запись без пароля - отказ: задать пароль через сервер нельзя
+        return service.finish_login(username, user, password_hash, source, allow_setup=False)
+
+    async def handle_request(self, request, source):
+        self.requests += 1
+        op = request.get('op')
+        if op in ('login', 'verify'):
+            username, password = request.get('username', ''), request.get('password', '')
+            if not isinstance(username, str) or not isinstance(password, str):
+                raise ValueError('Имя пользователя и пароль должны быть строками')
+            service = await self.service_for(request.get('store'))
+            status = await self.login(username, password, source, service)
+            return {'ok': True, 'status': status}
+        if op == 'ping':
+            return {'ok': True, 'status': 'pong'}
+        if op == 'metrics':
+            return {'ok': True, 'metrics': auth_metrics.snapshot()}
+        raise ValueError(f'Неизвестная операция: {op}')
+
+    async def respond(self, line, source, writer, write_lock, slots):
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError('Запрос должен быть JSON-объектом')
+            request_id = request.get('id')
+            response = await self.handle_request(request, source)
+        except ThrottledError as error:
+            response = {'ok': False, 'error': str(error), 'code': 'throttled',
+                        'retry_after': round(error.retry_after, 1)}
+        except (InvalidPasswordError, UnknownUserError, BlockedUserError, SetupRequiredError):
+            response = {'ok': False, 'error': LOGIN_DENIED, 'code': 'denied'}
+        except AuthError as error:
+            response = {'ok': False, 'error': str(error), 'code': 'denied'}
+        except ValueError as error:
+            response = {'ok': False, 'error': str(error), 'code': 'bad_request'}
+        except Exception as error:
+            # Ответ получает каждый запрос, даже при ошибке в самом сервере
+            print(f'Ошибка обработки запроса: {error!r}', file=sys.stderr)
+            response = {'ok': False, 'error': 'Внутренняя ошибка сервера', 'code': 'internal'}
+        finally:
+            slots.release()
+        response['id'] = request_id
+        async with write_lock:
+            writer.write(json.dumps(response, ensure_ascii=False).encode() + b'\n')
+            await writer.drain()
+
+    async def handle_client(self, reader, writer):
+        write_lock = asyncio.Lock()
+        slots = asyncio.Semaphore(MAX_IN_FLIGHT)
+        tasks = set()
+        source = client_source(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                await slots.acquire()
+                task = asyncio.create_task(self.respond(line, source, writer, write_lock, slots))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, socket_path=None, host='127.0.0.1', port=8765, metrics_prefix=None):
+        if metrics_prefix and hasattr(signal, 'SIGUSR1'):
+            # Выгрузка метрик по запросу: kill -USR1 <pid>
+            asyncio.get_running_loop().add_signal_handler(
+                signal.SIGUSR1, auth_metrics.export, metrics_prefix
+            )
+        if socket_path:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            server = await asyncio.start_unix_server(self.handle_client, path=socket_path)
+            address = socket_path
+        else:
+            server = await asyncio.start_server(self.handle_client, host, port)
+            address = f'{host}:{port}'
+        print(f'Сервер аутентификации слушает {address}', file=sys.stderr)
+        snapshots = asyncio.create_task(self.snapshot_throttle())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            snapshots.cancel()
+            if self.service.throttle is not None:
+                self.service.throttle.snapshot()
+            if self.pool is not None:
+                self.pool.close()
+
+    def throttles(self):
+        services = [self.service] + (self.pool.services() if self.pool is not None else [])
+        return [service.throttle for service in services if service.throttle is not None]
+
+    async def snapshot_throttle(self):
+        """Периодическое сохранение состояния ограничителей всех открытых хранилищ"""
+        throttles = self.throttles()
+        if not throttles:
+            return
+        interval = min(throttle.snapshot_interval for throttle in throttles)
+        while True:
+            await asyncio.sleep(interval)
+            for throttle in self.throttles():
+                throttle.maybe_snapshot()
+
+
+def client_source(writer):
+    """Идентификатор источника запросов: IP-адрес или uid процесса на Unix-сокете"""
+    peer = writer.get_extra_info('peername')
+    if isinstance(peer, tuple) and peer:
+        return peer[0]
+    sock = writer.get_extra_info('socket')
+    try:
+        credentials = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+        _, uid, _ = struct.unpack('3i', credentials)
+        return f'uid{uid}'
+    except (AttributeError, OSError):
+        return 'unix'
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Локальный сервер проверки входа')
+    store = parser.add_mutually_exclusive_group()
+    store.add_argument('--file', default=USER_DATA_FILE, help='файл хранилища (по умолчанию users.json)')
+    store.add_argument('--store', help='именованное хранилище (см. auth_pool) вместо --file')
+    parser.add_argument('--max-stores', type=int, default=DEFAULT_LIMIT,
+                        help=f'именованных хранилищ в памяти одновременно (по умолчанию {DEFAULT_LIMIT})')
+    parser.add_argument('--socket', help='путь к Unix-сокету (иначе TCP на localhost)')
+    parser.add_argument('--host', default='127.0.0.1', help='адрес TCP (по умолчанию 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='порт TCP (по умолчанию 8765)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='число потоков/процессов для хеширования')
+    parser.add_argument('--processes', action='store_true',
+                        help='хешировать в пуле процессов вместо потоков')
+    parser.add_argument('--throttle-file', help='файл состояния ограничителя (по умолчанию ФАЙЛ.throttle)')
+    parser.add_argument('--audit-log', help='писать события входа в журнал аудита (JSONL)')
+    parser.add_argument('--metrics', metavar='ПРЕФИКС',
+                        help='замерять время операций; выгрузка в ПРЕФИКС.prom/.json по SIGUSR1 и при остановке')
+    parser.add_argument('--no-throttle', action='store_true', help='не ограничивать частоту попыток входа')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.store:
+        try:
+            args.file = store_path(args.store)
+        except ValueError as error:
+            print(error, file=sys.stderr)
+            return 2
+    if args.metrics:
+        auth_metrics.enable()
+    pool_class = ProcessPoolExecutor if args.processes else ThreadPoolExecutor
+    with pool_class(max_workers=args.workers) as executor:
+        throttle = None
+        if not args.no_throttle:
+            throttle = LoginThrottle(args.throttle_file or args.file + '.throttle')
+        audit = AuditLog(args.audit_log) if args.audit_log else None
+
+        def open_store(name, path):
+            # У каждого хранилища свой ограничитель; журнал аудита общий
+            store_throttle = None if args.no_throttle else LoginThrottle(path + '.throttle')
+            return AuthService(path, throttle=store_throttle, audit=audit, store=name)
+
+        server = AuthServer(
+            AuthService(args.file, throttle=throttle, audit=audit, store=store_name(args.file)), executor,
+            StorePool(args.max_stores, factory=open_store)
+        )
+        try:
+            asyncio.run(server.serve(args.socket, args.host, args.port, args.metrics))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if args.metrics:
+                auth_metrics.export(args.metrics)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,659 @@
+"""
+Ядро системы аутентификации без зависимости от Qt
+Используется графическими приложениями (a.py, abm.py) и консольной утилитой auth_cli.py
+"""
+
+import copy
+import hashlib
+import json
+import os
+import re
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка при записи не используется
+    fcntl = None
+
+import auth_storage
+from auth_index import UserIndex, file_key
+from auth_metrics import timed, timer
+
+# Константы
+USER_DATA_FILE = 'users.json'
+ADMIN_USERNAME = 'admin'
+
+# Строгие правила пароля (администратор по умолчанию)
+STRICT_RULES = {
+    'min_length': 8,
+    'require_upper': True,
+    'require_lower': True,
+    'require_digit': True,
+    'require_special': True
+}
+
+# Правила без ограничений (новый пользователь)
+EMPTY_RULES = {
+    'min_length': 0,
+    'require_upper': False,
+    'require_lower': False,
+    'require_digit': False,
+    'require_special': False
+}
+
+# Правила, которые применяются, если у пользователя они не заданы
+DEFAULT_RULES = dict(EMPTY_RULES, min_length=6)
+
+# Результаты успешной проверки входа
+LOGIN_OK = 'ok'
+LOGIN_SETUP = 'setup'  # пароль еще не задан, его нужно установить
+
+
+class AuthError(Exception):
+    """Ошибка операции с учетными записями (текст можно показывать пользователю)"""
+    reason = 'denied'  # причина отказа для журнала аудита
+
+
+class InvalidPasswordError(AuthError):
+    """Неверный пароль при входе"""
+    reason = 'bad_password'
+
+
+class UnknownUserError(AuthError):
+    """Пользователь не найден"""
+    reason = 'unknown_user'
+
+
+class BlockedUserError(AuthError):
+    """Учетная запись заблокирована"""
+    reason = 'blocked'
+
+
+class SetupRequiredError(AuthError):
+    """Пароль учетной записи не задан, а установить его при этом входе нельзя"""
+    reason = 'setup_required'
+
+
+class StoreCorruptError(AuthError):
+    """Файл хранилища есть, но не читается: заменять его хранилищем по умолчанию нельзя"""
+
+
+def new_user_record(admin=False, rules=None, password=''):
+    """Запись нового пользователя в формате users.json"""
+    return {
+        'password': password,
+        'admin': admin,
+        'blocked': False,
+        'password_rules': dict(rules if rules is not None else EMPTY_RULES),
+        'version': 0
+    }
+
+
+def default_users():
+    """Хранилище с одним администратором без пароля"""
+    return {ADMIN_USERNAME: new_user_record(admin=True, rules=STRICT_RULES)}
+
+
+def normalize_record(user_data):
+    """Приведение записи старого формата (password_rules: bool из 3/1.py) к текущему"""
+    if isinstance(user_data.get('password_rules'), bool):
+        user_data['password_rules'] = dict(
+            EMPTY_RULES,
+            min_length=6 if user_data['password_rules'] else 0
+        )
+    # Версия записи появилась вместе с совместной записью из нескольких экземпляров
+    user_data.setdefault('version', 0)
+    return user_data
+
+
+def read_users(path=USER_DATA_FILE, on_corrupt=None):
+    """
+    Чтение хранилища (формат - по расширению, см. auth_storage);
+    ошибки чтения и разбора передаются вызывающему.
+    on_corrupt(номер, смещение, строка) получает испорченные записи формата .rec.
+    """
+    users = auth_storage.read(path, on_corrupt)
+    # Для совместимости со старой версией
+    for user_data in users.values():
+        normalize_record(user_data)
+    return users
+
+
+@timed('load_users')
+def load_users(path=USER_DATA_FILE, on_corrupt=None):
+    """
+    Чтение хранилища; при отсутствии файла - хранилище по умолчанию.
+    Существующий файл, который не удалось прочитать, - StoreCorruptError:
+    иначе следующий commit записал бы поверх него хранилище по умолчанию.
+    """
+    if not os.path.exists(path):
+        return default_users()
+    try:
+        return read_users(path, on_corrupt)
+    except Exception as error:
+        raise StoreCorruptError(f'Не удалось прочитать хранилище {path}: {error}') from error
+
+
+@timed('save_users')
+def save_users(users, path=USER_DATA_FILE):
+    """
+    Запись хранилища через временный файл: другие экземпляры программы,
+    следящие за файлом, никогда не видят его наполовину записанным
+    """
+    auth_storage.write(users, path)
+
+
+class StoreLock:
+    """
+    Короткая блокировка файла хранилища (ФАЙЛ.lock) на время сравнения и замены в commit.
+    Чтение хранилища ее не берет.
+    """
+
+    def __init__(self, path):
+        self.path = path + '.lock'
+        self.file = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self.file = open(self.path, 'a')
+            # Ожидание блокировки - мера конкуренции писателей
+            with timer('store_lock_wait'):
+                fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.file is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+            self.file = None
+        return False
+
+
+def merge_record(base, ours, theirs):
+    """
+    Трехстороннее слияние записи по полям: base - запись до наших изменений,
+    ours - наша, theirs - записанная другим процессом.
+    Возвращает (запись, поля, измененные обеими сторонами по-разному); в них остается наше значение.
+    """
+    base = base or {}
+    merged = dict(theirs)
+    conflicts = []
+    for key in set(ours) | set(theirs):
+        if key == 'version' or ours.get(key) == base.get(key):
+            continue
+        if key in theirs and theirs[key] != base.get(key) and theirs[key] != ours.get(key):
+            conflicts.append(key)
+        if key in ours:
+            merged[key] = ours[key]
+    return merged, sorted(conflicts)
+
+
+def record_fingerprint(user_data):
+    """Отпечаток содержимого записи для поиска изменившихся записей"""
+    return zlib.crc32(json.dumps(user_data, sort_keys=True).encode())
+
+
+@timed('hash_password')
+def hash_password(password):
+    return hashlib.sha256(password.encode()).hexdigest()
+
+
+def check_password_rules(password, rules):
+    """Проверка пароля по правилам; возвращает текст ошибки или None"""
+    # Проверка минимальной длины
+    if rules['min_length'] > 0 and len(password) < rules['min_length']:
+        return f"Пароль должен быть не менее {rules['min_length']} символов!"
+
+    # Проверка на заглавные буквы
+    if rules['require_upper'] and not re.search(r'[A-ZА-Я]', password):
+        return "Пароль должен содержать хотя бы одну заглавную букву!"
+
+    # Проверка на строчные буквы
+    if rules['require_lower'] and not re.search(r'[a-zа-я]', password):
+        return "Пароль должен содержать хотя бы одну строчную букву!"
+
+    # Проверка на цифры
+    if rules['require_digit'] and not re.search(r'[0-9]', password):
+        return "Пароль должен содержать хотя бы одну цифру!"
+
+    # Проверка на спецсимволы
+    if rules['require_special'] and not re.search(r'[!@#$%^&*(),.?":{}|<>]', password):
+        return "Пароль должен содержать хотя бы один спецсимвол!"
+
+    return None
+
+
+class AuthService:
+    """
+    Операции над учетными записями без интерфейса.
+    Хранилище читается один раз (load) и записывается один раз (commit),
+    поэтому между ними можно выполнить сколько угодно операций.
+    """
+
+    def __init__(self, path=USER_DATA_FILE, admin_rules=None, default_rules=None, admin_setup_rules=None,
+                 throttle=None, audit=None, store=None):
+        self.path = path
+        # Ограничитель попыток входа (auth_throttle.LoginThrottle), необязателен
+        self.throttle = throttle
+        # Журнал аудита (auth_audit.AuditLog) и автор административных действий
+        self.audit = audit
+        self.actor = None
+        # Имя хранилища (auth_pool) в событиях журнала: у разных хранилищ могут быть одинаковые имена
+        self.store = store
+        # Правила, сохраняемые в записи администратора
+        self.admin_rules = dict(admin_rules if admin_rules is not None else STRICT_RULES)
+        # Правила, по которым проверяется первый пароль администратора
+        self.admin_setup_rules = dict(admin_setup_rules if admin_setup_rules is not None else self.admin_rules)
+        self.default_rules = dict(default_rules if default_rules is not None else DEFAULT_RULES)
+        self.users = None
+        self.dirty = False
+        # Версия файла (auth_index.file_key), по которой прочитаны записи
+        self.loaded_version = None
+        # Отпечатки записей в том виде, в каком они лежат в файле (см. refresh);
+        # заполняются лениво, записи, измененные здесь, из кэша удаляются
+        self.fingerprints = {}
+        # Записи, измененные после чтения: имя -> копия записи до изменений (None - новая)
+        self.pending = {}
+        # События журнала аудита об этих изменениях: (событие, поля), записываются в commit
+        self.pending_events = []
+        # Вторичные индексы (auth_index), строятся или читаются из ФАЙЛ.idx при первом запросе
+        self.index_path = path + '.idx'
+        self._index = None
+        # Испорченные записи, пропущенные при чтении (формат .rec); при commit
+        # они переносятся в ФАЙЛ.quarantine, остальные записи не затрагиваются
+        self.corrupt_records = []
+
+    # Работа с хранилищем
+
+    def _file_version(self):
+        return file_key(self.path)
+
+    def load(self):
+        """Прочитать хранилище заново; при StoreCorruptError прежнее состояние не меняется"""
+        return self.apply_state(self.read_state())
+
+    def read_state(self):
+        """
+        Чтение хранилища без изменения этого объекта: (версия файла, записи, испорченные записи).
+        Можно выполнять в другом потоке, а результат применить apply_state там, где
+        обслуживаются запросы, - тогда они видят либо прежнее состояние, либо новое целиком.
+        """
+        file_version = self._file_version()
+        corrupt_records = []
+        users = load_users(self.path, lambda *item: corrupt_records.append(item))
+        return file_version, users, corrupt_records
+
+    def apply_state(self, state):
+        self.loaded_version, self.users, self.corrupt_records = state
+        if self.corrupt_records:
+            self._audit('store_corrupt', records=len(self.corrupt_records))
+        self.fingerprints = {}
+        self.pending = {}
+        self.pending_events = []
+        self._index = None
+        self.dirty = False
+        return self.users
+
+    def refresh(self):
+        """
+        Применить изменения файла, сделанные другими процессами, только к изменившимся записям.
+        Возвращает (добавленные, измененные, удаленные) имена.
+        Несохраненные изменения этого экземпляра не перезаписываются: пока они есть,
+        файл не перечитывается.
+        """
+        if self.users is None:
+            self.load()
+            return sorted(self.users), [], []
+        file_version = self._file_version()
+        if self.dirty or file_version == self.loaded_version:
+            return [], [], []
+        corrupt = []
+        try:
+            fresh = read_users(self.path, lambda *item: corrupt.append(item))
+        except (OSError, ValueError):
+            # Файл удален или недоступен - оставляем то, что уже прочитано
+            return [], [], []
+
+        users = self.users
+        fingerprints = self.fingerprints
+        added, changed = [], []
+        for username, user_data in fresh.items():
+            fingerprint = record_fingerprint(user_data)
+            if username not in users:
+                added.append(username)
+            else:
+                known = fingerprints.get(username)
+                if known is None:
+                    known = record_fingerprint(users[username])
+                if known == fingerprint:
+                    fingerprints[username] = fingerprint
+                    continue
+                changed.append(username)
+            users[username] = user_data
+            fingerprints[username] = fingerprint
+            self._reindex(username)
+        # Запись с испорченной строкой не удалена: остается прочитанная раньше,
+        # а строка переносится в карантин при следующем commit
+        self.corrupt_records = corrupt
+        if corrupt:
+            self._audit('store_corrupt', records=len(corrupt))
+        damaged = {auth_storage.corrupt_record_name(line) for _, _, line in corrupt}
+        if None in damaged:
+            # Имя одной из испорченных записей не восстановить - удаленные не определить
+            removed = []
+        else:
+            removed = [username for username in users if username not in fresh and username not in damaged]
+        for username in removed:
+            del users[username]
+            fingerprints.pop(username, None)
+            self._reindex(username)
+        self.loaded_version = file_version
+        return added, changed, removed
+
+    def commit(self):
+        """
+        Сохранить изменения (сравнение с заменой по версиям записей).
+        Если после чтения файл записал другой процесс, он перечитывается и в него
+        вносятся только наши записи; записи, которые изменили обе стороны,
+        сливаются по полям. Возвращает {имя: [поля]} полей, измененных обеими
+        сторонами по-разному (в них сохранено наше значение).
+        """
+        if not self.dirty:
+            return {}
+        users = self.get_users()
+        conflicts = {}
+        with StoreLock(self.path):
+            file_version = self._file_version()
+            if file_version is not None and file_version != self.loaded_version:
+                corrupt = []
+                try:
+                    current = read_users(self.path, lambda *item: corrupt.append(item))
+                except (OSError, ValueError):
+                    # Файл поврежден - записываем свое состояние целиком
+                    current = None
+                if current is not None:
+                    self.corrupt_records = corrupt
+                    conflicts = self._merge_into(current)
+                    users = self.users = current
+                    # Записи заменены содержимым файла - прежние отпечатки не годятся
+                    self.fingerprints = {}
+                    self._index = None
+            for username in self.pending:
+                users[username]['version'] += 1
+            auth_storage.quarantine(self.path, self.corrupt_records)
+            self.corrupt_records = []
+            save_users(users, self.path)
+            self.loaded_version = self._file_version()
+            if self._index is not None:
+                try:
+                    self._index.save(self.index_path, self.loaded_version)
+                except OSError:
+                    pass  # хранилище уже записано; устаревший ФАЙЛ.idx не подойдет по версии
+        # Отпечатки измененных записей удалены еще в _edit, остальные записаны без изменений
+        self.pending = {}
+        self.dirty = False
+        for event, fields in self.pending_events:
+            self.audit.log(event, **fields)
+        self.pending_events = []
+        return conflicts
+
+    def _merge_into(self, current):
+        """Перенести наши изменения в свежее содержимое файла"""
+        conflicts = {}
+        for username, base in self.pending.items():
+            ours = self.users[username]
+            theirs = current.get(username)
+            base_version = base['version'] if base is not None else None
+            if theirs is None or theirs['version'] == base_version:
+                # Запись никто не трогал - версия совпала
+                current[username] = ours
+                continue
+            merged, fields = merge_record(base, ours, theirs)
+            merged['version'] = theirs['version']
+            current[username] = merged
+            if fields:
+                conflicts[username] = fields
+        return conflicts
+
+    def get_users(self):
+        if self.users is None:
+            self.load()
+        return self.users
+
+    def has_user(self, username):
+        return username in self.get_users()
+
+    def get_user(self, username):
+        users = self.get_users()
+        if username not in users:
+            raise UnknownUserError('Пользователь не найден!')
+        return users[username]
+
+    # Вторичные индексы
+
+    @property
+    def index(self):
+        if self._index is None:
+            users = self.get_users()
+            key = file_key(self.path)
+            index = None
+            fresh = not self.dirty and key is not None and key == self.loaded_version
+            if fresh:
+                index = UserIndex.load(self.index_path, key)
+            if index is None:
+                index = UserIndex.build(users)
+                if fresh:
+                    try:
+                        index.save(self.index_path, key)
+                    except OSError:
+                        pass  # каталог только для чтения - индекс живет в памяти
+            self._index = index
+        return self._index
+
+    def _reindex(self, username):
+        if self._index is not None:
+            self._index.update(username, self.users.get(username))
+
+    def find_users(self, attribute):
+        """Имена пользователей с признаком: 'admin', 'blocked' или 'no_password'"""
+        return sorted(self.index.find(attribute))
+
+    def users_with_policy(self, policy):
+        """Имена пользователей с политикой пароля (идентификатор auth_index.policy_id)"""
+        return sorted(self.index.with_policy(policy))
+
+    def policies(self):
+        """Политики пароля и число пользователей с каждой"""
+        return {policy: len(names) for policy, names in sorted(self.index.policies.items())}
+
+    def rules_for(self, username):
+        return self.get_user(username).get('password_rules') or self.default_rules
+
+    def _edit(self, username, new=False):
+        """
+        Запись, которую собираются изменить: ее исходный вид запоминается
+        для слияния в commit. new=True - записи еще может не быть (она создается заново).
+        """
+        if new:
+            user = self.get_users().get(username)
+        else:
+            user = self.get_user(username)
+        if username not in self.pending:
+            self.pending[username] = copy.deepcopy(user)
+        self.fingerprints.pop(username, None)
+        self.dirty = True
+        return user
+
+    def _update(self, username, **fields):
+        """Изменить поля записи с учетом для commit и индексов"""
+        user = self._edit(username)
+        user.update(fields)
+        self._reindex(username)
+        return user
+
+    def _audit_fields(self, fields):
+        if self.actor is not None:
+            fields['actor'] = self.actor
+        if self.store is not None:
+            fields['store'] = self.store
+        return fields
+
+    def _audit(self, event, **fields):
+        if self.audit is not None:
+            self.audit.log(event, **self._audit_fields(fields))
+
+    def _audit_change(self, event, **fields):
+        """Событие изменения записей: попадает в журнал при commit, несохраненное - не попадает"""
+        if self.audit is not None:
+            self.pending_events.append((event, self._audit_fields(fields)))
+
+    # Вход и пароли
+
+    def needs_admin_password(self):
+        users = self.get_users()
+        return ADMIN_USERNAME not in users or users[ADMIN_USERNAME]['password'] == ''
+
+    def _throttle_keys(self, username, source):
+        keys = [f'user:{username}']
+        if source:
+            keys.append(f'src:{source}')
+        return keys
+
+    def begin_login(self, username, source=None):
+        """Проверки входа, не требующие хеширования; возвращает запись пользователя"""
+        try:
+            # Ограничитель отвечает раньше всех остальных проверок
+            if self.throttle is not None:
+                self.throttle.acquire(self._throttle_keys(username, source))
+
+            if not username:
+                raise AuthError('Введите имя пользователя!')
+
+            # Неизвестное имя отклоняется поиском в словаре записей, без чтения хранилища
+            user = self.get_user(username)
+            if user['blocked']:
+                raise BlockedUserError('Ваш аккаунт заблокирован!')
+            return user
+        except AuthError as error:
+            self._audit_login_failure(username, source, error)
+            raise
+
+    def finish_login(self, username, user, password_hash, source=None, allow_setup=True):
+        """
+        Сравнение хеша введенного пароля с сохраненным.
+        allow_setup=False - вход в запись без пароля (LOGIN_SETUP) считается отказом:
+        тот, кто входит, не может сразу задать пароль (например, через сервер).
+        """
+        error = None
+        if user['password'] == '':
+            if not allow_setup:
+                error = SetupRequiredError('Пароль не задан!')
+        elif user['password'] != password_hash:
+            error = InvalidPasswordError('Неверный пароль!')
+        if error is not None:
+            self._audit_login_failure(username, source, error)
+            raise error
+        if self.throttle is not None:
+            self.throttle.success(self._throttle_keys(username, source))
+        status = LOGIN_OK if user['password'] else LOGIN_SETUP
+        self._audit('login_ok', user=username, source=source, status=status)
+        return status
+
+    def _audit_login_failure(self, username, source, error):
+        if self.audit is None:
+            return
+        if getattr(error, 'started', False):
+            # Эта попытка включила блокировку ограничителем
+            self._audit('lockout', user=username, source=source, retry_after=round(error.retry_after, 1))
+        else:
+            self._audit('login_failed', user=username, source=source, reason=error.reason)
+
+    @timed('login')
+    def login(self, username, password, source=None):
+        """Проверка входа; возвращает LOGIN_OK или LOGIN_SETUP, при ошибке - AuthError"""
+        try:
+            user = self.begin_login(username, source)
+        except (UnknownUserError, BlockedUserError):
+            # Хеширование при любом отказе после ограничителя: время ответа
+            # не выдает, есть ли учетная запись и в каком она состоянии
+            hash_password(password)
+            raise
+
+        # Хешируется и для записи без пароля, хотя сравнивать не с чем
+        password_hash = hash_password(password)
+        return self.finish_login(username, user, password_hash, source)
+
+    def remaining_attempts(self, username, source=None):
+        if self.throttle is None:
+            return None
+        return self.throttle.remaining(self._throttle_keys(username, source))
+
+    def verify_password(self, username, password):
+        return self.get_user(username)['password'] == hash_password(password)
+
+    def set_password(self, username, password):
+        self.get_user(username)
+        if not password:
+            raise AuthError('Пароль не может быть пустым!')
+        error = check_password_rules(password, self.rules_for(username))
+        if error:
+            raise AuthError(error)
+        self._update(username, password=hash_password(password))
+        self._audit_change('password_set', user=username)
+
+    def change_password(self, username, old_password, new_password):
+        if not self.verify_password(username, old_password):
+            raise AuthError('Неверный старый пароль!')
+        self.set_password(username, new_password)
+
+    def set_admin_password(self, password):
+        """Первичная установка пароля администратора"""
+        if not password:
+            raise AuthError('Пароль не может быть пустым!')
+        error = check_password_rules(password, self.admin_setup_rules)
+        if error:
+            raise AuthError(error)
+        previous = self._edit(ADMIN_USERNAME, new=True)
+        record = new_user_record(admin=True, rules=self.admin_rules, password=hash_password(password))
+        if previous is not None:
+            record['version'] = previous['version']
+        self.get_users()[ADMIN_USERNAME] = record
+        self._reindex(ADMIN_USERNAME)
+        self._audit_change('admin_password_set', user=ADMIN_USERNAME)
+
+    # Администрирование
+
+    def add_user(self, username):
+        if not username or not username.strip():
+            raise AuthError('Имя пользователя не может быть пустым!')
+        users = self.get_users()
+        if username in users:
+            raise AuthError('Пользователь уже существует!')
+        self._edit(username, new=True)
+        users[username] = new_user_record()
+        self._reindex(username)
+        self._audit_change('user_added', user=username)
+
+    def set_blocked(self, username, block):
+        self._update(username, blocked=block)
+        self._audit_change('user_blocked' if block else 'user_unblocked', user=username)
+
+    def set_admin(self, username, admin=True):
+        self._update(username, admin=admin)
+        self._audit_change('admin_granted' if admin else 'admin_revoked', user=username)
+
+    def set_rules(self, username, rules):
+        self.get_user(username)
+        unknown = set(rules) - set(EMPTY_RULES)
+        if unknown:
+            raise AuthError(f"Неизвестные правила пароля: {', '.join(sorted(unknown))}")
+        current = self.get_user(username).get('password_rules') or EMPTY_RULES
+        user = self._update(username, password_rules=dict(current, **rules))
+        self._audit_change('rules_changed', user=username, rules=user['password_rules'])
+
+    def list_users(self):
+        """Пары (имя, запись) всех пользователей, кроме администратора"""
+        return [
+            (username, data) for username, data in self.get_users().items()
+            if username != ADMIN_USERNAME
+        ]
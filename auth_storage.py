@@ -0,0 +1,423 @@
+"""
+Форматы файла хранилища пользователей; формат выбирается по расширению
+    .json - прежний формат: один JSON-объект {имя: запись}; отступы и библиотека
+            кодирования задаются сериализатором (см. auth_serializer)
+    .json.gz, .json.xz - тот же JSON, сжатый gzip или lzma; чтение и запись идут
+            потоком через модуль сжатия, уровень - set_compress_level
+            или переменная окружения AUTH_COMPRESS_LEVEL (0-9, по умолчанию 6)
+    .rec  - построчные записи с контрольной суммой CRC32 и индексом в конце файла
+
+Формат .rec:
+    AUTHREC 1
+    <crc32:08x> ["имя", {запись}]          по строке на пользователя
+    ...
+    #INDEX {"records": N, "chunks": [[смещение, записей], ...]}
+    #END <смещение #INDEX:016d> <crc32 индекса:08x>
+
+Поврежденная строка затрагивает только свою запись: при чтении она пропускается
+(и передается в on_corrupt), остальные записи читаются. Проверка целостности
+(verify) сверяет контрольные суммы без разбора JSON, а большие файлы проверяет
+частями параллельно в пуле процессов; части берутся из индекса в конце файла.
+"""
+
+import gzip
+import io
+import json
+import lzma
+import os
+import re
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import auth_serializer
+
+RECORD_EXTENSION = '.rec'
+COMPRESSED_EXTENSIONS = ('.json.gz', '.json.xz')
+EXTENSIONS = ('.json', RECORD_EXTENSION) + COMPRESSED_EXTENSIONS   # все поддерживаемые форматы
+DEFAULT_COMPRESS_LEVEL = 6
+HEADER = b'AUTHREC 1\n'
+INDEX_PREFIX = b'#INDEX '
+TRAILER_PREFIX = b'#END '
+TRAILER_SIZE = len(b'#END 0000000000000000 00000000\n')
+CHUNK_RECORDS = 65536       # записей в одной части индекса
+PARALLEL_MIN_BYTES = 8 * 1024 * 1024   # меньшие файлы проверяются в одном процессе
+STREAM_CHUNK = 1024 * 1024  # символов JSON, читаемых за раз при потоковом разборе
+
+# Ошибки распаковки испорченного .gz/.xz, которые не являются OSError или ValueError
+DECOMPRESS_ERRORS = (EOFError, lzma.LZMAError, zlib.error)
+
+_compress_level = None
+
+
+def is_record_format(path):
+    return path.endswith(RECORD_EXTENSION)
+
+
+def compress_level():
+    if _compress_level is None:
+        return int(os.environ.get('AUTH_COMPRESS_LEVEL') or DEFAULT_COMPRESS_LEVEL)
+    return _compress_level
+
+
+def set_compress_level(level):
+    global _compress_level
+    if not 0 <= level <= 9:
+        raise ValueError(f'уровень сжатия должен быть от 0 до 9: {level}')
+    _compress_level = level
+
+
+def open_json(path, mode, target=None):
+    """
+    Двоичный файл JSON; сжатие - по расширению target (по умолчанию самого path),
+    чтобы временный файл записывался в формате итогового
+    """
+    target = target or path
+    if target.endswith('.gz'):
+        return gzip.open(path, mode, compresslevel=compress_level()) if 'w' in mode else gzip.open(path, mode)
+    if target.endswith('.xz'):
+        return lzma.open(path, mode, preset=compress_level()) if 'w' in mode else lzma.open(path, mode)
+    return open(path, mode)
+
+
+def read(path, on_corrupt=None):
+    """
+    Чтение хранилища {имя: запись}; ошибки чтения (OSError) и разбора (ValueError,
+    в том числе испорченное сжатие) передаются вызывающему
+    """
+    if is_record_format(path):
+        return dict(iter_records(path, on_corrupt))
+    try:
+        with open_json(path, 'rb') as file:
+            users = auth_serializer.current().loads(file.read())
+    except DECOMPRESS_ERRORS as error:
+        raise ValueError(f'испорченный сжатый файл: {error}') from error
+    if not isinstance(users, dict):
+        raise ValueError('хранилище должно быть JSON-объектом')
+    return users
+
+
+def temp_path_for(path):
+    # Свой временный файл у каждого процесса: одновременные записи не мешают друг другу
+    return f'{path}.{os.getpid()}.tmp'
+
+
+def write(users, path):
+    """Запись хранилища через временный файл и замену"""
+    temp_path = temp_path_for(path)
+    if is_record_format(path):
+        write_records(users.items(), temp_path)
+    else:
+        with open_json(temp_path, 'wb', target=path) as file:
+            auth_serializer.current().dump(users, file)
+    os.replace(temp_path, path)
+
+
+def write_stream(records, path):
+    """
+    Запись пар (имя, запись) потоком, без словаря всего хранилища в памяти.
+    Файл .json получается тем же, что и у write.
+    """
+    temp_path = temp_path_for(path)
+    if is_record_format(path):
+        write_records(records, temp_path)
+    else:
+        with open_json(temp_path, 'wb', target=path) as file:
+            auth_serializer.current().dump_records(records, file)
+    os.replace(temp_path, path)
+
+
+def iter_users(path, on_corrupt=None):
+    """Пары (имя, запись) потоком для любого формата, без словаря всего хранилища в памяти"""
+    if is_record_format(path):
+        yield from iter_records(path, on_corrupt)
+        return
+    try:
+        with open_json(path, 'rb') as raw, io.TextIOWrapper(raw, encoding='utf-8') as file:
+            yield from iter_json_object(file)
+    except DECOMPRESS_ERRORS as error:
+        raise ValueError(f'испорченный сжатый файл: {error}') from error
+
+
+def iter_json_object(file, chunk_size=STREAM_CHUNK):
+    """Пары ключ - значение JSON-объекта верхнего уровня; текст читается частями"""
+    stream = _JsonStream(file, chunk_size)
+    if stream.char() != '{':
+        raise ValueError('хранилище должно быть JSON-объектом')
+    if stream.char() == '}':
+        return
+    stream.position -= 1
+    while True:
+        key = stream.value()
+        if stream.char() != ':':
+            raise ValueError(f'ожидалось ":" после ключа {key!r}')
+        yield key, stream.value()
+        separator = stream.char()
+        if separator == '}':
+            return
+        if separator != ',':
+            raise ValueError(f'ожидалось "," или "}}" после записи {key!r}')
+
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+class _JsonStream:
+    """Буфер текста JSON, дочитываемый по мере разбора"""
+
+    def __init__(self, file, chunk_size):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.position = 0
+        self.eof = False
+
+    def more(self):
+        chunk = self.file.read(self.chunk_size)
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        self.eof = not chunk
+
+    def skip_space(self):
+        while True:
+            self.position = _WHITESPACE.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer) or self.eof:
+                return
+            self.more()
+
+    def char(self):
+        self.skip_space()
+        if self.position >= len(self.buffer):
+            raise ValueError('JSON оборван')
+        self.position += 1
+        return self.buffer[self.position - 1]
+
+    def value(self):
+        self.skip_space()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                # Значение не уместилось в прочитанную часть
+                if self.eof:
+                    raise
+                self.more()
+                continue
+            if end == len(self.buffer) and not self.eof:
+                # Число на границе части может быть неполным
+                self.more()
+                continue
+            self.position = end
+            return value
+
+
+# Формат .rec
+
+def encode_record(username, user_data):
+    payload = json.dumps([username, user_data], ensure_ascii=False, separators=(',', ':')).encode()
+    return b'%08x %s\n' % (zlib.crc32(payload), payload)
+
+
+def check_line(line):
+    """Полезная нагрузка строки записи или None, если контрольная сумма не сходится"""
+    if len(line) < 10 or line[8:9] != b' ' or not line.endswith(b'\n'):
+        return None
+    payload = line[9:-1]
+    try:
+        expected = int(line[:8], 16)
+    except ValueError:
+        return None
+    return payload if zlib.crc32(payload) == expected else None
+
+
+def write_records(records, path):
+    """Запись пар (имя, запись) потоком; в конце - индекс частей и завершающая строка"""
+    chunks = []
+    count = 0
+    with open(path, 'wb') as file:
+        file.write(HEADER)
+        for username, user_data in records:
+            if count % CHUNK_RECORDS == 0:
+                chunks.append([file.tell(), 0])
+            file.write(encode_record(username, user_data))
+            chunks[-1][1] += 1
+            count += 1
+        index_offset = file.tell()
+        index = json.dumps({'records': count, 'chunks': chunks}, separators=(',', ':')).encode()
+        file.write(INDEX_PREFIX + index + b'\n')
+        file.write(b'%s%016d %08x\n' % (TRAILER_PREFIX, index_offset, zlib.crc32(index)))
+
+
+def iter_records(path, on_corrupt=None):
+    """Пары (имя, запись); испорченные строки передаются в on_corrupt(номер, смещение, строка)"""
+    with open(path, 'rb') as file:
+        number = 0
+        offset = 0
+        for line in file:
+            if offset == 0 and line == HEADER:
+                # Испорченный заголовок разбирается как обычная (испорченная) строка
+                offset = len(line)
+                continue
+            if line.startswith(INDEX_PREFIX):
+                break
+            number += 1
+            record = _decode(line)
+            if record is None:
+                if on_corrupt is not None:
+                    on_corrupt(number, offset, line)
+            else:
+                yield record
+            offset += len(line)
+
+
+def _decode(line):
+    payload = check_line(line)
+    if payload is None:
+        return None
+    try:
+        username, user_data = json.loads(payload)
+    except ValueError:
+        return None
+    if not isinstance(username, str) or not isinstance(user_data, dict):
+        return None
+    return username, user_data
+
+
+_RECORD_NAME = re.compile(rb'[0-9a-fA-F]{8} (\["(?:[^"\\\n]|\\.)*")')
+
+
+def corrupt_record_name(line):
+    """Имя пользователя из испорченной строки записи, если его начало уцелело; иначе None"""
+    match = _RECORD_NAME.match(line)
+    if match is None:
+        return None
+    try:
+        return json.loads(match.group(1) + b']')[0]
+    except ValueError:
+        return None
+
+
+def read_index(path):
+    """Индекс частей из конца файла или None, если он отсутствует или испорчен"""
+    try:
+        with open(path, 'rb') as file:
+            size = file.seek(0, os.SEEK_END)
+            if size < len(HEADER) + TRAILER_SIZE:
+                return None
+            file.seek(size - TRAILER_SIZE)
+            trailer = file.read(TRAILER_SIZE)
+            if not trailer.startswith(TRAILER_PREFIX):
+                return None
+            index_offset, index_crc = trailer[len(TRAILER_PREFIX):].split()
+            file.seek(int(index_offset))
+            line = file.readline()
+    except (OSError, ValueError):
+        return None
+    if not line.startswith(INDEX_PREFIX):
+        return None
+    index = line[len(INDEX_PREFIX):-1]
+    if zlib.crc32(index) != int(index_crc, 16):
+        return None
+    return json.loads(index)
+
+
+# Проверка целостности
+
+def verify_range(path, start, end, expected=None):
+    """
+    Проверка строк записей, начинающихся в [start, end).
+    Возвращает (проверено, [(смещение, причина), ...]).
+    """
+    checked = 0
+    bad = []
+    with open(path, 'rb') as file:
+        file.seek(start)
+        if start > 0 and expected is None:
+            # Граница части без индекса: продолжаем с начала следующей строки
+            file.seek(start - 1)
+            if file.read(1) != b'\n':
+                file.readline()
+        offset = file.tell()
+        while offset < end:
+            line = file.readline()
+            if not line or line.startswith(INDEX_PREFIX):
+                break
+            checked += 1
+            if check_line(line) is None:
+                bad.append((offset, 'crc'))
+            offset += len(line)
+            if expected is not None and checked == expected:
+                break
+    if expected is not None and checked != expected:
+        bad.append((start, f'в части {checked} записей вместо {expected}'))
+    return checked, bad
+
+
+def _ranges(path, workers):
+    """Части файла для проверки: из индекса, а без него - равные куски по байтам"""
+    index = read_index(path)
+    size = os.path.getsize(path)
+    if index is not None:
+        chunks = index['chunks']
+        bounds = [offset for offset, _ in chunks[1:]] + [size]
+        return [(start, end, count) for (start, count), end in zip(chunks, bounds)], index
+    start = len(HEADER)
+    step = max(1, (size - start) // max(1, workers or os.cpu_count() or 1))
+    return [(offset, min(offset + step, size), None) for offset in range(start, size, step)], None
+
+
+def verify(path, workers=None):
+    """
+    Проверка контрольных сумм всех записей без разбора JSON.
+    Возвращает словарь: records - проверено записей, corrupt - [(смещение, причина)],
+    indexed - использован ли индекс из конца файла.
+    """
+    with open(path, 'rb') as file:
+        header_ok = file.readline() == HEADER
+    ranges, index = _ranges(path, workers)
+    if workers == 1 or len(ranges) <= 1 or os.path.getsize(path) < PARALLEL_MIN_BYTES:
+        results = [verify_range(path, start, end, count) for start, end, count in ranges]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(
+                verify_range, [path] * len(ranges),
+                *zip(*ranges)
+            ))
+    corrupt = [item for _, bad in results for item in bad]
+    if not header_ok:
+        corrupt.append((0, 'header'))
+    return {
+        'records': sum(checked for checked, _ in results),
+        'corrupt': sorted(corrupt),
+        'indexed': index is not None
+    }
+
+
+def repair(path, quarantine_path=None):
+    """
+    Переписать хранилище без испорченных записей; сами строки сохраняются
+    в ФАЙЛ.quarantine для ручного разбора. Возвращает число убранных записей.
+    """
+    corrupt = []
+    users = dict(iter_records(path, lambda *item: corrupt.append(item)))
+    quarantine(path, corrupt, quarantine_path)
+    # Индекс переписывается и тогда, когда испорчен только он
+    write(users, path)
+    return len(corrupt)
+
+
+def quarantine(path, corrupt, quarantine_path=None):
+    """Дописать испорченные строки [(номер, смещение, строка)] в ФАЙЛ.quarantine"""
+    if not corrupt:
+        return
+    stamp = time.strftime('%Y-%m-%d %H:%M:%S')
+    with open(quarantine_path or path + '.quarantine', 'ab') as file:
+        for number, offset, line in corrupt:
+            file.write(b'# %s %s: record %d, offset %d\n' % (stamp.encode(), path.encode(), number, offset))
+            file.write(line if line.endswith(b'\n') else line + b'\n')
+
+
+def convert(source, target):
+    """Перенос хранилища между форматами (по расширениям файлов)"""
+    write(read(source), target)
@@ -0,0 +1,79 @@
+"""
+Общая таблица стилей графических приложений (a.py, abm.py)
+Применяется один раз ко всему приложению: app.setStyleSheet(APP_STYLESHEET).
+Варианты кнопок задаются свойствами виджета:
+    role="main"   - кнопки окна входа (минимальная ширина)
+    role="panel"  - кнопки панелей администратора и пользователя
+    danger=True   - красные кнопки выхода
+"""
+
+BG_COLOR = "#f0f0f0"
+BUTTON_COLOR = "#4CAF50"
+TEXT_COLOR = "#333333"
+
+APP_STYLESHEET = f"""
+    QWidget {{
+        background-color: {BG_COLOR};
+        color: {TEXT_COLOR};
+    }}
+    QDialog {{
+        font-size: 14px;
+    }}
+    QDialog QLabel {{
+        margin-bottom: 5px;
+    }}
+    QGroupBox {{
+        font-size: 16px;
+        font-weight: bold;
+        border: 1px solid #ccc;
+        border-radius: 5px;
+        margin-top: 10px;
+        padding-top: 15px;
+    }}
+    QLineEdit {{
+        padding: 8px;
+        border: 1px solid #ddd;
+        border-radius: 4px;
+        font-size: 14px;
+        margin-bottom: 15px;
+    }}
+    QSpinBox {{
+        padding: 5px;
+        border: 1px solid #ddd;
+        border-radius: 4px;
+        margin-bottom: 10px;
+    }}
+    QCheckBox {{
+        margin-bottom: 10px;
+    }}
+    QListWidget {{
+        border: 1px solid #ddd;
+        border-radius: 4px;
+        font-size: 14px;
+        min-height: 150px;
+    }}
+    QPushButton {{
+        background-color: {BUTTON_COLOR};
+        color: white;
+        border: none;
+        padding: 8px 16px;
+        font-size: 14px;
+        border-radius: 4px;
+    }}
+    QPushButton:hover {{
+        background-color: #45a049;
+    }}
+    QPushButton[role="main"] {{
+        min-width: 100px;
+    }}
+    QPushButton[role="panel"] {{
+        padding: 8px;
+        margin-bottom: 10px;
+    }}
+    QPushButton[danger="true"] {{
+        background-color: #f44336;
+    }}
+    QPushButton[danger="true"]:hover {{
+        background-color: #d32f2f;
+    }}
+"""
@@ -0,0 +1,167 @@
+"""
+Ограничение частоты попыток входа (защита от перебора паролей)
+Для каждого ключа (пользователь, источник запросов) хранится ведро токенов:
+каждая попытка входа забирает токен, успешный вход возвращает его.
+Когда токены кончаются, ключ блокируется на время, растущее вдвое
+с каждой следующей блокировкой. Отказ выдается до хеширования пароля,
+поэтому поток перебора почти не нагружает процессор.
+Состояние сохраняется на диск раз в snapshot_interval и сразу при начале
+блокировки, поэтому переживает перезапуск.
+"""
+
+import json
+import math
+import os
+import threading
+import time
+
+from auth_service import AuthError
+from auth_storage import temp_path_for
+
+# Параметры ведер по типу ключа: (емкость, пополнение токенов в секунду)
+BUCKET_LIMITS = {
+    'user': (3, 1 / 60),     # 3 попытки, затем одна попытка в минуту
+    'src': (20, 1 / 6)       # источник может ошибаться чаще (разные пользователи)
+}
+BASE_LOCKOUT = 30            # первая блокировка, секунды
+MAX_LOCKOUT = 3600           # предельная блокировка, секунды
+SNAPSHOT_INTERVAL = 30       # период сохранения состояния, секунды
+
+
+class ThrottledError(AuthError):
+    """Попытка входа отклонена ограничителем"""
+    reason = 'throttled'
+
+    def __init__(self, message, retry_after, started=False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        # True, если блокировку включила именно эта попытка
+        self.started = started
+
+
+class LoginThrottle:
+    def __init__(self, path=None, limits=None, base_lockout=BASE_LOCKOUT,
+                 max_lockout=MAX_LOCKOUT, snapshot_interval=SNAPSHOT_INTERVAL):
+        self.path = path
+        self.limits = dict(limits or BUCKET_LIMITS)
+        self.base_lockout = base_lockout
+        self.max_lockout = max_lockout
+        self.snapshot_interval = snapshot_interval
+        # ключ -> [токены, время обновления, число блокировок, заблокирован до]
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.last_snapshot = time.time()
+        if path:
+            self.load()
+
+    def _limits(self, key):
+        return self.limits[key.split(':', 1)[0]]
+
+    def _bucket(self, key, now):
+        capacity, rate = self._limits(key)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = [float(capacity), now, 0, 0.0]
+            return bucket
+        # Пополнение токенов за прошедшее время
+        bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        # Блокировка истекла - дается одна попытка
+        if bucket[3] and now >= bucket[3]:
+            bucket[0] = max(bucket[0], 1.0)
+            bucket[3] = 0.0
+        # Ведро полностью восстановилось - счетчик блокировок сбрасывается
+        if bucket[0] >= capacity and now >= bucket[3]:
+            bucket[2] = 0
+        return bucket
+
+    def acquire(self, keys):
+        """Забрать по токену для каждого ключа; при блокировке - ThrottledError"""
+        now = time.time()
+        with self.lock:
+            buckets = [self._bucket(key, now) for key in keys]
+            retry_after = 0.0
+            started = False
+            for bucket in buckets:
+                if now < bucket[3]:
+                    retry_after = max(retry_after, bucket[3] - now)
+                elif bucket[0] < 1:
+                    # Токены кончились - блокировка с экспоненциальным ростом
+                    lockout = min(self.max_lockout, self.base_lockout * 2 ** bucket[2])
+                    bucket[2] += 1
+                    bucket[3] = now + lockout
+                    retry_after = max(retry_after, lockout)
+                    started = True
+                    self.dirty = True
+            if not retry_after:
+                for bucket in buckets:
+                    bucket[0] -= 1
+                self.dirty = True
+        if retry_after:
+            if started:
+                # Начавшаяся блокировка записывается сразу: перезапуск программы ее не снимает
+                self.snapshot()
+            raise ThrottledError(
+                f'Слишком много попыток входа. Повторите через {math.ceil(retry_after)} с.',
+                retry_after,
+                started
+            )
+        self.maybe_snapshot()
+
+    def success(self, keys):
+        """Успешный вход: вернуть токены и сбросить счетчик блокировок"""
+        now = time.time()
+        with self.lock:
+            for key in keys:
+                capacity, _ = self._limits(key)
+                bucket = self._bucket(key, now)
+                bucket[0] = min(capacity, bucket[0] + 1)
+                if key.startswith('user:'):
+                    bucket[2] = 0
+            self.dirty = True
+        self.maybe_snapshot()
+
+    def remaining(self, keys):
+        """Сколько попыток осталось до блокировки"""
+        now = time.time()
+        with self.lock:
+            return min(int(self._bucket(key, now)[0]) for key in keys)
+
+    # Сохранение состояния
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as file:
+                self.buckets = {
+                    key: list(bucket) for key, bucket in json.load(file).items()
+                    if key.split(':', 1)[0] in self.limits
+                }
+        except (OSError, ValueError, TypeError):
+            self.buckets = {}
+
+    def maybe_snapshot(self):
+        if self.path and self.dirty and time.time() - self.last_snapshot >= self.snapshot_interval:
+            self.snapshot()
+
+    def snapshot(self):
+        """Сохранить непустое состояние (полные ведра без блокировки не пишутся)"""
+        if not self.path:
+            return
+        now = time.time()
+        with self.lock:
+            state = {}
+            for key in list(self.buckets):
+                bucket = self._bucket(key, now)
+                capacity, _ = self._limits(key)
+                if bucket[0] >= capacity and bucket[2] == 0 and now >= bucket[3]:
+                    del self.buckets[key]
+                else:
+                    state[key] = list(bucket)
+            self.dirty = False
+            self.last_snapshot = now
+            # Тот же файл сохраняют другие экземпляры программы - временный файл свой у каждого
+            temp_path = temp_path_for(self.path)
+            with open(temp_path, 'w') as file:
+                json.dump(state, file)
+            os.replace(temp_path, self.path)
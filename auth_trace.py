@@ -0,0 +1,124 @@
+"""
+Трассировка действий в формате Chrome trace_event (chrome://tracing, Perfetto)
+
+Включается переменной окружения AUTH_TRACE=файл.json (графические приложения)
+или параметром --trace (auth_cli.py). Каждый обработчик интерфейса
+(декоратор traced) дает интервал (события B/E), внутри него - вложенные
+интервалы чтения и записи хранилища и хеширования из точек замера auth_metrics.
+"""
+
+import atexit
+import contextlib
+import json
+import os
+import threading
+import time
+from functools import wraps
+
+import auth_metrics
+import auth_storage
+
+MAX_EVENTS = 1_000_000   # предел буфера; лишние события не записываются
+
+_tracer = None
+_NULL_SPAN = contextlib.nullcontext()
+
+
+class Tracer:
+    def __init__(self, path, max_events=MAX_EVENTS):
+        self.path = path
+        self.max_events = max_events
+        self.events = []
+        self.pid = os.getpid()
+        self.origin = time.perf_counter_ns()
+
+    def _event(self, phase, name, category):
+        if len(self.events) >= self.max_events:
+            return
+        self.events.append({
+            'name': name,
+            'cat': category,
+            'ph': phase,
+            'ts': (time.perf_counter_ns() - self.origin) / 1000,  # микросекунды
+            'pid': self.pid,
+            'tid': threading.get_ident()
+        })
+
+    def begin(self, name, category='auth'):
+        self._event('B', name, category)
+
+    def end(self, name, category='auth'):
+        self._event('E', name, category)
+
+    def write(self):
+        thread_names = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': thread.ident,
+             'args': {'name': thread.name}}
+            for thread in threading.enumerate()
+        ]
+        temp_path = auth_storage.temp_path_for(self.path)
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump({'traceEvents': thread_names + self.events, 'displayTimeUnit': 'ms'}, file)
+        os.replace(temp_path, self.path)
+
+
+def start(path):
+    """Включить трассировку с записью в файл при завершении процесса"""
+    global _tracer
+    _tracer = Tracer(path)
+    auth_metrics.set_tracer(_tracer)
+    atexit.register(_tracer.write)
+    return _tracer
+
+
+def install_from_env(variable='AUTH_TRACE'):
+    path = os.environ.get(variable)
+    return start(path) if path else None
+
+
+class _Span:
+    __slots__ = ('name', 'category')
+
+    def __init__(self, name, category):
+        self.name = name
+        self.category = category
+
+    def __enter__(self):
+        _tracer.begin(self.name, self.category)
+        return self
+
+    def __exit__(self, *exc_info):
+        _tracer.end(self.name, self.category)
+        return False
+
+
+def span(name, category='ui'):
+    """Интервал трассировки (без гистограммы): with span('login'): ..."""
+    if _tracer is None:
+        return _NULL_SPAN
+    return _Span(name, category)
+
+
+def traced(name, category='ui'):
+    """
+    Декоратор обработчика интерфейса: интервал трассировки на весь вызов.
+    Число параметров обработчика сохраняется, чтобы PyQt не передавал
+    в него лишние аргументы сигнала (например, checked у clicked).
+    """
+    def decorator(func):
+        if func.__code__.co_argcount == 1:
+            @wraps(func)
+            def wrapper(self):
+                if _tracer is None:
+                    return func(self)
+                with _Span(name, category):
+                    return func(self)
+        else:
+            @wraps(func)
+            def wrapper(self, *args, **kwargs):
+                if _tracer is None:
+                    return func(self, *args, **kwargs)
+                with _Span(name, category):
+                    return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
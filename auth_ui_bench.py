@@ -0,0 +1,234 @@
+"""
+Замеры графического интерфейса без экрана (QT_QPA_PLATFORM=offscreen)
+
+UserAuthApp (a.py или abm.py) запускается на сгенерированном хранилище
+и управляется программно: вход администратора, открытие PasswordSetupDialog,
+добавление и блокировка пользователей, прокрутка списка. Модальные окна
+(сообщения, ввод имени, установка пароля) заполняются и закрываются
+автоматически сразу после показа.
+
+Замеряются: время открытия диалога (от вызова до события Show), время
+обновления списка, время действий и отзывчивость цикла событий (запаздывание
+таймера с периодом HEARTBEAT_MS). Результаты - в формате auth_bench,
+поэтому их можно сравнивать с базовым замером так же (--baseline).
+
+Пример:
+    python auth_ui_bench.py --users 100000 --output ui.json
+"""
+
+import argparse
+import importlib
+import json
+import os
+import shutil
+import sys
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt6 import QtCore
+from PyQt6.QtWidgets import QApplication, QDialog, QInputDialog, QMessageBox
+
+import auth_bench
+import auth_generate
+from auth_service import ADMIN_USERNAME, USER_DATA_FILE
+from auth_style import APP_STYLESHEET
+
+HEARTBEAT_MS = 5
+DEFAULT_REPEAT = 20
+
+
+class ModalResponder(QtCore.QObject):
+    """Отвечает на модальные окна сразу после их показа и запоминает время показа"""
+
+    def __init__(self, app):
+        super().__init__()
+        self.input_text = ''
+        self.password = ''
+        self.shown_at = None
+        app.installEventFilter(self)
+
+    def eventFilter(self, watched, event):
+        if event.type() == QtCore.QEvent.Type.Show and isinstance(watched, QDialog):
+            if self.shown_at is None:
+                self.shown_at = time.perf_counter()
+            # Ответ - после того как окно войдет в свой цикл событий
+            QtCore.QTimer.singleShot(0, lambda dialog=watched: self.respond(dialog))
+        return False
+
+    def respond(self, dialog):
+        if not dialog.isVisible():
+            return
+        if isinstance(dialog, QMessageBox):
+            dialog.accept()
+        elif isinstance(dialog, QInputDialog):
+            dialog.setTextValue(self.input_text)
+            dialog.accept()
+        elif hasattr(dialog, 'password_input'):
+            # PasswordSetupDialog
+            dialog.password_input.setText(self.password)
+            dialog.confirm_input.setText(self.password)
+            dialog.validate_password()
+        else:
+            dialog.accept()
+
+
+class Heartbeat:
+    """Запаздывание таймера цикла событий: чем оно больше, тем дольше интерфейс не отвечал"""
+
+    def __init__(self, interval_ms=HEARTBEAT_MS):
+        self.interval = interval_ms / 1000
+        self.delays = []
+        self.last = None
+        self.timer = QtCore.QTimer()
+        self.timer.setTimerType(QtCore.Qt.TimerType.PreciseTimer)
+        self.timer.setInterval(interval_ms)
+        self.timer.timeout.connect(self.tick)
+
+    def start(self):
+        self.last = time.perf_counter()
+        self.timer.start()
+
+    def tick(self):
+        now = time.perf_counter()
+        self.delays.append(max(0.0, now - self.last - self.interval))
+        self.last = now
+
+    def stop(self):
+        self.timer.stop()
+        return self.delays
+
+
+def result_for(name, size, latencies):
+    total = sum(latencies)
+    latencies = sorted(latencies)
+    return {
+        'size': size,
+        'format': 'ui',
+        'benchmark': name,
+        'ops': len(latencies),
+        'ops_per_sec': round(len(latencies) / total, 2) if total else 0.0,
+        'p50_ms': round(auth_bench.percentile(latencies, 0.5) * 1000, 3),
+        'p99_ms': round(auth_bench.percentile(latencies, 0.99) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        'peak_rss_mb': auth_bench.peak_rss_mb()
+    }
+
+
+def timed_call(app, function):
+    begin = time.perf_counter()
+    function()
+    app.processEvents()
+    return time.perf_counter() - begin
+
+
+def run(app_module, size, repeat, workdir, seed):
+    source = os.path.abspath(auth_bench.prepare_store(workdir, size, '.json', seed))
+    run_dir = os.path.join(workdir, f'ui-{size}')
+    os.makedirs(run_dir, exist_ok=True)
+    os.chdir(run_dir)
+    shutil.copyfile(source, USER_DATA_FILE)
+
+    app = QApplication.instance() or QApplication([])
+    # Стиль и таблица стилей - как при запуске a.py/abm.py, иначе замер без отрисовки стилей
+    app.setStyle("Fusion")
+    app.setStyleSheet(APP_STYLESHEET)
+    module = importlib.import_module(app_module)
+    responder = ModalResponder(app)
+    heartbeat = Heartbeat()
+    results = []
+
+    window = module.UserAuthApp()
+    startup = time.perf_counter()
+    window.show()
+    # Хранилище читается после первой отрисовки (after_first_show)
+    while window.auth.users is None:
+        app.processEvents()
+    results.append(result_for('ui_startup', size, [time.perf_counter() - startup]))
+    heartbeat.start()
+
+    # Вход администратора: чтение хранилища и построение панели со списком
+    window.username_input.setText(ADMIN_USERNAME)
+    window.password_input.setText(auth_generate.password_for(ADMIN_USERNAME))
+    results.append(result_for('ui_login_admin', size, [timed_call(app, window.login_button.click)]))
+
+    # Открытие диалога установки пароля (первое открытие создает диалог, дальше - из пула)
+    opens = []
+    for number in range(repeat):
+        username = auth_generate.username_for(number % max(1, size))
+        responder.password = auth_generate.password_for(username)
+        responder.shown_at = None
+        begin = time.perf_counter()
+        window.ask_new_password(username)
+        if responder.shown_at is not None:
+            opens.append(responder.shown_at - begin)
+    results.append(result_for('ui_dialog_open', size, opens))
+
+    # Обновление списка пользователей
+    results.append(result_for('ui_list_refresh', size, [
+        timed_call(app, window.update_user_list) for _ in range(repeat)
+    ]))
+
+    # Добавление пользователей (ввод имени и сообщение об успехе закрываются автоматически)
+    added = []
+    for number in range(repeat):
+        responder.input_text = f'ui-bench-{number}'
+        added.append(timed_call(app, window.add_user_button.click))
+    results.append(result_for('ui_add_user', size, added))
+
+    # Блокировка выбранного пользователя
+    blocked = []
+    for number in range(repeat):
+        window.user_list.setCurrentRow(number % max(1, window.user_list.count()))
+        blocked.append(timed_call(app, window.block_user_button.click))
+    results.append(result_for('ui_block_user', size, blocked))
+
+    # Прокрутка списка от начала до конца
+    scroll_bar = window.user_list.verticalScrollBar()
+    step = max(1, scroll_bar.maximum() // max(1, repeat * 5))
+    scrolls = []
+    for value in range(0, scroll_bar.maximum() + 1, step):
+        scrolls.append(timed_call(app, lambda value=value: scroll_bar.setValue(value)))
+    results.append(result_for('ui_scroll', size, scrolls))
+
+    results.append(result_for('ui_event_loop_delay', size, heartbeat.stop()))
+    window.close()
+    return results
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Замеры интерфейса без экрана')
+    parser.add_argument('--app', default='a', choices=('a', 'abm'), help='приложение (по умолчанию a)')
+    parser.add_argument('--users', type=int, default=100000, help='размер хранилища (по умолчанию 100000)')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='повторов каждого действия')
+    parser.add_argument('--workdir', default=auth_bench.DEFAULT_WORKDIR, help='каталог хранилищ')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='записать результаты в JSON')
+    parser.add_argument('--baseline', help='сравнить с результатами из этого файла')
+    parser.add_argument('--tolerance', type=float, default=auth_bench.TOLERANCE)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    os.makedirs(args.workdir, exist_ok=True)
+    results = run(args.app, args.users, args.repeat, os.path.abspath(args.workdir), args.seed)
+    for result in results:
+        print(auth_bench.format_result(result), file=sys.stderr)
+    report = {'meta': {'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'app': args.app}, 'results': results}
+    if output:
+        with open(output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=4)
+    if baseline:
+        with open(baseline, 'r', encoding='utf-8') as file:
+            regressions = auth_bench.compare(report, json.load(file), args.tolerance)
+        for line in regressions:
+            print(f'Ухудшение: {line}', file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
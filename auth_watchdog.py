@@ -0,0 +1,105 @@
+"""
+Сторожевой поток для цикла событий Qt
+Таймер в главном потоке отмечается (heartbeat) с периодом вдвое меньше порога.
+Если главный поток не отмечался дольше порога (например, 50 мс), сторож
+снимает его стек через sys._current_frames() и пишет в ротируемый файл
+диагностики - так синхронные save_users или хеширование в login видны в отчетах.
+
+Включение: переменная окружения AUTH_WATCHDOG_MS=50 (см. install_from_env).
+"""
+
+import logging
+import logging.handlers
+import os
+import sys
+import threading
+import time
+import traceback
+
+STALL_LOG_FILE = 'auth_stalls.log'
+MAX_LOG_BYTES = 1024 * 1024
+LOG_BACKUPS = 3
+MAX_SAMPLES_PER_STALL = 20   # сколько стеков снимать за одно зависание
+
+
+class StallWatchdog:
+    def __init__(self, threshold=0.05, path=STALL_LOG_FILE, max_bytes=MAX_LOG_BYTES, backups=LOG_BACKUPS):
+        self.threshold = threshold
+        self.main_thread_id = threading.main_thread().ident
+        self.last_beat = time.monotonic()
+        self.stalls = 0
+        self.stop_event = threading.Event()
+        self.heartbeat = None  # QTimer, см. install
+        self.logger = logging.getLogger(f'auth_watchdog.{id(self)}')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8'
+        )
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        self.logger.addHandler(handler)
+        self.thread = threading.Thread(target=self._run, name='stall-watchdog', daemon=True)
+
+    def beat(self):
+        """Отметка из главного потока"""
+        self.last_beat = time.monotonic()
+
+    def start(self):
+        self.beat()
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread.is_alive():
+            self.thread.join()
+
+    def _sample(self):
+        frame = sys._current_frames().get(self.main_thread_id)
+        if frame is None:
+            return 'стек главного потока недоступен'
+        return ''.join(traceback.format_stack(frame))
+
+    def _run(self):
+        check_interval = self.threshold / 2
+        stalled_since = None
+        samples = 0
+        while not self.stop_event.wait(check_interval):
+            beat = self.last_beat
+            stalled_for = time.monotonic() - beat
+            if stalled_for <= self.threshold:
+                if stalled_since is not None:
+                    self.logger.info('главный поток снова отвечает, зависание %.0f мс',
+                                     (time.monotonic() - stalled_since) * 1000)
+                    stalled_since = None
+                continue
+            if stalled_since is None:
+                stalled_since = beat
+                samples = 0
+                self.stalls += 1
+            if samples < MAX_SAMPLES_PER_STALL:
+                samples += 1
+                self.logger.info('главный поток не отвечает %.0f мс (зависание %d, образец %d)\n%s',
+                                 stalled_for * 1000, self.stalls, samples, self._sample())
+
+
+def install(app, threshold_ms=50, path=STALL_LOG_FILE):
+    """Запустить сторож для QApplication: таймер-heartbeat живет в цикле событий"""
+    from PyQt6.QtCore import QTimer
+
+    watchdog = StallWatchdog(threshold_ms / 1000, path)
+    heartbeat = QTimer(app)
+    heartbeat.setInterval(max(1, threshold_ms // 2))
+    heartbeat.timeout.connect(watchdog.beat)
+    heartbeat.start()
+    app.aboutToQuit.connect(watchdog.stop)
+    # Ссылка на таймер хранится в объекте сторожа, чтобы его не удалил сборщик мусора
+    watchdog.heartbeat = heartbeat
+    return watchdog.start()
+
+
+def install_from_env(app, variable='AUTH_WATCHDOG_MS'):
+    value = os.environ.get(variable)
+    if not value:
+        return None
+    return install(app, int(value))
@@ -0,0 +1,125 @@
+"""Резервные копии: цепочки базовых и разностных копий и восстановление по ним"""
+
+import gzip
+import json
+import os
+
+import pytest
+
+import auth_backup
+import auth_storage
+from auth_backup import BackupSet
+from auth_service import new_user_record
+
+
+@pytest.fixture
+def users():
+    return {f'user{number}': new_user_record() for number in range(10)}
+
+
+@pytest.fixture
+def backups(tmp_path):
+    return BackupSet(str(tmp_path / 'backups'))
+
+
+def rewrite_manifest(backups, entries):
+    with open(backups._path(auth_backup.MANIFEST), 'w', encoding='utf-8') as file:
+        for entry in entries:
+            file.write(json.dumps(entry) + '\n')
+
+
+def operations(backups, entry):
+    with gzip.open(backups._path(entry['file']), 'rt', encoding='utf-8') as file:
+        return [json.loads(line) for line in file]
+
+
+def test_first_backup_is_base(backups, users):
+    entry = backups.backup(users)
+    assert (entry['id'], entry['kind'], entry['put'], entry['deleted']) == (1, 'base', 10, 0)
+    assert backups.restore() == users
+
+
+def test_delta_holds_only_changes(backups, users):
+    backups.backup(users)
+    assert backups.backup(users)['put'] == 0
+    users['user1']['blocked'] = True
+    del users['user2']
+    users['new'] = new_user_record()
+    entry = backups.backup(users)
+    assert (entry['kind'], entry['records'], entry['put'], entry['deleted']) == ('delta', 10, 2, 1)
+    assert sorted(operations(backups, entry)) == [
+        ['del', 'user2'],
+        ['put', 'new', users['new']],
+        ['put', 'user1', users['user1']]
+    ]
+    assert backups.restore() == users
+
+
+def test_restore_by_id_and_time(backups, users):
+    states = []
+    for number in range(3):
+        users[f'user{number}']['version'] += 1
+        backups.backup(users)
+        states.append(json.loads(json.dumps(users)))
+    entries = backups.entries()
+    assert [entry['kind'] for entry in entries] == ['base', 'delta', 'delta']
+    # Копии сделаны в пределах миллисекунд - время задается явно: 1000, 1010, 1020
+    for number, entry in enumerate(entries):
+        entry['ts'] = 1000 + 10 * number
+    rewrite_manifest(backups, entries)
+    for backup_id, state in enumerate(states, 1):
+        assert backups.restore(backup_id=backup_id) == state
+    assert backups.restore(at=1015) == states[1]
+    assert backups.restore(at=1020) == states[2]
+    assert backups.restore(at=999) is None
+    assert [entry['id'] for entry in backups.chain(at=1015)] == [1, 2]
+
+
+def test_rebase_after_many_changes(backups, users):
+    backups.backup(users)
+    for number in range(6):
+        users[f'user{number}']['blocked'] = True
+    # Больше половины записей изменилось, но это видно только по накопленным копиям
+    assert backups.backup(users)['kind'] == 'delta'
+    users['user9']['admin'] = True
+    entry = backups.backup(users)
+    assert (entry['kind'], entry['put']) == ('base', 10)
+    # Цепочка начинается с нового базового снимка
+    assert [item['id'] for item in backups.chain()] == [3]
+    assert backups.restore() == users
+    assert backups.restore(backup_id=2)['user9']['admin'] is False
+
+
+def test_full_backup(backups, users):
+    backups.backup(users)
+    assert backups.backup(users, full=True)['kind'] == 'base'
+
+
+def test_delta_from_backups_without_hashes(backups, users):
+    # Копии, сделанные до появления файлов хешей
+    entry = backups.backup(users)
+    os.remove(backups._path(entry['hashes']))
+    del entry['hashes']
+    rewrite_manifest(backups, [entry])
+    users['user3']['blocked'] = True
+    entry = backups.backup(users)
+    assert (entry['kind'], entry['put']) == ('delta', 1)
+    assert backups.restore() == users
+
+
+def test_damaged_hashes_start_new_base(backups, users):
+    entry = backups.backup(users)
+    with open(backups._path(entry['hashes']), 'wb') as file:
+        file.write(b'damaged')
+    assert backups.backup(users)['kind'] == 'base'
+
+
+def test_backup_and_restore_store(tmp_path, users):
+    path = str(tmp_path / 'users.json')
+    auth_storage.write(users, path)
+    assert auth_backup.backup_store(path)['kind'] == 'base'
+    assert os.path.isdir(path + '.backups')
+    target = str(tmp_path / 'restored.json.gz')
+    assert auth_backup.restore_store(path, target) == len(users)
+    assert auth_storage.read(target) == users
+    assert auth_backup.restore_store(path, target, backup_id=0) is None
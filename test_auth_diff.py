@@ -0,0 +1,85 @@
+"""Сравнение хранилищ: слияние отсортированных потоков и внешняя сортировка"""
+
+import os
+
+import pytest
+
+import auth_storage
+from auth_diff import diff, diff_sorted, format_change, record_changes, sorted_records
+from auth_service import STRICT_RULES, new_user_record
+
+
+def changes_of(changes):
+    return [(change['user'], change['change']) for change in changes]
+
+
+def test_record_changes():
+    old = new_user_record(password='hash')
+    new = dict(old, blocked=True, admin=True, password='other', password_rules=dict(STRICT_RULES),
+               version=5, note='x')
+    assert record_changes('anna', old, new) == [
+        {'user': 'anna', 'change': 'blocked', 'old': False, 'new': True},
+        {'user': 'anna', 'change': 'password', 'old': 'set', 'new': 'changed'},
+        {'user': 'anna', 'change': 'policy', 'old': '0:-', 'new': '8:ULDS'},
+        {'user': 'anna', 'change': 'admin', 'old': False, 'new': True},
+        {'user': 'anna', 'change': 'other', 'old': None, 'new': ['note']}
+    ]
+
+
+def test_record_changes_password_reset_and_version():
+    old = new_user_record(password='hash')
+    assert record_changes('anna', old, dict(old, version=3)) == []
+    [change] = record_changes('anna', old, dict(old, password=''))
+    assert (change['old'], change['new']) == ('set', 'empty')
+    assert format_change(change) == '~ anna: пароль сброшен'
+
+
+def test_diff_sorted_merges_streams():
+    record = new_user_record()
+    old = [('a', record), ('c', record), ('d', record)]
+    new = [('b', record), ('c', dict(record, blocked=True)), ('d', record), ('e', record)]
+    assert changes_of(diff_sorted(old, new)) == [
+        ('a', 'removed'), ('b', 'added'), ('c', 'blocked'), ('e', 'added')
+    ]
+
+
+def test_diff_sorted_empty_sides():
+    record = new_user_record()
+    assert list(diff_sorted([], [])) == []
+    assert changes_of(diff_sorted([], [('a', record)])) == [('a', 'added')]
+    assert changes_of(diff_sorted([('a', record), ('b', record)], [])) == [('a', 'removed'), ('b', 'removed')]
+
+
+def write_store(path, names, **fields):
+    # Порядок записей в файле намеренно не по имени
+    auth_storage.write({name: dict(new_user_record(), **fields.get(name, {})) for name in names}, path)
+
+
+@pytest.mark.parametrize('run_records', [3, 1000])
+def test_sorted_records_with_runs(tmp_path, run_records):
+    path = str(tmp_path / 'users.rec')
+    names = [f'user{number:02d}' for number in range(20, 0, -1)]
+    write_store(path, names)
+    workdir = tmp_path / 'work'
+    workdir.mkdir()
+    assert [name for name, _ in sorted_records(path, str(workdir), run_records)] == sorted(names)
+    # Временные части удалены после слияния
+    assert os.listdir(workdir) == []
+
+
+@pytest.mark.parametrize('run_records', [2, 1000])
+def test_diff_stores(tmp_path, run_records):
+    old, new = str(tmp_path / 'old.json'), str(tmp_path / 'new.json.gz')
+    write_store(old, ['zoe', 'anna', 'boris', 'vera'])
+    write_store(
+        new, ['vera', 'boris', 'anna', 'gleb'],
+        boris={'admin': True}, vera={'password_rules': {'min_length': 6}}
+    )
+    changes = list(diff(old, new, workdir=str(tmp_path), run_records=run_records))
+    assert [format_change(change) for change in changes] == [
+        '~ boris: назначен администратором',
+        '+ gleb',
+        '~ vera: политика 0:- -> 6:-',
+        '- zoe'
+    ]
+    assert sorted(os.listdir(tmp_path)) == ['new.json.gz', 'old.json']
@@ -0,0 +1,109 @@
+"""Вторичные индексы: обновление при изменении записей и хранение в ФАЙЛ.idx"""
+
+import os
+
+import pytest
+
+from auth_index import UserIndex, file_key, policy_id
+from auth_service import STRICT_RULES, AuthService, new_user_record, save_users
+
+
+@pytest.fixture
+def users():
+    return {
+        'admin': new_user_record(admin=True, rules=STRICT_RULES, password='hash'),
+        'anna': new_user_record(password='hash'),
+        'boris': new_user_record()
+    }
+
+
+def test_policy_id():
+    assert policy_id(None) == '0:-'
+    assert policy_id(STRICT_RULES) == '8:ULDS'
+    assert policy_id({'min_length': 6, 'require_digit': True}) == '6:D'
+
+
+def test_build(users):
+    index = UserIndex.build(users)
+    assert index.find('admin') == {'admin'}
+    assert index.find('no_password') == {'boris'}
+    assert index.find('blocked') == set()
+    assert index.with_policy('8:ULDS') == {'admin'}
+    assert index.with_policy('0:-') == {'anna', 'boris'}
+    with pytest.raises(KeyError):
+        index.find('unknown')
+
+
+def test_update_moves_record_between_sets(users):
+    index = UserIndex.build(users)
+    users['anna'].update(blocked=True, password_rules=dict(STRICT_RULES))
+    index.update('anna', users['anna'])
+    assert index.find('blocked') == {'anna'}
+    assert index.with_policy('8:ULDS') == {'admin', 'anna'}
+    assert index.with_policy('0:-') == {'boris'}
+    assert index.policy_of['anna'] == '8:ULDS'
+
+
+def test_update_removes_record_and_empty_policy(users):
+    index = UserIndex.build(users)
+    index.update('admin', None)
+    assert index.find('admin') == set()
+    assert '8:ULDS' not in index.policies
+    assert 'admin' not in index.policy_of
+    # Удаление отсутствующей записи ничего не меняет
+    index.update('nobody', None)
+    assert index.with_policy('0:-') == {'anna', 'boris'}
+
+
+def test_update_matches_rebuild(users):
+    index = UserIndex.build(users)
+    users['boris'] = dict(users['boris'], admin=True, password='hash')
+    users['vera'] = new_user_record()
+    index.update('boris', users['boris'])
+    index.update('vera', users['vera'])
+    rebuilt = UserIndex.build(users)
+    assert index.attributes == rebuilt.attributes
+    assert index.policies == rebuilt.policies
+    assert index.policy_of == rebuilt.policy_of
+
+
+def test_save_and_load(users, tmp_path):
+    path = str(tmp_path / 'users.json.idx')
+    UserIndex.build(users).save(path, [1, 2, 3])
+    assert os.listdir(tmp_path) == ['users.json.idx']
+    loaded = UserIndex.load(path, [1, 2, 3])
+    assert loaded.attributes == UserIndex.build(users).attributes
+    assert loaded.policy_of == UserIndex.build(users).policy_of
+    # Индекс другой версии хранилища не используется
+    assert UserIndex.load(path, [1, 2, 4]) is None
+    assert UserIndex.load(path, None) is None
+    assert UserIndex.load(str(tmp_path / 'missing.idx'), [1, 2, 3]) is None
+
+
+@pytest.fixture
+def store(tmp_path, users):
+    path = str(tmp_path / 'users.json')
+    save_users(users, path)
+    return path
+
+
+def test_service_keeps_index_in_sync(store):
+    service = AuthService(store)
+    assert service.find_users('no_password') == ['boris']
+    service.set_blocked('boris', True)
+    service.add_user('vera')
+    assert service.find_users('blocked') == ['boris']
+    assert service.find_users('no_password') == ['boris', 'vera']
+    service.commit()
+    # После записи индекс сохранен по новой версии файла
+    assert UserIndex.load(service.index_path, file_key(store)).find('blocked') == {'boris'}
+
+
+def test_commit_survives_unwritable_index(store, tmp_path):
+    service = AuthService(store)
+    service.find_users('admin')
+    service.index_path = str(tmp_path / 'missing' / 'users.json.idx')
+    service.set_admin('anna')
+    assert service.commit() == {}
+    assert not service.dirty
+    assert AuthService(store).find_users('admin') == ['admin', 'anna']
@@ -0,0 +1,100 @@
+"""Сериализаторы хранилища: побайтное совпадение с json и чтение записанного"""
+
+import io
+import json
+
+import pytest
+
+import auth_serializer
+import auth_storage
+from auth_service import STRICT_RULES, new_user_record
+
+AVAILABLE = [name for name, serializer in auth_serializer.SERIALIZERS.items() if serializer.available]
+
+
+@pytest.fixture
+def users():
+    users = {
+        'admin': new_user_record(admin=True, rules=STRICT_RULES, password='a' * 64),
+        'иван': new_user_record(password='b' * 64),
+        'petr "quoted" / slash': new_user_record(),
+        'tab\tand\\backslash': new_user_record(),
+        'emoji \U0001f600': new_user_record()
+    }
+    users['иван']['blocked'] = True
+    users['иван']['version'] = 7
+    return users
+
+
+@pytest.fixture
+def default_serializer():
+    # set_default меняет сериализатор процесса - возвращаем прежний
+    previous = auth_serializer._current
+    yield auth_serializer.set_default
+    auth_serializer._current = previous
+
+
+def dumped(serializer, users):
+    file = io.BytesIO()
+    serializer.dump(users, file)
+    return file.getvalue()
+
+
+def streamed(serializer, users):
+    file = io.BytesIO()
+    serializer.dump_records(users.items(), file)
+    return file.getvalue()
+
+
+def test_pretty_matches_previous_format(users, tmp_path):
+    # Прежний save_users: json.dump(users, file, indent=4) в текстовый файл
+    previous = tmp_path / 'users.json'
+    with open(previous, 'w') as file:
+        json.dump(users, file, indent=4)
+    assert dumped(auth_serializer.create('pretty'), users) == previous.read_bytes()
+
+
+def test_compact_matches_stdlib_json(users):
+    expected = json.dumps(users, separators=(',', ':')).encode()
+    assert dumped(auth_serializer.create('compact'), users) == expected
+
+
+@pytest.mark.parametrize('name', AVAILABLE)
+def test_stream_matches_whole_store(name, users):
+    serializer = auth_serializer.create(name)
+    assert streamed(serializer, users) == dumped(serializer, users)
+
+
+@pytest.mark.parametrize('name', AVAILABLE)
+def test_empty_store(name):
+    serializer = auth_serializer.create(name)
+    assert streamed(serializer, {}) == dumped(serializer, {})
+    assert serializer.loads(dumped(serializer, {})) == {}
+
+
+@pytest.mark.parametrize('name', AVAILABLE)
+def test_round_trip(name, users):
+    serializer = auth_serializer.create(name)
+    assert serializer.loads(dumped(serializer, users)) == users
+    # Любой вариант читается обычным json: сериализатор можно сменить на работающей установке
+    assert json.loads(dumped(serializer, users)) == users
+
+
+def test_unavailable_library_falls_back_to_compact(monkeypatch):
+    monkeypatch.setattr(auth_serializer.UjsonSerializer, 'available', False)
+    assert isinstance(auth_serializer.create('ujson'), auth_serializer.CompactSerializer)
+    with pytest.raises(ValueError):
+        auth_serializer.create('yaml')
+
+
+@pytest.mark.parametrize('name', AVAILABLE)
+@pytest.mark.parametrize('extension', auth_storage.COMPRESSED_EXTENSIONS + ('.json',))
+def test_storage_write_stream_matches_write(name, extension, users, tmp_path, default_serializer):
+    default_serializer(name)
+    whole, stream = tmp_path / ('whole' + extension), tmp_path / ('stream' + extension)
+    auth_storage.write(users, str(whole))
+    auth_storage.write_stream(users.items(), str(stream))
+    assert auth_storage.read(str(whole)) == users
+    assert dict(auth_storage.iter_users(str(stream))) == users
+    if extension == '.json':
+        assert whole.read_bytes() == stream.read_bytes()
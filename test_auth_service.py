@@ -0,0 +1,158 @@
+"""AuthService: совместная запись хранилища несколькими экземплярами и испорченные записи"""
+
+import pytest
+
+from auth_service import AuthService, merge_record, new_user_record, read_users, save_users
+
+
+@pytest.fixture
+def store(tmp_path):
+    path = str(tmp_path / 'users.json')
+    save_users({'admin': new_user_record(admin=True), 'user': new_user_record()}, path)
+    return path
+
+
+def opened(path):
+    service = AuthService(path)
+    service.load()
+    return service
+
+
+def test_merge_record_takes_changes_of_both_sides():
+    base = new_user_record()
+    ours = dict(base, blocked=True)
+    theirs = dict(base, admin=True, version=1)
+    merged, conflicts = merge_record(base, ours, theirs)
+    assert merged == dict(base, blocked=True, admin=True, version=1)
+    assert conflicts == []
+
+
+def test_merge_record_keeps_ours_on_conflict():
+    base = new_user_record()
+    ours = dict(base, password='ours')
+    theirs = dict(base, password='theirs', version=1)
+    merged, conflicts = merge_record(base, ours, theirs)
+    assert merged['password'] == 'ours'
+    assert conflicts == ['password']
+
+
+def test_merge_record_same_change_is_not_conflict():
+    base = new_user_record()
+    merged, conflicts = merge_record(base, dict(base, blocked=True), dict(base, blocked=True, version=1))
+    assert merged['blocked'] is True
+    assert conflicts == []
+
+
+def test_merge_record_new_record_on_both_sides():
+    # Запись создали оба экземпляра: базы нет
+    ours = new_user_record(password='ours')
+    theirs = new_user_record(password='theirs')
+    merged, conflicts = merge_record(None, ours, theirs)
+    assert merged['password'] == 'ours'
+    assert conflicts == ['password']
+
+
+def test_commit_without_concurrent_writer(store):
+    service = opened(store)
+    service.set_blocked('user', True)
+    assert service.commit() == {}
+    user = read_users(store)['user']
+    assert user['blocked'] is True
+    assert user['version'] == 1
+
+
+def test_commit_merges_fields_changed_by_other_instance(store):
+    first, second = opened(store), opened(store)
+    first.set_blocked('user', True)
+    second.set_admin('user')
+    assert first.commit() == {}
+    assert second.commit() == {}
+    user = read_users(store)['user']
+    assert user['blocked'] is True and user['admin'] is True
+    assert user['version'] == 2
+    assert second.users['user'] == user
+
+
+def test_commit_reports_conflicts_and_keeps_ours(store):
+    first, second = opened(store), opened(store)
+    first.set_rules('user', {'min_length': 3})
+    second.set_rules('user', {'min_length': 8})
+    first.commit()
+    assert second.commit() == {'user': ['password_rules']}
+    assert read_users(store)['user']['password_rules']['min_length'] == 8
+
+
+def test_commit_keeps_records_of_other_instance(store):
+    first, second = opened(store), opened(store)
+    first.add_user('new')
+    second.set_blocked('user', True)
+    first.commit()
+    second.commit()
+    users = read_users(store)
+    assert set(users) == {'admin', 'user', 'new'}
+    assert users['user']['blocked'] is True
+    # Запись, которую второй экземпляр не трогал, видна ему после слияния
+    assert second.has_user('new')
+
+
+def test_untouched_record_is_replaced_without_merge(store):
+    first, second = opened(store), opened(store)
+    first.set_blocked('admin', True)
+    second.set_blocked('user', True)
+    first.commit()
+    second.commit()
+    users = read_users(store)
+    assert users['admin']['blocked'] is True and users['admin']['version'] == 1
+    assert users['user']['blocked'] is True and users['user']['version'] == 1
+
+
+@pytest.fixture
+def record_store(tmp_path):
+    path = str(tmp_path / 'users.rec')
+    save_users({f'user{number}': new_user_record() for number in range(5)}, path)
+    return path
+
+
+def damage_record(path, username):
+    """Испортить контрольную сумму строки записи; имя в строке остается читаемым"""
+    with open(path, 'rb') as file:
+        lines = file.readlines()
+    for number, line in enumerate(lines):
+        if b' ["%s"' % username.encode() in line:
+            lines[number] = b'0' * 8 + line[8:]
+    with open(path, 'wb') as file:
+        file.writelines(lines)
+
+
+def test_refresh_keeps_record_with_damaged_line(record_store):
+    service = opened(record_store)
+    other = opened(record_store)
+    other.set_blocked('user1', True)
+    other.commit()
+    damage_record(record_store, 'user2')
+
+    added, changed, removed = service.refresh()
+    assert (added, changed, removed) == ([], ['user1'], [])
+    assert service.users['user1']['blocked'] is True
+    assert 'user2' in service.users
+    assert len(service.corrupt_records) == 1
+
+    # При следующей записи строка уходит в карантин, а запись - обратно в файл
+    service.set_admin('user3')
+    service.commit()
+    assert set(read_users(record_store)) == {f'user{number}' for number in range(5)}
+    with open(record_store + '.quarantine', 'rb') as file:
+        assert b'["user2"' in file.read()
+
+
+def test_load_skips_damaged_record_and_quarantines_it(record_store):
+    damage_record(record_store, 'user4')
+    service = opened(record_store)
+    assert 'user4' not in service.users
+    assert len(service.corrupt_records) == 1
+    service.set_blocked('user0', True)
+    service.commit()
+    assert service.corrupt_records == []
+    assert 'user4' not in read_users(record_store)
+    with open(record_store + '.quarantine', 'rb') as file:
+        assert b'["user4"' in file.read()
@@ -0,0 +1,120 @@
+"""Формат .rec: контрольные суммы строк, индекс частей и карантин испорченных записей"""
+
+import pytest
+
+import auth_storage
+from auth_service import new_user_record
+
+
+@pytest.fixture
+def users():
+    return {f'user{number}': new_user_record(password=str(number)) for number in range(10)}
+
+
+@pytest.fixture
+def store(tmp_path, users):
+    path = str(tmp_path / 'users.rec')
+    auth_storage.write(users, path)
+    return path
+
+
+def damage(path, username):
+    """Испортить конец строки записи, не трогая имя; возвращает испорченную строку"""
+    with open(path, 'rb') as file:
+        data = file.read()
+    start = data.index(b' ["%s"' % username.encode())
+    start = data.rindex(b'\n', 0, start) + 1
+    end = data.index(b'\n', start) + 1
+    line = data[start:end - 3] + b'X' + data[end - 2:end]
+    with open(path, 'wb') as file:
+        file.write(data[:start] + line + data[end:])
+    return line
+
+
+def test_encode_record_checks(users):
+    line = auth_storage.encode_record('иван', users['user1'])
+    assert line.endswith(b'\n')
+    assert auth_storage.check_line(line) == line[9:-1]
+    assert auth_storage._decode(line) == ('иван', users['user1'])
+
+
+@pytest.mark.parametrize('line', [
+    b'',
+    b'0000 ["a"]\n',
+    b'zzzzzzzz ["a",{}]\n',
+    b'00000000 ["a",{}]\n',
+])
+def test_check_line_rejects_damaged(line):
+    assert auth_storage.check_line(line) is None
+
+
+def test_check_line_rejects_changed_payload(users):
+    line = auth_storage.encode_record('user1', users['user1'])
+    assert auth_storage.check_line(line.replace(b'"1"', b'"2"')) is None
+    # Без перевода строки запись считается оборванной
+    assert auth_storage.check_line(line[:-1]) is None
+
+
+def test_write_and_read_round_trip(store, users):
+    assert auth_storage.read(store) == users
+    assert auth_storage.verify(store) == {'records': len(users), 'corrupt': [], 'indexed': True}
+    assert auth_storage.read_index(store)['records'] == len(users)
+
+
+def test_iter_records_reports_corrupt_lines(store, users):
+    line = damage(store, 'user3')
+    corrupt = []
+    records = dict(auth_storage.iter_records(store, lambda *item: corrupt.append(item)))
+    assert set(records) == set(users) - {'user3'}
+    [(number, offset, bad)] = corrupt
+    assert number == 4
+    assert bad == line
+    with open(store, 'rb') as file:
+        file.seek(offset)
+        assert file.readline() == line
+    assert auth_storage.corrupt_record_name(bad) == 'user3'
+    assert auth_storage.verify(store)['corrupt'] == [(offset, 'crc')]
+
+
+def test_corrupt_record_name_without_name():
+    assert auth_storage.corrupt_record_name(b'garbage\n') is None
+    assert auth_storage.corrupt_record_name(b'00000000 ["unterminated\n') is None
+
+
+def test_verify_range_counts_chunk(store, users):
+    [(start, count)] = auth_storage.read_index(store)['chunks']
+    assert count == len(users)
+    checked, bad = auth_storage.verify_range(store, start, 1 << 30, count)
+    assert (checked, bad) == (len(users), [])
+    checked, bad = auth_storage.verify_range(store, start, 1 << 30, count + 1)
+    assert bad and bad[0][0] == start
+
+
+def test_damaged_index_is_ignored(store, users):
+    with open(store, 'r+b') as file:
+        file.seek(-5, 2)
+        file.write(b'0000\n')
+    assert auth_storage.read_index(store) is None
+    assert auth_storage.read(store) == users
+    assert auth_storage.verify(store)['indexed'] is False
+
+
+def test_quarantine_appends_lines(tmp_path):
+    path = str(tmp_path / 'users.rec')
+    auth_storage.quarantine(path, [])
+    assert not (tmp_path / 'users.rec.quarantine').exists()
+    auth_storage.quarantine(path, [(1, 10, b'first\n'), (2, 20, b'second')])
+    auth_storage.quarantine(path, [(5, 50, b'third\n')])
+    lines = (tmp_path / 'users.rec.quarantine').read_bytes().splitlines()
+    assert lines[1::2] == [b'first', b'second', b'third']
+    assert lines[0].endswith(b'users.rec: record 1, offset 10')
+    assert lines[4].endswith(b'record 5, offset 50')
+
+
+def test_repair_moves_damaged_record_to_quarantine(store, users, tmp_path):
+    line = damage(store, 'user7')
+    assert auth_storage.repair(store) == 1
+    del users['user7']
+    assert auth_storage.read(store) == users
+    assert auth_storage.verify(store)['corrupt'] == []
+    assert line in (tmp_path / 'users.rec.quarantine').read_bytes()